@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Пропускная способность чтения в зависимости от числа процессов-читателей
+(с параллельным писателем и без него) на одном каталоге базы.
+
+    poetry run python benchmarks/concurrency.py --rows 50000 --readers 1 2 4 8
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import primitive_db
+
+
+def _prepare(root, rows, storage):
+    with primitive_db.connect(root) as con:
+        con.execute("create table items name:str qty:int active:bool")
+        con.executemany(
+            "insert into items values (?, ?, ?)",
+            ((f"item{i}", i % 1000, i % 3 == 0) for i in range(rows)),
+        )
+        con.execute("create index items qty")
+        # полная запись таблицы сворачивает журнал
+        con.execute(f"convert items {storage}")
+
+
+def _reader(root, seconds, counter, start):
+    con = primitive_db.connect(root)
+    query = con.prepare("select name, qty from items where qty = ? limit 20")
+    start.wait()
+    done = 0
+    deadline = time.monotonic() + seconds
+    i = 0
+    while time.monotonic() < deadline:
+        con.execute(query, (i % 1000,)).fetchall()
+        done += 1
+        i += 7
+    con.close()
+    with counter.get_lock():
+        counter.value += done
+
+
+def _writer(root, seconds, counter, start):
+    con = primitive_db.connect(root)
+    start.wait()
+    done = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        con.execute("update items set active = ? where ID = ?", (done % 2 == 0, done % 1000 + 1))
+        done += 1
+    con.close()
+    with counter.get_lock():
+        counter.value += done
+
+
+def run(root, readers, seconds, with_writer):
+    reads = multiprocessing.Value("q", 0)
+    writes = multiprocessing.Value("q", 0)
+    start = multiprocessing.Barrier(readers + (1 if with_writer else 0))
+    procs = [multiprocessing.Process(target=_reader, args=(root, seconds, reads, start)) for _ in range(readers)]
+    if with_writer:
+        procs.append(multiprocessing.Process(target=_writer, args=(root, seconds, writes, start)))
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+    return reads.value / seconds, writes.value / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--readers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--storage", choices=("json", "columnar"), default="json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        _prepare(root, args.rows, args.storage)
+        print(f"строк: {args.rows}, формат: {args.storage}, ядер: {os.cpu_count()}")
+        print(f"{'читателей':>9} {'писатель':>9} {'чтений/с':>10} {'на читателя':>12} {'записей/с':>10}")
+        for with_writer in (False, True):
+            for readers in args.readers:
+                rps, wps = run(root, readers, args.seconds, with_writer)
+                print(f"{readers:>9} {'да' if with_writer else 'нет':>9} {rps:>10.0f} {rps / readers:>12.0f} {wps:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Замеры горячих путей CRUD на синтетических таблицах разного размера:
+вставка, точечная выборка, выборка по условию, обновление, удаление,
+загрузка таблицы в холодный кэш и чтение метаданных. Для каждой операции —
+операций/с, задержки p50/p99 и пиковая память (tracemalloc). Результат
+пишется в JSON и сравнивается с сохранённой базовой линией.
+
+    poetry run python benchmarks/crud.py --sizes 10000 100000 --out results.json   # без 1M — быстрее
+    poetry run python benchmarks/crud.py --save-baseline benchmarks/baseline.json
+    poetry run python benchmarks/crud.py --baseline benchmarks/baseline.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import primitive_db
+from primitive_db import core
+from primitive_db.durability import LEVELS, set_level
+from primitive_db.utils import load_metadata, meta_path
+
+SEED = 20240501
+BATCH = 10000
+
+
+def _populate(con, rows, rng):
+    con.execute("create table items name:str qty:int active:bool")
+    insert = con.prepare("insert into items values (?, ?, ?)")
+    for start in range(0, rows, BATCH):
+        con.executemany(
+            insert,
+            ((f"item{i}", rng.randrange(1000), rng.random() < 0.3) for i in range(start, min(rows, start + BATCH))),
+        )
+    # основной файл без длинного журнала — как у таблицы после работы
+    con.execute("compact items")
+
+
+def _operations(con, rows, rng):
+    """Имя операции -> (функция одного выполнения, число повторений)."""
+    point = con.prepare("select from items where ID = ?")
+    filtered = con.prepare("select name, qty from items where qty = ? and active = true")
+    insert = con.prepare("insert into items values (?, ?, ?)")
+    update = con.prepare("update items set qty = ? where ID = ?")
+    delete = con.prepare("delete from items where ID = ?")
+    # полные проходы по таблице дороже точечных операций: меньше повторений на больших таблицах
+    scans = max(5, min(200, 2_000_000 // rows))
+    ids = iter(rng.sample(range(1, rows + 1), rows))
+
+    def cold_load():
+        core._table_cache.clear()
+        con.execute(point, (1,)).fetchall()
+
+    return {
+        "insert": (lambda: con.execute(insert, ("new", rng.randrange(1000), True)), 2000),
+        "point_select": (lambda: con.execute(point, (rng.randint(1, rows),)).fetchall(), 5000),
+        "filtered_select": (lambda: con.execute(filtered, (rng.randrange(1000),)).fetchall(), scans),
+        "update": (lambda: con.execute(update, (rng.randrange(1000), rng.randint(1, rows))), 2000),
+        "delete": (lambda: con.execute(delete, (next(ids),)), min(2000, rows // 2)),
+        "table_load": (cold_load, max(3, scans // 10)),
+        "metadata_load": (lambda: load_metadata(meta_path()), 2000),
+    }
+
+
+def _measure(fn, repeat, seconds):
+    """Задержки выполнений (не дольше seconds на операцию) и пиковая память одного прогона."""
+    fn()  # прогрев: кэш таблицы, кэш операторов
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        t1 = time.perf_counter()
+        latencies.append(t1 - t0)
+        if t1 > deadline:
+            break
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "ops": len(latencies),
+        "ops_per_sec": len(latencies) / total if total else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "peak_kb": peak / 1024,
+    }
+
+
+def _percentile(values, pct):
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+def run_size(rows, seconds, only):
+    rng = random.Random(SEED + rows)
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        con = primitive_db.connect(root)
+        try:
+            t0 = time.perf_counter()
+            _populate(con, rows, rng)
+            results["populate"] = {"seconds": time.perf_counter() - t0}
+            for name, (fn, repeat) in _operations(con, rows, rng).items():
+                if only and name not in only:
+                    continue
+                results[name] = _measure(fn, repeat, seconds)
+        finally:
+            con.close()
+    return results
+
+
+def compare(current, baseline, tolerance):
+    """Регрессии: p50 выросла или операций/с стало меньше больше чем на tolerance."""
+    regressions = []
+    for size, ops in current["results"].items():
+        for name, stats in ops.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if base is None or "p50_ms" not in stats:
+                continue
+            ratio = stats["p50_ms"] / base["p50_ms"] if base["p50_ms"] else 1.0
+            stats["p50_vs_baseline"] = ratio
+            if ratio > 1 + tolerance:
+                regressions.append(f"{size} {name}: p50 {base['p50_ms']:.3f} -> {stats['p50_ms']:.3f} мс (x{ratio:.2f})")
+            throughput = stats["ops_per_sec"] / base["ops_per_sec"] if base.get("ops_per_sec") else 1.0
+            stats["ops_vs_baseline"] = throughput
+            if throughput < 1 - tolerance:
+                regressions.append(
+                    f"{size} {name}: оп/с {base['ops_per_sec']:.0f} -> {stats['ops_per_sec']:.0f} (x{throughput:.2f})"
+                )
+    return regressions
+
+
+def _print(results):
+    print(f"{'строк':>9} {'операция':<16} {'оп/с':>10} {'p50, мс':>9} {'p99, мс':>9} {'пик, КБ':>9} {'к базе':>7}")
+    for size, ops in results.items():
+        for name, stats in ops.items():
+            if "p50_ms" not in stats:
+                continue
+            ratio = stats.get("p50_vs_baseline")
+            print(
+                f"{size:>9} {name:<16} {stats['ops_per_sec']:>10.0f} {stats['p50_ms']:>9.3f} "
+                f"{stats['p99_ms']:>9.3f} {stats['peak_kb']:>9.0f} {f'x{ratio:.2f}' if ratio else '':>7}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="размеры таблиц")
+    parser.add_argument("--ops", nargs="+", help="только эти операции")
+    parser.add_argument("--seconds", type=float, default=5.0, help="предел времени на одну операцию")
+    parser.add_argument("--durability", choices=LEVELS, default="flush")
+    parser.add_argument("--out", help="записать результат в JSON")
+    parser.add_argument("--baseline", help="сравнить с базовой линией (JSON прошлого запуска)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение p50 и оп/с (доля)")
+    parser.add_argument("--save-baseline", help="сохранить результат как базовую линию")
+    args = parser.parse_args()
+
+    set_level(args.durability)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "durability": args.durability,
+        "results": {},
+    }
+    for rows in args.sizes:
+        report["results"][str(rows)] = run_size(rows, args.seconds, args.ops)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+    _print(report["results"])
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    if regressions:
+        print("\nРегрессии относительно базовой линии:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
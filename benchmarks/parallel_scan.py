@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Ускорение полного прохода по таблице в памяти в зависимости от числа процессов
+(parallel.set_workers): выборка по условию без индекса, агрегаты с GROUP BY
+и удаление по условию. Печатается время и ускорение относительно одного процесса;
+«первый» — первый прогон, включая запуск пула процессов (следующие прогоны по той же
+таблице переиспользуют пул).
+
+    poetry run python benchmarks/parallel_scan.py --rows 1000000 --workers 1 2 4 8 16 32
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import primitive_db
+from primitive_db import parallel
+
+QUERIES = {
+    "filter": "select name, qty from items where qty < 5 and name like 'item1%'",
+    "group_by": "select grp, count(*), sum(qty), min(qty), max(qty), avg(qty) from items where active = true group by grp",
+    "count_where": "select count(*) from items where qty >= 500 and active = false",
+}
+
+
+def _prepare(con, rows):
+    rng = random.Random(7)
+    con.execute("create table items name:str grp:str qty:int active:bool")
+    insert = con.prepare("insert into items values (?, ?, ?, ?)")
+    for start in range(0, rows, 50000):
+        con.executemany(insert, (
+            (f"item{i}", f"g{i % 100}", rng.randrange(1000), rng.random() < 0.5)
+            for i in range(start, min(rows, start + 50000))
+        ))
+    # таблица загружена в кэш: замеряется проход, а не чтение файла
+    con.execute("select count(*) from items where qty < 0").fetchall()
+
+
+def _timings(con, sql, repeat):
+    """(время первого прогона, лучшее время следующих)."""
+    times = []
+    for _ in range(repeat + 1):
+        t0 = time.perf_counter()
+        con.execute(sql).fetchall()
+        times.append(time.perf_counter() - t0)
+    return times[0], min(times[1:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        con = primitive_db.connect(root)
+        _prepare(con, args.rows)
+        print(f"строк: {args.rows}, ядер: {os.cpu_count()}")
+        print(f"{'запрос':<12} {'процессов':>9} {'первый, мс':>11} {'время, мс':>10} {'ускорение':>10}")
+        for name, sql in QUERIES.items():
+            serial = None
+            for workers in args.workers:
+                # порог 0: параллельно при любом числе процессов больше одного
+                parallel.set_workers(workers, min_rows=0)
+                first, elapsed = _timings(con, sql, args.repeat)
+                serial = serial or elapsed
+                print(f"{name:<12} {workers:>9} {first * 1000:>11.1f} {elapsed * 1000:>10.1f} {serial / elapsed:>9.2f}x")
+        # удаление: у каждого прогона своё значение qty, чтобы строки действительно удалялись
+        for workers in args.workers:
+            parallel.set_workers(workers, min_rows=0)
+            t0 = time.perf_counter()
+            deleted = con.execute("delete from items where qty = ?", (workers,)).rowcount
+            print(f"{'delete':<12} {workers:>9} {(time.perf_counter() - t0) * 1000:>11.1f} {'':>10} {'':>10} ({deleted} строк)")
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
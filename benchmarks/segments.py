@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Секции таблицы против одного файла: время сворачивания журнала после точечного
+обновления (переписывается одна секция, а не вся таблица), число записанных байт
+и холодная выборка по столбцу секционирования (читаются только нужные секции).
+
+    poetry run python benchmarks/segments.py --rows 1000000 --segment-rows 100000
+"""
+import argparse
+import random
+import tempfile
+import time
+
+import primitive_db
+from primitive_db import core, metrics
+
+LAYOUTS = {
+    "один файл": "",
+    "по ID": "partition by ID {segment_rows}",
+    "по region": "partition by region 16",
+}
+
+
+def _prepare(con, rows, clause):
+    rng = random.Random(11)
+    con.execute(f"create table items name:str region:str qty:int {clause}")
+    insert = con.prepare("insert into items values (?, ?, ?)")
+    for start in range(0, rows, 50000):
+        con.executemany(insert, (
+            (f"item{i}", f"r{rng.randrange(64)}", rng.randrange(1000)) for i in range(start, min(rows, start + 50000))
+        ))
+    con.execute("compact items")
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000
+
+
+def _compact(con):
+    """Сворачивание журнала: (мс, записано байт по счётчику метрик)."""
+    metrics.reset()
+    elapsed = _timed(lambda: con.execute("compact items"))
+    return elapsed, metrics.snapshot()["counters"]["bytes_written"]
+
+
+def run(rows, segment_rows, repeat):
+    metrics.set_enabled(True)
+    print(f"строк: {rows}")
+    print(f"{'раскладка':<10} {'сворачивание, мс':>17} {'записано, КБ':>13} {'ID =, мс':>9} {'region =, мс':>13}")
+    for name, clause in LAYOUTS.items():
+        with tempfile.TemporaryDirectory() as root:
+            con = primitive_db.connect(root)
+            _prepare(con, rows, clause.format(segment_rows=segment_rows))
+            compactions, point, by_region = [], [], []
+            for _ in range(repeat):
+                con.execute("update items set qty = ? where ID = ?", (-1, random.randint(1, rows)))
+                compactions.append(_compact(con))
+                core._table_cache.clear()
+                point.append(_timed(lambda: con.execute("select from items where ID = ?", (rows // 2,)).fetchall()))
+                core._table_cache.clear()
+                by_region.append(_timed(lambda: con.execute("select from items where region = 'r7'").fetchall()))
+            con.close()
+            elapsed, written = min(compactions)
+            print(f"{name:<10} {elapsed:>17.1f} {written / 1024:>13.0f} {min(point):>9.1f} {min(by_region):>13.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--segment-rows", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.rows, args.segment_rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Нагрузка на сервер (database serve) по localhost: клиенты-процессы выполняют
+смесь точечных чтений, выборок по условию и обновлений; печатаются запросы/с
+и задержки p50/p99 в зависимости от числа клиентов. Второй сценарий — задержки
+точечных чтений без долгой выборки и пока другой клиент непрерывно сканирует
+всю таблицу (--scan-rows строк).
+
+    poetry run python benchmarks/server_load.py --rows 50000 --clients 1 4 16 --writes 0.1
+    poetry run python benchmarks/server_load.py --scan-rows 500000 --clients 4
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from primitive_db.client import Client
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(root, port):
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "primitive_db.main", "serve", "--root", root, "--port", str(port)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    # сервер печатает строку, когда начал принимать соединения
+    proc.stdout.readline()
+    return proc
+
+
+def _prepare(port, rows, table="items"):
+    with Client(port=port) as client:
+        client.execute(f"create table {table} name:str qty:int active:bool")
+        batch = 1000
+        for start in range(0, rows, batch):
+            count = min(batch, rows - start)
+            values = ", ".join("(?, ?, ?)" for _ in range(count))
+            params = [v for i in range(start, start + count) for v in (f"item{i}", i % 1000, i % 3 == 0)]
+            client.execute(f"insert into {table} values {values}", params)
+        client.execute(f"create index {table} qty")
+
+
+def _client(port, rows, seconds, writes, start, results):
+    rng = random.Random(os.getpid())
+    latencies = []
+    with Client(port=port) as client:
+        start.wait()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            roll = rng.random()
+            t0 = time.perf_counter()
+            if roll < writes:
+                client.execute("update items set active = ? where ID = ?", (roll < writes / 2, rng.randint(1, rows)))
+            elif roll < 0.7:
+                client.execute("select from items where ID = ?", (rng.randint(1, rows),))
+            else:
+                client.execute("select name, qty from items where qty = ? limit 20", (rng.randrange(1000),))
+            latencies.append(time.perf_counter() - t0)
+    results.put(latencies)
+
+
+def _point_reads(port, rows, seconds, start, results):
+    rng = random.Random(os.getpid())
+    latencies = []
+    with Client(port=port) as client:
+        start.wait()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            t0 = time.perf_counter()
+            client.execute("select from items where ID = ?", (rng.randint(1, rows),))
+            latencies.append(time.perf_counter() - t0)
+    results.put(latencies)
+
+
+def _scanner(port, start, stop, results):
+    # count(*) с условием по столбцу без индекса — полный проход за один запрос
+    scans, longest = 0, 0.0
+    with Client(port=port) as client:
+        start.wait()
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            client.execute("select count(*) from events where name != ?", ("",))
+            longest = max(longest, time.perf_counter() - t0)
+            scans += 1
+    results.put((scans, longest))
+
+
+def run(port, rows, clients, seconds, writes):
+    start = multiprocessing.Barrier(clients)
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=_client, args=(port, rows, seconds, writes, start, results))
+        for _ in range(clients)
+    ]
+    for proc in procs:
+        proc.start()
+    latencies = sorted(value for _ in procs for value in results.get())
+    for proc in procs:
+        proc.join()
+    return len(latencies) / seconds, latencies
+
+
+def run_with_scan(port, rows, clients, seconds, scan):
+    """Задержки точечных чтений clients клиентов; scan — идёт ли параллельно долгая выборка."""
+    start = multiprocessing.Barrier(clients + scan)
+    stop = multiprocessing.Event()
+    results, scans = multiprocessing.Queue(), multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=_point_reads, args=(port, rows, seconds, start, results))
+        for _ in range(clients)
+    ]
+    if scan:
+        procs.append(multiprocessing.Process(target=_scanner, args=(port, start, stop, scans)))
+    for proc in procs:
+        proc.start()
+    latencies = sorted(value for _ in range(clients) for value in results.get())
+    stop.set()
+    scanned = scans.get() if scan else (0, 0.0)
+    for proc in procs:
+        proc.join()
+    return latencies, scanned
+
+
+def _percentile(values, pct):
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--writes", type=float, default=0.1, help="доля обновлений среди запросов")
+    parser.add_argument("--scan-rows", type=int, default=200000, help="строк в таблице долгой выборки (0 — без сценария)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        port = _free_port()
+        server = _start_server(root, port)
+        try:
+            _prepare(port, args.rows)
+            print(f"строк: {args.rows}, доля записи: {args.writes}, ядер: {os.cpu_count()}")
+            print(f"{'клиентов':>8} {'запросов/с':>11} {'p50, мс':>9} {'p99, мс':>9}")
+            for clients in args.clients:
+                qps, latencies = run(port, args.rows, clients, args.seconds, args.writes)
+                p50, p99 = _percentile(latencies, 50) * 1000, _percentile(latencies, 99) * 1000
+                print(f"{clients:>8} {qps:>11.0f} {p50:>9.2f} {p99:>9.2f}")
+            if args.scan_rows:
+                _prepare(port, args.scan_rows, table="events")
+                clients = max(args.clients)
+                print(f"\nточечные чтения ({clients} клиентов) и полный проход по {args.scan_rows} строкам")
+                print(f"{'выборка':>8} {'p50, мс':>9} {'p99, мс':>9} {'макс, мс':>9} {'проходов':>9} {'проход, мс':>11}")
+                for scan in (False, True):
+                    latencies, (scans, longest) = run_with_scan(port, args.rows, clients, args.seconds, scan)
+                    p50, p99 = _percentile(latencies, 50) * 1000, _percentile(latencies, 99) * 1000
+                    print(f"{'идёт' if scan else 'нет':>8} {p50:>9.2f} {p99:>9.2f} {latencies[-1] * 1000:>9.2f} "
+                          f"{scans:>9} {longest * 1000:>11.0f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
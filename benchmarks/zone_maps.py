@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Пропуск блоков по статистике (min/max, фильтры Блума) при чтении холодной таблицы:
+время выборок по условию без индекса, число пропущенных блоков и время записи
+таблицы со статистикой. Столбец ts растёт вместе с ID (как время событий),
+region меняется сериями, qty случаен — по нему блоки не пропускаются.
+
+    poetry run python benchmarks/zone_maps.py --rows 1000000 --storage columnar
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import primitive_db
+from primitive_db import core, metrics
+
+QUERIES = {
+    "ts_range": "select from events where ts >= ? and ts < ?",
+    "region_eq": "select count(*) from events where region = ?",
+    "name_eq": "select from events where name = ?",
+    "qty_eq": "select count(*) from events where qty = ?",
+}
+
+
+def _prepare(con, rows, storage):
+    rng = random.Random(5)
+    con.execute("create table events name:str region:str ts:int qty:int")
+    insert = con.prepare("insert into events values (?, ?, ?, ?)")
+    for start in range(0, rows, 50000):
+        con.executemany(insert, (
+            (f"ev{i}", f"r{(i // 20000) % 50}", i * 3 + rng.randrange(3), rng.randrange(1000))
+            for i in range(start, min(rows, start + 50000))
+        ))
+    if storage != "json":
+        con.execute(f"convert events {storage}")
+    t0 = time.perf_counter()
+    con.execute("compact events")
+    return time.perf_counter() - t0
+
+
+def _params(name, rows):
+    if name == "ts_range":
+        start = rows  # треть таблицы от начала
+        return (start, start + 3000)
+    if name == "region_eq":
+        return ("r7",)
+    if name == "name_eq":
+        return (f"ev{rows // 2}",)
+    return (500,)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--storage", choices=("json", "columnar"), default="columnar")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    metrics.set_enabled(True)
+    with tempfile.TemporaryDirectory() as root:
+        con = primitive_db.connect(root)
+        write = _prepare(con, args.rows, args.storage)
+        print(f"строк: {args.rows}, формат: {args.storage}, запись таблицы: {write * 1000:.0f} мс, ядер: {os.cpu_count()}")
+        print(f"{'запрос':<10} {'холодная, мс':>13} {'пропущено блоков':>17}")
+        for name, sql in QUERIES.items():
+            best, skipped = None, 0
+            for _ in range(args.repeat):
+                core._table_cache.clear()
+                metrics.reset()
+                t0 = time.perf_counter()
+                con.execute(sql, _params(name, args.rows)).fetchall()
+                elapsed = time.perf_counter() - t0
+                skipped = metrics.snapshot()["counters"]["blocks_skipped"]
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{name:<10} {best * 1000:>13.1f} {skipped:>17}")
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+from .api import connect
+
+__all__ = ["connect"]
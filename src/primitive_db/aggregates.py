@@ -0,0 +1,166 @@
+# Агрегатные функции и GROUP BY: один проход по строкам с хеш-группировкой
+from .predicates import define_function
+
+AGGREGATES = ("count", "sum", "min", "max", "avg")
+# sum/avg считаются только по числовым столбцам
+_NUMERIC = ("int", "bool")
+
+
+
+class _Empty:
+    """Пустой аккумулятор min/max; при передаче между процессами остаётся тем же объектом."""
+
+    def __reduce__(self):
+        return "_EMPTY"
+
+
+_EMPTY = _Empty()
+
+
+def define_step(source):
+    """Функция прохода по тексту source (процессы parallel получают только текст)."""
+    return define_function(source, "_step", {"_EMPTY": _EMPTY}, "<aggregate>")
+
+
+def aggregate_label(func, column):
+    """Имя столбца результата: count(*), sum(age), ..."""
+    return f"{func}({column})"
+
+
+class Aggregation:
+    """
+    Скомпилированная агрегация. run(rows) делает один проход по строкам:
+    группы хранятся в словаре «ключ GROUP BY -> список аккумуляторов»
+    (ячейка 0 — число строк группы, далее по ячейке на sum/avg/min/max).
+    columns — столбцы строк, которые читает агрегация; source — текст функции прохода;
+    ops — способ слияния каждой ячейки частичных аккумуляторов ("sum", "min", "max").
+    """
+
+    __slots__ = ("step", "finish", "group_by", "columns", "source", "ops")
+
+    def __init__(self, step, finish, group_by, columns, source, ops):
+        self.step = step
+        self.finish = finish
+        self.group_by = group_by
+        self.columns = columns
+        self.source = source
+        self.ops = ops
+
+    def run(self, rows):
+        """Возвращает список строк результата {столбец группы | метка агрегата: значение}."""
+        groups = {}
+        self.step(rows, groups)
+        return self.finish_groups(groups)
+
+    def merge(self, groups, partial):
+        """Добавляет к groups частичные аккумуляторы другого прохода (другой части строк)."""
+        for key, acc in partial.items():
+            current = groups.get(key)
+            if current is None:
+                groups[key] = acc
+                continue
+            for slot, op in enumerate(self.ops):
+                value = acc[slot]
+                if op == "sum":
+                    current[slot] += value
+                elif value is not _EMPTY and (
+                    current[slot] is _EMPTY or (value < current[slot] if op == "min" else value > current[slot])
+                ):
+                    current[slot] = value
+
+    def finish_groups(self, groups):
+        """Строки результата по словарю групп «ключ -> аккумуляторы»."""
+        if not groups and not self.group_by:
+            # агрегат без GROUP BY по пустому набору — одна строка (count = 0)
+            groups[()] = None
+        return [self.finish(key, acc) for key, acc in groups.items()]
+
+
+def _check(aggregates, group_by, types):
+    for name in group_by:
+        if name not in types:
+            raise KeyError(f'Столбец "{name}" не существует.')
+    for func, column in aggregates:
+        if func not in AGGREGATES:
+            raise ValueError(f"Неизвестная агрегатная функция: {func}. Доступны: {', '.join(AGGREGATES)}")
+        if column == "*":
+            if func != "count":
+                raise ValueError(f"{func}(*) не поддерживается, укажите столбец.")
+            continue
+        if column not in types:
+            raise KeyError(f'Столбец "{column}" не существует.')
+        if func in ("sum", "avg") and types[column] not in _NUMERIC:
+            raise ValueError(f'{func} применим только к числовым столбцам, а "{column}" — {types[column]}.')
+
+
+def compile_aggregate(aggregates, group_by, types):
+    """
+    Компилирует агрегаты [(функция, столбец | "*")] с группировкой по столбцам group_by
+    для таблицы со столбцами types = {имя: тип} в Aggregation.
+    """
+    _check(aggregates, group_by, types)
+
+    # ячейки аккумуляторов: 0 — счётчик строк, дальше — по одной на агрегат (кроме count)
+    slots = {}
+    init = ["0"]
+    ops = ["sum"]
+    body = []
+    for func, column in aggregates:
+        if func == "count" or (func, column) in slots:
+            continue
+        slot = len(init)
+        slots[(func, column)] = slot
+        col = repr(column)
+        ops.append("sum" if func in ("sum", "avg") else func)
+        if func in ("sum", "avg"):
+            init.append("0")
+            body.append(f"a[{slot}] += r[{col}]")
+        else:
+            cmp = "<" if func == "min" else ">"
+            init.append("_EMPTY")
+            body += [
+                f"v = r[{col}]",
+                f"if a[{slot}] is _EMPTY or v {cmp} a[{slot}]:",
+                f"    a[{slot}] = v",
+            ]
+
+    if not group_by:
+        key = "()"
+    elif len(group_by) == 1:
+        key = f"r[{group_by[0]!r}]"
+    else:
+        key = "(" + ", ".join(f"r[{name!r}]" for name in group_by) + ")"
+    lines = [
+        "def _step(rows, groups):",
+        "    get = groups.get",
+        "    for r in rows:",
+        f"        k = {key}",
+        "        a = get(k)",
+        "        if a is None:",
+        f"            a = groups[k] = [{', '.join(init)}]",
+        "        a[0] += 1",
+    ] + [f"        {line}" for line in body]
+    source = "\n".join(lines) + "\n"
+    step = define_step(source)
+
+    def finish(key, acc):
+        out = {}
+        if len(group_by) == 1:
+            out[group_by[0]] = key
+        else:
+            out.update(zip(group_by, key))
+        count = acc[0] if acc is not None else 0
+        for func, column in aggregates:
+            label = aggregate_label(func, column)
+            if func == "count":
+                out[label] = count
+            elif not count:
+                out[label] = None
+            elif func == "avg":
+                out[label] = acc[slots[(func, column)]] / count
+            else:
+                out[label] = acc[slots[(func, column)]]
+        return out
+
+    columns = set(group_by) | {column for _, column in aggregates if column != "*"}
+    return Aggregation(step, finish, list(group_by), frozenset(columns), source, ops)
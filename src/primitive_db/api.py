@@ -0,0 +1,311 @@
+# Программный интерфейс: соединение и курсоры без REPL, печати и перехвата ошибок
+import inspect
+import os
+import shlex
+from itertools import islice
+
+from . import core, metrics
+from .aggregates import aggregate_label
+from .catalog import Catalog
+from .constants import ID_COL
+from .plans import Statement, prepare
+from .utils import meta_path, recover_data_files, save_table_data
+
+STATEMENT_WORDS = ("select", "insert", "update", "delete", "explain")
+
+
+def _raw(fn):
+    """
+    Функция core без декораторов печати времени, подтверждений и перехвата ошибок;
+    блокировка таблицы при записи сохраняется.
+    """
+    return getattr(fn, "table_locked", None) or inspect.unwrap(fn)
+
+
+_create_table = _raw(core.create_table)
+_create_index = _raw(core.create_index)
+_drop_table = _raw(core.drop_table)
+_compact = _raw(core.compact)
+_convert_storage = _raw(core.convert_storage)
+_insert = _raw(core.insert)
+_insert_many = _raw(core.insert_many)
+_load_file = _raw(core.load_file)
+_iter_select = _raw(core.iter_select)
+_iter_select_join = _raw(core.iter_select_join)
+_update = _raw(core.update)
+_delete = _raw(core.delete)
+_explain = _raw(core.explain)
+
+# открытые соединения: все — к одному корню базы (кэш таблиц общий на процесс);
+# "txn" — соединение, начавшее транзакцию (отложенные изменения core общие на процесс)
+_open = {"root": None, "count": 0, "txn": None}
+
+
+def result_columns(catalog, query):
+    """Столбцы результата SELECT: [(имя, тип)]; у агрегатов и соединений тип пустой."""
+    if query["join"] is not None:
+        tables = (query["table"], query["join"]["table"])
+        names = query["columns"] or [f"{t}.{name}" for t in tables for name in catalog.schema(t)["names"]]
+        return [(name, "") for name in names]
+    types = catalog.schema(query["table"])["types"]
+    # при GROUP BY без списка столбцов — столбцы группы
+    items = query["columns"] or query["group_by"] or list(types)
+    names = [item if isinstance(item, str) else aggregate_label(*item) for item in items]
+    return [(name, types.get(name, "")) for name in names]
+
+
+def _command_args(sql):
+    """DDL-команда в виде списка аргументов: create table/index и drop table -> create_table/..."""
+    args = shlex.split(sql, posix=True)
+    if not args:
+        raise ValueError("Пустая команда.")
+    args[0] = args[0].lower()
+    if len(args) >= 2 and (args[0], args[1].lower()) in (("create", "table"), ("create", "index"), ("drop", "table")):
+        args = [f"{args[0]}_{args[1].lower()}"] + args[2:]
+    return args
+
+
+class Cursor:
+    """
+    Курсор результата. execute() выполняет один оператор, fetchone/fetchmany/fetchall
+    и итерация отдают строки результата SELECT (или explain) кортежами значений
+    в порядке description — [(имя, тип)] по мере чтения таблицы. rowcount — число
+    изменённых записей (для SELECT — -1), lastrowid — ID последней добавленной записи.
+    """
+
+    arraysize = 100
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rowcount = -1
+        self.lastrowid = None
+        self._rows = iter(())
+
+    def _reset(self):
+        self.description = None
+        self.rowcount = -1
+        self._rows = iter(())
+
+    def execute(self, sql, params=()):
+        """sql — текст оператора или plans.Statement; params подставляются вместо ? по порядку."""
+        self.connection._check()
+        self._reset()
+        if isinstance(sql, str):
+            head = sql.split(None, 1)[0].lower() if sql.strip() else ""
+            if head not in STATEMENT_WORDS:
+                if params:
+                    raise ValueError("Параметры поддерживаются только в select/insert/update/delete.")
+                self._command(_command_args(sql))
+                return self
+            sql = prepare(sql)
+        self._run(sql.bind(*params))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        """
+        Выполняет оператор для каждого набора параметров. Для insert все строки
+        проверяются и записываются в журнал одной пачкой.
+        """
+        self.connection._check()
+        self._reset()
+        statement = sql if isinstance(sql, Statement) else prepare(sql)
+        if statement.kind == "insert":
+            values = [row for params in seq_of_params for row in statement.bind(*params)["values"]]
+            if values:
+                self._run({"kind": "insert", "table": statement.template["table"], "values": values})
+            else:
+                self.rowcount = 0
+            return self
+        total = 0
+        for params in seq_of_params:
+            self._run(statement.bind(*params))
+            total += self.rowcount
+        self._reset()
+        self.rowcount = total
+        return self
+
+    def _run(self, query):
+        catalog = self.connection.catalog
+        metadata = catalog.current()
+        kind = query["kind"]
+        metrics.count("statements")
+        if kind == "select":
+            columns = result_columns(catalog, query)
+            if query["join"] is not None:
+                if query["group_by"]:
+                    raise ValueError("GROUP BY по соединению таблиц не поддерживается.")
+                rows = _iter_select_join(
+                    metadata, query["table"], query["join"]["table"], query["join"]["on"], query["where"],
+                    columns=query["columns"], order_by=query["order_by"],
+                    limit=query["limit"], offset=query["offset"],
+                )
+            else:
+                rows = _iter_select(
+                    metadata, query["table"], query["where"], columns=query["columns"],
+                    order_by=query["order_by"], limit=query["limit"], offset=query["offset"],
+                    group_by=query["group_by"],
+                )
+            names = [name for name, _ in columns]
+            self.description = columns
+            # строки читаются по мере выборки; число строк заранее неизвестно
+            self._rows = (tuple(row[name] for name in names) for row in rows)
+        elif kind == "insert":
+            values = query["values"]
+            if len(values) == 1:
+                added = _insert(metadata, query["table"], values[0])[-1:]
+            else:
+                added = _insert_many(metadata, query["table"], values)
+            self.rowcount = len(added)
+            self.lastrowid = added[-1][ID_COL]
+        elif kind == "update":
+            self.rowcount = _update(metadata, query["table"], query["set"], query["where"])
+        elif kind == "delete":
+            self.rowcount = _delete(metadata, query["table"], query["where"])
+        else:
+            lines = _explain(metadata, query["statement"])
+            self.description = [("plan", "str")]
+            self.rowcount = len(lines)
+            self._rows = ((line,) for line in lines)
+
+    def _command(self, args):
+        catalog = self.connection.catalog
+        cmd = args[0]
+        if cmd == "create_table" and len(args) >= 2:
+            table_name = args[1]
+            with catalog.locked(table_name) as metadata:
+                _create_table(metadata, table_name, args[2:])
+                catalog.save()
+                table_meta = metadata["tables"][table_name]
+                save_table_data(table_name, [], table_meta["storage"], table_meta["columns"], table_meta.get("segments"))
+        elif cmd in ("create_index", "drop_table", "convert") and len(args) == (2 if cmd == "drop_table" else 3):
+            with catalog.locked(args[1]) as metadata:
+                try:
+                    if cmd == "create_index":
+                        _create_index(metadata, args[1], args[2])
+                    elif cmd == "convert":
+                        _convert_storage(metadata, args[1], args[2].lower())
+                    else:
+                        _drop_table(metadata, args[1])
+                except Exception:
+                    # операция могла частично изменить метаданные в памяти
+                    catalog.invalidate()
+                    raise
+                catalog.save()
+        elif cmd == "compact" and len(args) == 2:
+            _compact(catalog.current(), args[1])
+        elif cmd == "load" and len(args) == 4 and args[2].lower() == "from":
+            self.rowcount = len(_load_file(catalog.current(), args[1], args[3]))
+        elif cmd in ("begin", "commit", "rollback") and len(args) == 1:
+            getattr(self.connection, cmd)()
+        else:
+            raise ValueError(f"Команда {cmd} не поддерживается программным интерфейсом.")
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size=None):
+        return list(islice(self._rows, size or self.arraysize))
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._rows)
+
+
+class Connection:
+    """
+    Соединение с базой в каталоге root (метаданные и data/). Операторы выполняются
+    без печати; ошибки (KeyError, ValueError, OSError) передаются вызывающему.
+    Изменения пишутся в журналы таблиц сразу; после begin() они копятся в памяти
+    до commit() (одна дозапись журнала на таблицу) или rollback(). Незафиксированная
+    транзакция отменяется при close(). Пока транзакция открыта, другие соединения
+    процесса не выполняют операторы (ValueError): её изменения копятся в общем буфере.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.catalog = Catalog(meta_path())
+        self.closed = False
+
+    def _check(self):
+        if self.closed:
+            raise ValueError("Соединение закрыто.")
+        if _open["txn"] not in (None, self):
+            raise ValueError("Открыта транзакция другого соединения: дождитесь commit() или rollback().")
+
+    def cursor(self):
+        self._check()
+        return Cursor(self)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def prepare(self, sql):
+        """Подготовленный оператор для повторного выполнения с разными параметрами."""
+        return prepare(sql)
+
+    def begin(self):
+        self._check()
+        core.begin_transaction()
+        _open["txn"] = self
+
+    def commit(self):
+        self._check()
+        if _open["txn"] is self:
+            _open["txn"] = None
+            core.commit_transaction()
+        else:
+            core.flush_writes()
+        self.catalog.flush()
+
+    def rollback(self):
+        self._check()
+        if _open["txn"] is not self:
+            raise ValueError("Нет начатой транзакции.")
+        _open["txn"] = None
+        core.rollback_transaction()
+
+    def close(self):
+        if self.closed:
+            return
+        if _open["txn"] is self:
+            self.rollback()
+        # чужую открытую транзакцию не трогаем: её изменения запишет её commit()
+        if _open["txn"] is None:
+            core.flush_writes()
+        self.catalog.flush()
+        self.closed = True
+        _open["count"] -= 1
+        if not _open["count"]:
+            _open["root"] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def connect(path="."):
+    """
+    Открывает базу в каталоге path (создаётся при необходимости). Одновременно
+    открытые соединения процесса должны указывать на один каталог.
+    """
+    root = os.path.abspath(path)
+    if _open["root"] not in (None, root):
+        raise ValueError(f"Уже открыто соединение с базой {_open['root']}.")
+    os.makedirs(root, exist_ok=True)
+    core.set_root(root)
+    if not _open["count"]:
+        recover_data_files(meta_path())
+    _open["root"] = root
+    _open["count"] += 1
+    return Connection(root)
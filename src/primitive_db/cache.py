@@ -0,0 +1,123 @@
+# Общий кэш загруженных таблиц: проверка по отпечатку файлов и вытеснение LRU
+import sys
+import threading
+from collections import OrderedDict
+
+
+def estimate_rows_size(rows):
+    """Грубая оценка памяти под строки таблицы по первой строке."""
+    if not rows:
+        return sys.getsizeof(rows)
+    sample = rows[0]
+    per_row = sys.getsizeof(sample) + sum(sys.getsizeof(v) for v in sample.values())
+    return sys.getsizeof(rows) + per_row * len(rows)
+
+
+class TableCache:
+    """
+    Кэш «имя таблицы -> состояние» с бюджетом памяти.
+
+    Запись хранит отпечаток файлов таблицы (размер и mtime основного файла
+    и журнала), с которым она согласована. Если файлы изменились не через
+    этот кэш, get() вернёт None и таблицу нужно перечитать. Методы
+    захватывают общий замок: кэшем пользуются рабочие потоки сервера.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()
+        self._total = 0
+        # таблицы с незаписанными изменениями не вытесняются
+        self._pinned = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, name, stamp):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry["stamp"] != stamp:
+                if entry is not None:
+                    self.invalidate(name)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            return entry["value"]
+
+    def contains(self, name, stamp):
+        with self._lock:
+            entry = self._entries.get(name)
+            return entry is not None and entry["stamp"] == stamp
+
+    def peek(self, name):
+        """Значение записи без проверки отпечатка и без учёта в статистике."""
+        with self._lock:
+            entry = self._entries.get(name)
+            return None if entry is None else entry["value"]
+
+    def stamp_of(self, name):
+        """Отпечаток файлов, с которым согласована запись (None — таблицы нет в кэше)."""
+        with self._lock:
+            entry = self._entries.get(name)
+            return None if entry is None else entry["stamp"]
+
+    def put(self, name, value, stamp, size):
+        with self._lock:
+            self.invalidate(name)
+            self._entries[name] = {"value": value, "stamp": stamp, "size": size}
+            self._total += size
+            self._evict(keep=name)
+
+    def refresh(self, name, stamp, size=None):
+        """После записи через кэш: запоминает новый отпечаток (и размер)."""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return
+            entry["stamp"] = stamp
+            if size is not None:
+                self._total += size - entry["size"]
+                entry["size"] = size
+                self._evict(keep=name)
+
+    def invalidate(self, name):
+        with self._lock:
+            entry = self._entries.pop(name, None)
+            if entry is not None:
+                self._total -= entry["size"]
+
+    def pin(self, name):
+        with self._lock:
+            self._pinned.add(name)
+
+    def unpin(self, name):
+        with self._lock:
+            self._pinned.discard(name)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pinned.clear()
+            self._total = 0
+
+    def _evict(self, keep):
+        # вызывается под self._lock из put() и refresh()
+        while self._total > self.budget_bytes:
+            oldest = next((name for name in self._entries if name != keep and name not in self._pinned), None)
+            if oldest is None:
+                break
+            self.invalidate(oldest)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tables": len(self._entries),
+                "bytes": self._total,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
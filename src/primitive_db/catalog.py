@@ -0,0 +1,128 @@
+# Каталог метаданных: загружается один раз за сессию, следит за изменениями файла
+import os
+import threading
+from contextlib import ExitStack, contextmanager
+
+from .constants import ID_COL, PLAN_CACHE_SIZE
+from .locks import meta_lock, table_lock
+from .utils import load_metadata, save_metadata
+
+# схемы таблиц по id списка столбцов в метаданных (см. table_schema)
+_schemas = {}
+_schemas_lock = threading.Lock()
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+class Catalog:
+    """
+    Метаданные БД в памяти. current() возвращает словарь метаданных и
+    перечитывает файл, только если его изменили извне; save() записывает
+    файл атомарно. Схемы таблиц (столбцы, имена, типы) считаются один раз
+    на список столбцов (table_schema).
+    Проверка и перечитывание файла идут под замком: каталогом пользуются
+    рабочие потоки сервера.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.metadata = None
+        self.deferred = False
+        self._dirty = False
+        self._stamp = None
+        self._lock = threading.RLock()
+        self.reload()
+
+    def reload(self):
+        with self._lock:
+            self._dirty = False
+            self._stamp = _file_stamp(self.path)
+            self.metadata = load_metadata(self.path)
+
+    def current(self):
+        """Актуальные метаданные: одна проверка stat вместо чтения файла."""
+        with self._lock:
+            if self._dirty:
+                return self.metadata
+            if self.metadata is None or _file_stamp(self.path) != self._stamp:
+                self.reload()
+            return self.metadata
+
+    def invalidate(self):
+        """
+        Сбрасывает состояние в памяти (например, после неудачной DDL-операции).
+        Несохранённые отложенные изменения не сбрасываются.
+        """
+        with self._lock:
+            if not self._dirty:
+                self.metadata = None
+
+    @contextmanager
+    def locked(self, *tables):
+        """
+        Для DDL: исключительные блокировки таблиц, затем метаданных (в этом порядке
+        их берут и операции записи). Внутри метаданные актуальны и не меняются извне.
+        """
+        with ExitStack() as stack:
+            for name in sorted(set(tables)):
+                stack.enter_context(table_lock(name, exclusive=True))
+            stack.enter_context(meta_lock())
+            yield self.current()
+
+    def save(self):
+        """Сохраняет метаданные; в отложенном режиме — только помечает их изменёнными."""
+        if self.deferred:
+            with self._lock:
+                self._dirty = True
+            return
+        # как и в locked(): сначала блокировка метаданных, затем замок каталога
+        with meta_lock(), self._lock:
+            save_metadata(self.path, self.metadata)
+            self._stamp = _file_stamp(self.path)
+            self._dirty = False
+
+    def flush(self):
+        """Записывает отложенные изменения метаданных."""
+        if self._dirty:
+            with meta_lock(), self._lock:
+                save_metadata(self.path, self.metadata)
+                self._stamp = _file_stamp(self.path)
+                self._dirty = False
+
+    def schema(self, table_name):
+        """Схема таблицы из актуальных метаданных (см. table_schema)."""
+        return table_schema(self.current(), table_name)
+
+
+def table_schema(metadata, table_name):
+    """
+    {"columns": [(name, type)], "names": [...], "types": {name: type}, "data_columns": [...]}
+    для таблицы из словаря метаданных. Считается один раз на список столбцов: после
+    создания таблицы он не меняется (метаданные, прочитанные заново, — новые списки).
+    """
+    tables = metadata.get("tables", {})
+    if table_name not in tables:
+        raise KeyError(f'Таблица "{table_name}" не существует.')
+    cols = tables[table_name].get("columns")
+    if not isinstance(cols, list) or not cols:
+        raise ValueError(f'У таблицы "{table_name}" отсутствует корректная схема.')
+    with _schemas_lock:
+        entry = _schemas.get(id(cols))
+        if entry is None or entry[0] is not cols:
+            schema = {
+                "columns": cols,
+                "names": [name for name, _ in cols],
+                "types": dict(cols),
+                "data_columns": [c for c in cols if c[0] != ID_COL],
+            }
+            if len(_schemas) >= PLAN_CACHE_SIZE:
+                _schemas.pop(next(iter(_schemas)))
+            # список хранится вместе со схемой: пока запись в кэше, его id не переиспользуется
+            entry = _schemas[id(cols)] = (cols, schema)
+    return entry[1]
@@ -0,0 +1,125 @@
+# Клиент сервера базы (database serve): протокол JSON-строк, блокирующие сокеты
+import argparse
+import json
+import socket
+import sys
+from itertools import chain
+
+from .constants import SERVER_PORT
+
+
+class Client:
+    """
+    Соединение с сервером: execute() отправляет оператор и возвращает ответ
+    {"columns": [[имя, тип]], "rows": [[...]], "rowcount": n, "lastrowid": id};
+    iter_rows() отдаёт строки SELECT по мере получения порций.
+    Ошибки сервера поднимаются как ValueError.
+    """
+
+    def __init__(self, host="127.0.0.1", port=SERVER_PORT, path=None):
+        if path is not None:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(path)
+        else:
+            self._sock = socket.create_connection((host, port))
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rwb")
+        self._next_id = 0
+
+    def _responses(self, sql, params):
+        self._next_id += 1
+        request = {"id": self._next_id, "sql": sql, "params": list(params)}
+        self._file.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._file.flush()
+        while True:
+            line = self._file.readline()
+            if not line:
+                raise ConnectionError("Сервер закрыл соединение.")
+            response = json.loads(line)
+            if not response["ok"]:
+                raise ValueError(response["error"])
+            yield response
+            if not response.get("more"):
+                return
+
+    def execute(self, sql, params=()):
+        result = {"columns": None, "rows": [], "rowcount": -1, "lastrowid": None}
+        for response in self._responses(sql, params):
+            if "columns" in response:
+                result["columns"] = response["columns"]
+                result["rows"].extend(response["rows"])
+            else:
+                result["rowcount"], result["lastrowid"] = response["rowcount"], response["lastrowid"]
+        return result
+
+    def iter_rows(self, sql, params=()):
+        """Строки результата по порциям; итератор нужно дочитать до следующего запроса."""
+        for response in self._responses(sql, params):
+            yield from response.get("rows", ())
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _print_result(sql, client):
+    """Печатает ответ; строки SELECT выводятся по мере получения порций."""
+    from .engine import _render_select
+    responses = client._responses(sql, ())
+    first = next(responses)
+    if "columns" not in first:
+        if first["rowcount"] < 0:
+            print("Готово.")
+            return
+        last = f", последний ID={first['lastrowid']}" if first["lastrowid"] is not None else ""
+        print(f"Готово: изменено записей {first['rowcount']}{last}.")
+        return
+    columns = first["columns"]
+    names = [name for name, _ in columns]
+    rows = (dict(zip(names, row)) for response in chain([first], responses) for row in response["rows"])
+    _render_select(rows, columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="database client", description="Клиент сервера базы данных")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--socket", help="Unix-сокет вместо TCP")
+    args = parser.parse_args(argv)
+
+    interactive = sys.stdin.isatty()
+    errors = 0
+    try:
+        client = Client(args.host, args.port, args.socket)
+    except OSError as e:
+        print(f"Ошибка: не удалось подключиться к серверу: {e}")
+        return 1
+    with client:
+        while True:
+            try:
+                line = input(">>>Введите команду: ") if interactive else sys.stdin.readline()
+            except (EOFError, KeyboardInterrupt):
+                print()
+                break
+            if not interactive and not line:
+                break
+            line = line.strip()
+            if not line or line.startswith(("#", "--")):
+                continue
+            if line.lower() == "exit":
+                break
+            try:
+                _print_result(line.rstrip(";"), client)
+            except ValueError as e:
+                errors += 1
+                print(f"Ошибка: {e}")
+            except ConnectionError as e:
+                print(f"Ошибка: соединение с сервером потеряно: {e}")
+                return 1
+    return 1 if errors else 0
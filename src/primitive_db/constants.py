@@ -7,6 +7,42 @@ import os
 # --- файлы и директории ---
 META_FILE = "db_meta.json"
 DATA_DIR = "data"
+WAL_SUFFIX = ".wal"
+INDEX_SUFFIX = ".idx"
+TMP_SUFFIX = ".tmp"
+LOCK_SUFFIX = ".lock"
+TXN_SUFFIX = ".txn"  # файл намерения фиксации транзакции рядом с метаданными
+SEGMENT_SUFFIX = ".seg"  # каталог секций таблицы: data/<table>.seg/<номер секции>.json|.col
+BLOOM_SUFFIX = ".bloom"  # фильтры Блума секции рядом с её файлом: data/<table>.seg/<номер>.bloom
+
+# --- надёжность записи: none / flush / fsync / group (см. durability.py) ---
+DURABILITY = os.environ.get(
+    "DB_DURABILITY", "fsync" if os.environ.get("DB_WAL_FSYNC", "0") == "1" else "flush"
+)
+GROUP_COMMIT_MS = int(os.environ.get("DB_GROUP_COMMIT_MS", "10"))  # период группового fsync журналов
+
+# --- формат хранения таблиц: "json" или "columnar" (для новых таблиц) ---
+DEFAULT_STORAGE = os.environ.get("DB_STORAGE", "json")
+
+# --- журнал изменений (WAL) ---
+WAL_COMPACT_BYTES = 4 * 1024 * 1024  # при превышении журнал сворачивается в основной файл
+
+# --- секции (segments.py): строк в секции новой таблицы по диапазонам ID (0 — один файл) ---
+SEGMENT_ROWS = int(os.environ.get("DB_SEGMENT_ROWS", "100000"))
+
+# --- статистика блоков (zonemaps.py): строк в блоке колоночного файла ---
+BLOCK_ROWS = int(os.environ.get("DB_BLOCK_ROWS", "4096"))
+
+# --- хранение строк в памяти ---
+POSITIONAL_DELETE_LIMIT = 64  # до стольких строк удаление идёт по позициям, иначе фильтром
+TABLE_CACHE_BYTES = int(os.environ.get("DB_CACHE_MB", "256")) * 1024 * 1024  # бюджет кэша таблиц
+
+# --- параллельный проход по строкам (parallel.py): процессов (0 — выключен) и порог размера таблицы ---
+PARALLEL_WORKERS = int(os.environ.get("DB_PARALLEL", "0"))
+PARALLEL_MIN_ROWS = int(os.environ.get("DB_PARALLEL_MIN_ROWS", "500000"))
+
+# --- кэш разобранных операторов и скомпилированных условий ---
+PLAN_CACHE_SIZE = int(os.environ.get("DB_PLAN_CACHE", "256"))
 
 # --- типы и поля ---
 ALLOWED_TYPES = {"int", "str", "bool"}
@@ -18,4 +54,9 @@ FALSE_TOKENS = {"false", "0", "no", "n"}
 
 # --- поведение CLI ---
 SHOW_HELP = os.environ.get("DB_SHOW_HELP", "1") == "1"
-LOG_TIMINGS = False  # включение/выключение замера времени для CRUD операций
+OUTPUT_FORMATS = ("table", "csv", "jsonl")  # вывод результата select (см. engine._render_select)
+RENDER_PAGE_ROWS = int(os.environ.get("DB_PAGE_ROWS", "500"))  # строк в одной странице табличного вывода
+SERVER_PORT = int(os.environ.get("DB_PORT", "5433"))  # порт сервера по умолчанию (database serve)
+SERVER_THREADS = int(os.environ.get("DB_SERVER_THREADS", "4"))  # рабочих потоков сервера для операторов
+LOG_TIMINGS = os.environ.get("DB_LOG_TIMINGS", "0") == "1"  # печать времени CRUD-операций (log_time)
+METRICS_ENABLED = os.environ.get("DB_METRICS", "0") == "1"  # сбор метрик по фазам (metrics.py, команда stats)
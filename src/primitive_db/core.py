@@ -1,8 +1,47 @@
 # Основная бизнес-логика: управление таблицами и CRUD
 from .decorators import handle_db_errors, confirm_action, log_time
-import time
+from .cache import TableCache, estimate_rows_size
+from .catalog import table_schema
+from .locks import table_lock
+from .indexes import add_row, build_indexes, dump_indexes, lookup, remove_row, restore_indexes
+from .predicates import Predicate, compile_where, conjuncts, rename_columns, where_columns
+from .aggregates import aggregate_label, compile_aggregate
+from . import metrics, parallel, segments
+from bisect import bisect_left, bisect_right
+from contextlib import ExitStack
+from functools import partial, wraps
+from heapq import nlargest, nsmallest
+from itertools import count, islice, pairwise
+from operator import itemgetter
+import re
+import threading
+
+from .constants import (
+    ALLOWED_TYPES,
+    DEFAULT_STORAGE,
+    ID_COL,
+    POSITIONAL_DELETE_LIMIT,
+    SEGMENT_ROWS,
+    TABLE_CACHE_BYTES,
+    TRUE_TOKENS,
+    FALSE_TOKENS,
+    WAL_COMPACT_BYTES,
+)
+
+def _writes_table(fn):
+    """
+    Декоратор операций записи (metadata, table_name, ...): выполняются под
+    исключительной блокировкой таблицы, поэтому состояние таблицы читается
+    и изменяется без вмешательства других процессов.
+    """
+    @wraps(fn)
+    def wrapper(metadata, table_name, *args, **kwargs):
+        with table_lock(table_name, exclusive=True):
+            return fn(metadata, table_name, *args, **kwargs)
+    # внешние декораторы копируют атрибут: по нему api находит эту обёртку (см. api._raw)
+    wrapper.table_locked = wrapper
+    return wrapper
 
-from .constants import ALLOWED_TYPES, ID_COL, LOG_TIMINGS, TRUE_TOKENS, FALSE_TOKENS
 
 def _parse_columns(specs):
     if not specs:
@@ -31,26 +70,67 @@ def _parse_columns(specs):
     return parsed
 
 
+def _split_partition(specs):
+    """Отделяет от столбцов "partition by <столбец> [N]" -> (столбцы, (столбец, N) или None)."""
+    lowered = [token.lower() for token in specs]
+    if "partition" not in lowered:
+        return specs, None
+    pos = lowered.index("partition")
+    tail = specs[pos + 1:]
+    if len(tail) not in (2, 3) or tail[0].lower() != "by" or (len(tail) == 3 and not tail[2].isdigit()):
+        raise ValueError("Некорректное значение: ожидается partition by <столбец> [число]. Попробуйте снова.")
+    return specs[:pos], (tail[1], int(tail[2]) if len(tail) == 3 else None)
+
+
+def _make_layout(partition, columns):
+    """
+    Раскладка секций новой таблицы: по умолчанию — диапазоны ID по SEGMENT_ROWS строк;
+    partition by ID N — диапазоны по N строк, partition by <столбец> N — N корзин по значению.
+    """
+    if partition is None:
+        return segments.make_layout()
+    column, number = partition
+    if column == ID_COL:
+        rows = SEGMENT_ROWS if number is None else number
+        if rows < 1:
+            raise ValueError(f"Укажите число строк в секции: partition by {ID_COL} <N>. Попробуйте снова.")
+        return segments.make_layout(rows=rows)
+    if column not in dict(columns):
+        raise KeyError(f'Столбец "{column}" не существует.')
+    return segments.make_layout(column, number)
+
+
 @handle_db_errors
 def create_table(metadata, table_name, column_specs):
+    _outside_transaction("create table")
     tables = metadata.setdefault("tables", {})
     if table_name in tables:
         raise KeyError(f'Таблица "{table_name}" уже существует.')
 
+    column_specs, partition = _split_partition(column_specs)
     parsed_columns = _parse_columns(column_specs)
+    layout = _make_layout(partition, parsed_columns)
     tables[table_name] = {
-        "columns": [(ID_COL, "int")] + parsed_columns
+        "columns": [(ID_COL, "int")] + parsed_columns,
+        "next_id": 1,
+        "storage": DEFAULT_STORAGE,
     }
+    if layout is not None:
+        tables[table_name]["segments"] = layout
     return metadata
 
 
 @handle_db_errors
 @confirm_action("удаление таблицы")
+@_writes_table
 def drop_table(metadata, table_name):
+    _outside_transaction("drop table")
     tables = metadata.setdefault("tables", {})
     if table_name not in tables:
         raise KeyError(f'Таблица "{table_name}" не существует.')
     del tables[table_name]
+    _discard_pending(table_name)
+    _table_cache.invalidate(table_name)
     return metadata
 
 
@@ -59,60 +139,302 @@ def list_tables(metadata):
     tables = metadata.get("tables", {})
     return sorted(tables.keys())
 
-def _timed(op_name):
-    """Декоратор: простое логирование времени выполнения операции (по флагу)."""
-    def deco(fn):
-        def wrapper(*args, **kwargs):
-            t0 = time.time()
-            try:
-                return fn(*args, **kwargs)
-            finally:
-                if LOG_TIMINGS:
-                    print(f"[{op_name}] {time.time() - t0:.3f}s")
-        return wrapper
-    return deco
+def _rows_io():
+    cache = TableCache(TABLE_CACHE_BYTES)
+    # отложенная запись: записи журнала копятся по таблицам до flush()
+    pending = {}
+    mode = {"deferred": False}
+    # версия снимка строк: новая при загрузке и при каждом изменении (пул parallel
+    # переиспользуется, пока версия таблицы не сменилась)
+    versions = count(1)
+    # загрузка и догрузка журнала меняют состояние в кэше на месте: рабочие
+    # потоки сервера выполняют их по очереди (замок берётся после блокировки таблицы)
+    loading = threading.RLock()
 
+    def state(metadata, table_name):
+        """
+        Строки таблицы вместе с картой ID -> строка, счётчиком ID
+        и вторичными индексами. Берётся из общего кэша, если файлы таблицы
+        не менялись с момента загрузки, иначе перечитывается (под блокировкой чтения).
+        """
+        from .utils import load_table_state, table_stamp
+        entry = pending.get(table_name)
+        if entry is not None and not cache.contains(table_name, entry["stamp"]):
+            # таблицу с незаписанными изменениями изменил другой процесс:
+            # flush обнаружит конфликт и отменит все отложенные изменения
+            flush()
+        with table_lock(table_name), loading:
+            stamp = table_stamp(table_name)
+            st = catch_up(table_name, stamp) or cache.get(table_name, stamp)
+            if st is None:
+                try:
+                    with metrics.phase("load"):
+                        rows, last_id = load_table_state(
+                            table_name, _storage_of(metadata, table_name), table_schema(metadata, table_name)["columns"]
+                        )
+                except FileNotFoundError:
+                    rows, last_id = [], 0
+                if rows is None:
+                    rows = []
+                if not isinstance(rows, list):
+                    raise ValueError("Повреждённый файл данных: ожидался список строк.")
+                by_id = {r.get(ID_COL): r for r in rows}
+                stored = metadata.get("tables", {}).get(table_name, {}).get("next_id", 1)
+                st = {
+                    "rows": rows,
+                    "by_id": by_id,
+                    # ID только растут, поэтому строки обычно упорядочены по ID
+                    "ordered": all(a < b for a, b in pairwise(by_id)),
+                    "next_id": max(stored, last_id + 1, max(by_id, default=0) + 1),
+                    "indexes": None,
+                    "version": next(versions),
+                }
+                cache.put(table_name, st, stamp, estimate_rows_size(rows))
+            wanted = _index_columns(metadata, table_name)
+            if st["indexes"] is None or set(st["indexes"]) != set(wanted):
+                st["indexes"] = _load_indexes(table_name, st["rows"], wanted)
+        return st
 
-def _rows_io():
-    cache = {}
+    def catch_up(table_name, stamp):
+        """
+        Состояние из кэша, дополненное записями, которые другие процессы дописали
+        в журнал после его загрузки; None — если основной файл сменился
+        (или есть свои отложенные изменения) и таблицу нужно перечитать.
+        """
+        from .utils import read_wal_tail
+        old = cache.stamp_of(table_name)
+        if old is None or old == stamp or old[0] != stamp[0] or stamp[1] is None or table_name in pending:
+            return None
+        offset = old[1][0] if old[1] is not None else 0
+        if offset > stamp[1][0]:
+            return None
+        records = read_wal_tail(table_name, offset, stamp[1][0])
+        if records is None:
+            return None
+        st = cache.peek(table_name)
+        _apply_records(st, records)
+        st["version"] = next(versions)
+        cache.refresh(table_name, stamp, estimate_rows_size(st["rows"]))
+        return cache.get(table_name, stamp)
 
-    def load(table_name):
-        if table_name not in cache:
-            from .utils import load_table_data
-            try:
-                data = load_table_data(table_name)
-            except FileNotFoundError:
-                data = []
-            if data is None:
-                data = []
-            if not isinstance(data, list):
-                raise ValueError("Повреждённый файл данных: ожидался список строк.")
-            cache[table_name] = data
-        return cache[table_name]
+    def save(metadata, table_name, st):
+        """
+        Записывает таблицу (со счётчиком ID и индексами): одним файлом целиком
+        или только изменённые секции — вместе с манифестом секций в метаданных.
+        """
+        from .utils import meta_path, save_index_data, save_table_data, table_stamp, update_table_meta
+        rows = st["rows"]
+        with table_lock(table_name, exclusive=True):
+            # полная запись включает и отложенные изменения
+            entry = pending.pop(table_name, None)
+            # счётчик фиксируется до того, как журнал с удалёнными ID будет очищен
+            table_meta = metadata.get("tables", {}).get(table_name)
+            if table_meta is not None and table_meta.get("next_id") != st["next_id"]:
+                update_table_meta(meta_path(), metadata, table_name, {"next_id": st["next_id"]})
+            layout = _layout_of(metadata, table_name)
+            files = save_table_data(
+                table_name, rows, _storage_of(metadata, table_name), table_schema(metadata, table_name)["columns"],
+                layout, entry["records"] if entry is not None else (),
+            )
+            if table_meta is not None:
+                # число строк для info/count(*) без чтения файла; отпечаток — уже после очистки журнала
+                fields = {"row_count": len(rows), "row_count_stamp": table_stamp(table_name)[0]}
+                if files is not None:
+                    # по отпечатку читатели проверяют, что статистика секций из манифеста актуальна
+                    fields["segments"] = {**layout, "files": files, "stamp": fields["row_count_stamp"]}
+                update_table_meta(meta_path(), metadata, table_name, fields)
+            if st["indexes"]:
+                save_index_data(table_name, dump_indexes(st["indexes"]))
+            cache.refresh(table_name, table_stamp(table_name), estimate_rows_size(rows))
 
-    def save(table_name, rows):
-        cache[table_name] = rows
-        from .utils import save_table_data
-        save_table_data(table_name, rows)
+    def append(metadata, table_name, st, records):
+        from .utils import append_wal, table_stamp
+        if append_wal(table_name, records) >= WAL_COMPACT_BYTES:
+            save(metadata, table_name, st)
+        else:
+            cache.refresh(table_name, table_stamp(table_name), estimate_rows_size(st["rows"]))
 
-    return load, save
+    def journal(metadata, table_name, st, records):
+        """Дописывает операции в журнал; при переполнении сворачивает его в основной файл."""
+        from .utils import table_stamp
+        st["version"] = next(versions)
+        if mode["deferred"]:
+            entry = pending.get(table_name)
+            if entry is None:
+                # отпечаток файлов, на которых основаны отложенные изменения
+                stamp = cache.stamp_of(table_name) or table_stamp(table_name)
+                entry = pending[table_name] = {"records": [], "stamp": stamp}
+            entry["metadata"], entry["st"] = metadata, st
+            entry["records"].extend(records)
+            cache.pin(table_name)
+            return
+        append(metadata, table_name, st, records)
 
+    def flush(table_name=None):
+        """
+        Записывает отложенные изменения: одна дозапись журнала на таблицу, все таблицы
+        под их блокировками. Изменения нескольких таблиц сначала сохраняются в файл
+        намерения, который после сбоя доприменяется при запуске (utils.recover_data_files).
+        Если какую-то таблицу тем временем изменил другой процесс, отменяются все
+        изменения (ValueError).
+        """
+        from .utils import remove_intent, table_stamp, write_intent
+        names = sorted(name for name in pending if table_name is None or name == table_name)
+        with ExitStack() as stack:
+            for name in names:
+                stack.enter_context(table_lock(name, exclusive=True))
+            entries = {}
+            for name in names:
+                entry = pending.pop(name)
+                cache.unpin(name)
+                if entry["records"]:
+                    entries[name] = entry
+            conflicts = [name for name, entry in entries.items() if table_stamp(name) != entry["stamp"]]
+            if conflicts:
+                for name in entries:
+                    cache.invalidate(name)
+                listed = ", ".join(f'"{name}"' for name in conflicts)
+                raise ValueError(f"Таблицы {listed} изменены другим процессом: отложенные изменения отменены.")
+            if len(entries) > 1:
+                write_intent({name: entry["records"] for name, entry in entries.items()})
+            for name, entry in entries.items():
+                append(entry["metadata"], name, entry["st"], entry["records"])
+            if len(entries) > 1:
+                remove_intent()
 
-_load_rows, _save_rows = _rows_io()
+    def discard(table_name=None):
+        """Отменяет отложенные изменения таблицы (None — всех); таблица будет перечитана с диска."""
+        for name in [table_name] if table_name is not None else list(pending):
+            if pending.pop(name, None) is not None:
+                cache.unpin(name)
+                cache.invalidate(name)
 
+    def set_deferred(enabled):
+        try:
+            if not enabled:
+                flush()
+        finally:
+            # при конфликте отложенные изменения уже отменены: режим выключается всё равно
+            mode["deferred"] = enabled
+
+    def loaded(table_name):
+        """Таблица в памяти (или у неё есть незаписанные отложенные изменения)."""
+        from .utils import table_stamp
+        return table_name in pending or cache.contains(table_name, table_stamp(table_name))
+
+    return state, save, journal, loaded, cache, flush, discard, set_deferred
+
+
+(
+    _table_state,
+    _save_table,
+    _journal_table,
+    _is_loaded,
+    _table_cache,
+    _flush_pending,
+    _discard_pending,
+    _set_deferred,
+) = _rows_io()
+
+
+# явная транзакция: begin_transaction() ... commit_transaction() / rollback_transaction()
+_txn = {"active": False, "deferred": False}
+
+
+def set_deferred_writes(enabled):
+    """
+    Включает отложенную запись: изменения остаются в памяти и попадают
+    в журнал только при flush_writes() (или при выключении режима).
+    """
+    _txn["deferred"] = enabled
+    if not _txn["active"]:
+        _set_deferred(enabled)
+
+
+def flush_writes():
+    _flush_pending()
+
+
+def in_transaction():
+    return _txn["active"]
+
+
+def begin_transaction():
+    """
+    Начинает транзакцию: изменения таблиц копятся в памяти (таблицы не вытесняются
+    из кэша) и записываются при commit_transaction() одной дозаписью журнала
+    на таблицу либо отменяются rollback_transaction().
+    """
+    if _txn["active"]:
+        raise ValueError("Транзакция уже начата.")
+    # изменения, отложенные до begin (скриптовый режим), фиксируются отдельно
+    _flush_pending()
+    _set_deferred(True)
+    _txn["active"] = True
+
+
+def _end_transaction():
+    _txn["active"] = False
+    _set_deferred(_txn["deferred"])
+
+
+def commit_transaction():
+    """Фиксирует транзакцию; при конфликте с другим процессом она отменяется (ValueError)."""
+    if not _txn["active"]:
+        raise ValueError("Нет начатой транзакции.")
+    try:
+        _flush_pending()
+    finally:
+        _end_transaction()
+
+
+def rollback_transaction():
+    """Отменяет изменения транзакции: затронутые таблицы перечитываются с диска."""
+    if not _txn["active"]:
+        raise ValueError("Нет начатой транзакции.")
+    _discard_pending()
+    _end_transaction()
+
+
+def _outside_transaction(action):
+    # транзакция охватывает только данные: DDL и полную перезапись файла таблицы не отменить
+    if _txn["active"]:
+        raise ValueError(f'Операция "{action}" недоступна внутри транзакции.')
+
+
+def set_root(path):
+    """
+    Переключает корень базы (каталог с метаданными и data/): записывает
+    отложенные изменения и сбрасывает кэш таблиц прежнего каталога.
+    """
+    from .utils import get_root, set_root as set_files_root
+    if path == get_root():
+        return
+    _flush_pending()
+    _table_cache.clear()
+    set_files_root(path)
+
+
+def _load_indexes(table_name, rows, columns):
+    """Берёт индексы из data/<table>.idx, если они актуальны, иначе строит заново."""
+    from .utils import load_index_data
+    stored = load_index_data(table_name)
+    if stored is not None and set(columns) <= set(stored):
+        return restore_indexes({col: stored[col] for col in columns})
+    return build_indexes(rows, columns)
+
+
+def _storage_of(metadata, table_name):
+    return metadata.get("tables", {}).get(table_name, {}).get("storage", "json")
 
-def _get_columns(metadata, table_name):
-    tables = metadata.get("tables", {})
-    if table_name not in tables:
-        raise KeyError(f'Таблица "{table_name}" не существует.')
-    cols = tables[table_name].get("columns")
-    if not isinstance(cols, list) or not cols:
-        raise ValueError(f'У таблицы "{table_name}" отсутствует корректная схема.')
-    return cols
 
+def _layout_of(metadata, table_name):
+    """Раскладка секций таблицы (segments.py) или None — таблица хранится одним файлом."""
+    return metadata.get("tables", {}).get(table_name, {}).get("segments")
 
-def _data_columns(columns):
-    return [c for c in columns if c[0] != ID_COL]
+
+def _index_columns(metadata, table_name):
+    return list(metadata.get("tables", {}).get(table_name, {}).get("indexes", []))
 
 
 def _coerce(value, type_name):
@@ -145,8 +467,8 @@ def _coerce(value, type_name):
     raise ValueError(f"Неподдерживаемый тип столбца: {type_name}")
 
 
-def _validate_values(columns, values):
-    data_cols = _data_columns(columns)
+def _validate_values(schema, values):
+    data_cols = schema["data_columns"]
     if len(values) != len(data_cols):
         raise ValueError(f"Ожидается {len(data_cols)} значений (без ID), получено {len(values)}.")
 
@@ -158,85 +480,871 @@ def _validate_values(columns, values):
     return row
 
 
-def _next_id(rows):
-    """Генерация нового ID: max(IDs) + 1 или 1, если данных нет."""
-    if not rows:
-        return 1
-    try:
-        return max(int(r.get(ID_COL, 0)) for r in rows) + 1
-    except Exception:
-        return 1
+def _allocate_id(st):
+    """Выдаёт следующий ID из счётчика таблицы; ID после удаления не переиспользуются."""
+    new_id = st["next_id"]
+    st["next_id"] = new_id + 1
+    return new_id
 
 
-def _match_where(row, where):
-    if not where:
-        return True
-    for k, v in where.items():
-        if row.get(k, object()) != v:
-            return False
-    return True
+_row_id = itemgetter(ID_COL)
+
+
+def _remove_rows(st, doomed):
+    """Удаляет строки из таблицы: по позициям (бинарный поиск по ID) или фильтром."""
+    rows = st["rows"]
+    if st["ordered"] and len(doomed) <= POSITIONAL_DELETE_LIMIT:
+        positions = [bisect_left(rows, _row_id(row), key=_row_id) for row in doomed]
+        for pos in sorted(positions, reverse=True):
+            del rows[pos]
+    else:
+        gone = {id(row) for row in doomed}
+        rows[:] = [row for row in rows if id(row) not in gone]
+    for row in doomed:
+        st["by_id"].pop(row.get(ID_COL), None)
+        remove_row(st["indexes"], row)
+
+
+def _apply_records(st, records):
+    """Применяет к состоянию таблицы записи журнала (insert/update/delete), сделанные другим процессом."""
+    by_id, indexes = st["by_id"], st["indexes"] or {}
+    for rec in records:
+        op = rec.get("op")
+        if op == "insert":
+            row = rec["row"]
+            rid = row.get(ID_COL)
+            existing = by_id.get(rid)
+            if existing is not None:
+                remove_row(indexes, existing)
+                existing.update(row)
+                add_row(indexes, existing)
+                continue
+            rows = st["rows"]
+            if rows and rows[-1].get(ID_COL) > rid:
+                st["ordered"] = False
+            rows.append(row)
+            by_id[rid] = row
+            add_row(indexes, row)
+            st["next_id"] = max(st["next_id"], rid + 1)
+        elif op == "update":
+            for rid in rec["ids"]:
+                row = by_id.get(rid)
+                if row is not None:
+                    remove_row(indexes, row)
+                    row.update(rec["set"])
+                    add_row(indexes, row)
+        elif op == "delete":
+            doomed = [by_id[rid] for rid in rec["ids"] if rid in by_id]
+            if doomed:
+                _remove_rows(st, doomed)
+            st["next_id"] = max(st["next_id"], max(rec["ids"], default=0) + 1)
+
+
+def _compile_where(types, where_clause):
+    """
+    Условие WHERE (дерево parse_where или словарь равенств) для столбцов
+    types = {имя: тип} -> Predicate; None — без условия.
+    """
+    if not where_clause:
+        return None
+    if isinstance(where_clause, Predicate):
+        return where_clause
+    return compile_where(where_clause, types)
 
 
 @handle_db_errors
 @log_time
-@_timed("insert")
+@_writes_table
 def insert(metadata, table_name, values):
     """Добавляет запись, сохраняет и возвращает обновлённые данные."""
-    columns = _get_columns(metadata, table_name)
-    new_row_wo_id = _validate_values(columns, values)
+    new_row_wo_id = _validate_values(table_schema(metadata, table_name), values)
 
-    rows = _load_rows(table_name)
-    new_id = _next_id(rows)
-    new_row = {ID_COL: new_id, **new_row_wo_id}
+    st = _table_state(metadata, table_name)
+    rows = st["rows"]
+    with metrics.phase("mutate"):
+        new_id = _allocate_id(st)
+        new_row = {ID_COL: new_id, **new_row_wo_id}
 
-    rows.append(new_row)
-    _save_rows(table_name, rows)
+        rows.append(new_row)
+        st["by_id"][new_id] = new_row
+        add_row(st["indexes"], new_row)
+    _journal_table(metadata, table_name, st, [{"op": "insert", "row": new_row}])
     return rows
 
 
 @handle_db_errors
 @log_time
-def select(table_data, where_clause=None):
-    if not where_clause:
-        return list(table_data)
-    return [row for row in table_data if _match_where(row, where_clause)]
+@_writes_table
+def insert_many(metadata, table_name, values_list):
+    """
+    Добавляет пачку записей: сначала проверяет все строки, затем пишет
+    их одним блоком в журнал. Возвращает список добавленных строк.
+    """
+    schema = table_schema(metadata, table_name)
+    validated = []
+    for num, values in enumerate(values_list, start=1):
+        try:
+            validated.append(_validate_values(schema, values))
+        except ValueError as e:
+            raise ValueError(f"строка {num}: {e}") from e
+    if not validated:
+        raise ValueError("Нет записей для добавления.")
+
+    st = _table_state(metadata, table_name)
+    rows = st["rows"]
+    by_id = st["by_id"]
+    indexes = st["indexes"]
+    added = []
+    with metrics.phase("mutate"):
+        for row_wo_id in validated:
+            new_id = _allocate_id(st)
+            new_row = {ID_COL: new_id, **row_wo_id}
+            rows.append(new_row)
+            by_id[new_id] = new_row
+            add_row(indexes, new_row)
+            added.append(new_row)
+
+    _journal_table(metadata, table_name, st, [{"op": "insert", "row": r} for r in added])
+    return added
+
+
+@handle_db_errors
+@_writes_table
+def load_file(metadata, table_name, path):
+    """Загружает записи из CSV/JSONL одной пачкой через insert_many."""
+    from .utils import read_rows_file
+    data_columns = table_schema(metadata, table_name)["data_columns"]
+    values_list = read_rows_file(path, [name for name, _ in data_columns])
+    return insert_many(metadata, table_name, values_list)
+
+
+def _count_rows(metadata, table_name):
+    from .utils import stored_row_count
+    if not _is_loaded(table_name):
+        count = stored_row_count(table_name, metadata["tables"][table_name])
+        if count is not None:
+            return count
+    return len(_table_state(metadata, table_name)["rows"])
+
+
+@handle_db_errors
+def count_rows(metadata, table_name):
+    """Число строк: из кэша, иначе по счётчику в метаданных и журналу, иначе загрузкой таблицы."""
+    table_schema(metadata, table_name)
+    return _count_rows(metadata, table_name)
+
+
+def _id_range(rows, terms):
+    """Срез упорядоченных по ID строк под диапазонные условия на ID."""
+    start, end = 0, len(rows)
+    for _, op, value in terms:
+        if op == ">":
+            start = max(start, bisect_right(rows, value, key=_row_id))
+        elif op == ">=":
+            start = max(start, bisect_left(rows, value, key=_row_id))
+        elif op == "<":
+            end = min(end, bisect_left(rows, value, key=_row_id))
+        elif op == "<=":
+            end = min(end, bisect_right(rows, value, key=_row_id))
+    if (start, end) == (0, len(rows)):
+        return rows
+    return rows[start:end]
+
+
+def _candidates(st, where, notes=None):
+    """
+    Строки, которые могут подойти под WHERE: по ID (точно или диапазоном),
+    через индексы, если они применимы, иначе все строки таблицы.
+    notes — список, куда дописывается описание выбранного пути (для explain).
+    """
+    note = notes.append if notes is not None else (lambda text: None)
+    if where is None or where.const is True:
+        note("полный просмотр строк в памяти")
+        return st["rows"]
+    if where.const is False:
+        note("условие всегда ложно — строки не читаются")
+        return []
+    by_id = st["by_id"]
+    id_terms = [t for t in where.terms if t[0] == ID_COL]
+    for _, op, value in id_terms:
+        if op == "=":
+            note(f"поиск по {ID_COL} в карте ID")
+            row = by_id.get(value)
+            return [row] if row is not None else []
+        if op == "in":
+            note(f"поиск по списку {ID_COL} в карте ID")
+            return [by_id[i] for i in sorted(value) if i in by_id]
+    rows = _id_range(st["rows"], id_terms) if st["ordered"] else st["rows"]
+    if rows is not st["rows"]:
+        note(f"диапазон {ID_COL} бинарным поиском: {len(rows)} строк")
+    ids = lookup(st["indexes"], where.terms)
+    if ids is None:
+        if rows is st["rows"]:
+            note("полный просмотр строк в памяти")
+        return rows
+    used = sorted({col for col, op, _ in where.terms if col in st["indexes"]})
+    note(f"индекс по {', '.join(used)}: {len(ids)} кандидатов")
+    if rows is st["rows"]:
+        return [by_id[i] for i in sorted(ids) if i in by_id]
+    return [row for row in rows if row[ID_COL] in ids]
+
+
+class _Desc:
+    """Обёртка ключа сортировки для ORDER BY ... DESC (обратное сравнение)."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _order_key(order_by):
+    """Ключ сортировки по [(столбец, по_убыванию)]; одно направление — без обёрток."""
+    names = [name for name, _ in order_by]
+    directions = {desc for _, desc in order_by}
+    if len(directions) == 1:
+        return itemgetter(*names), directions.pop()
+    return (lambda row: tuple(_Desc(row[n]) if desc else row[n] for n, desc in order_by)), False
+
+
+def _check_columns(schema, names):
+    known = schema["types"]
+    for name in names:
+        if name not in known:
+            raise KeyError(f'Столбец "{name}" не существует.')
+
+
+def _select_rows(source, order_by, limit, offset):
+    """
+    Применяет ORDER BY/LIMIT/OFFSET к потоку строк (упорядоченному по ID):
+    без сортировки поток читается только до offset + limit строк,
+    сортировка с LIMIT держит лишь offset + limit лучших строк (куча).
+    """
+    stop = None if limit is None else offset + limit
+    if not order_by:
+        return list(islice(source, offset, stop))
+    key, reverse = _order_key(order_by)
+    if stop is not None:
+        best = nlargest(stop, source, key=key) if reverse else nsmallest(stop, source, key=key)
+        return best[offset:]
+    return sorted(source, key=key, reverse=reverse)[offset:]
+
+
+def _row_source(metadata, table_name, schema, where, names=None, notes=None, early_stop=False):
+    """
+    Поток строк таблицы, подходящих под WHERE, в порядке ID. Холодная колоночная
+    таблица читается через mmap без загрузки целиком (names — нужные столбцы,
+    остальные не декодируются), иначе строки берутся из кэша таблиц.
+    early_stop — поток, скорее всего, будет прочитан не до конца (LIMIT без ORDER BY):
+    тогда условие проверяется последовательно, без запуска процессов.
+    """
+    if where is not None and where.const is False:
+        if notes is not None:
+            notes.append("условие всегда ложно — строки не читаются")
+        return iter(())
+    if _cold_scan(metadata, table_name, where):
+        from .utils import scan_table
+        layout, storage = _layout_of(metadata, table_name), _storage_of(metadata, table_name)
+        if notes is not None:
+            if layout is not None:
+                notes.append(_describe_segments(table_name, layout, where, schema))
+            if storage == "columnar":
+                notes.append(_describe_mmap_scan(schema, where, names))
+        rows = scan_table(table_name, where, storage, schema["columns"], names, layout)
+        return rows.wrap(partial(metrics.timed_iter, "filter"))
+    st = _table_state(metadata, table_name)
+    candidates = _candidates(st, where, notes)
+    if where is not None and not early_stop and parallel.applies(len(candidates), where):
+        if notes is not None:
+            notes.append(f"проверка условия параллельно по диапазонам строк (процессов: {parallel.workers()})")
+        metrics.count("rows_scanned", len(candidates))
+        return metrics.timed_iter("filter", parallel.iter_matching(candidates, where, _version(st, candidates)))
+    if metrics.enabled():
+        candidates = metrics.counted(candidates, "rows_scanned")
+    return iter(candidates) if where is None else metrics.timed_iter("filter", filter(where, candidates))
+
+
+def _cold_scan(metadata, table_name, where):
+    """
+    Читать ли строки с диска, не загружая таблицу в кэш: колоночную таблицу — всегда
+    (через mmap), секционированную — когда WHERE отсекает часть секций
+    по столбцу секционирования или по статистике секций.
+    """
+    if _is_loaded(table_name):
+        return False
+    if _storage_of(metadata, table_name) == "columnar":
+        return True
+    layout = _layout_of(metadata, table_name)
+    if layout is None or where is None:
+        return False
+    keys = sorted(int(key) for key in layout.get("files", {}))
+    chosen = segments.select(layout, where.terms, keys)
+    if chosen != keys:
+        return True
+    from .utils import segment_blooms
+    types = table_schema(metadata, table_name)["types"]
+    return bool(segments.excluded(layout, where.terms, chosen, types, partial(segment_blooms, table_name)))
+
+
+def _describe_segments(table_name, layout, where, schema):
+    from .utils import segment_keys
+    keys, skipped, total = segment_keys(table_name, layout, where, schema["columns"])
+    if len(keys) == total and not skipped:
+        return f"секции: читаются все ({total})"
+    reasons = []
+    if len(keys) < total:
+        reasons.append(f"отсечение по {layout['by']}")
+    if skipped:
+        reasons.append(f"по статистике min/max и фильтрам Блума пропущено {len(skipped)}")
+    return f"секции: читаются {len(keys) - len(skipped)} из {total} ({'; '.join(reasons)})"
+
+
+def _describe_mmap_scan(schema, where, names):
+    terms = where.terms if where is not None else []
+    parts = ["чтение колоночного файла через mmap"]
+    if any(col == ID_COL for col, _, _ in terms):
+        parts.append(f"позиции по {ID_COL} бинарным поиском")
+    checks = [f"{col} {op}" for col, op, _ in terms if col != ID_COL]
+    if checks:
+        parts.append("пропуск блоков по статистике (min/max, фильтры Блума)")
+        parts.append("проверка по сырым данным: " + ", ".join(checks))
+    if names is not None:
+        decoded = set(names) | set(where.columns if where is not None else ()) | {ID_COL}
+        parts.append("декодируются столбцы: " + ", ".join(n for n in schema["names"] if n in decoded))
+    return "; ".join(parts)
+
+
+def _close_source(source):
+    # досрочная остановка (LIMIT): закрываем чтение файла
+    close = getattr(source, "close", None)
+    if close is not None:
+        close()
+
+
+def _select_groups(metadata, table_name, schema, where, columns, group_by, order_by, limit, offset):
+    """SELECT с агрегатами и/или GROUP BY: один проход по строкам с хеш-группировкой."""
+    aggregates = [item for item in columns if not isinstance(item, str)]
+    agg = compile_aggregate(aggregates, group_by, schema["types"])
+    for item in columns:
+        if isinstance(item, str) and item not in group_by:
+            raise ValueError(f'Столбец "{item}" должен входить в GROUP BY или быть аргументом агрегатной функции.')
+    labels = [item if isinstance(item, str) else aggregate_label(*item) for item in columns] or list(group_by)
+    for name, _ in order_by:
+        if name not in labels and name not in group_by:
+            raise KeyError(f'Столбец "{name}" отсутствует в результате запроса.')
+
+    count_only = where is None and not group_by and all(item == ("count", "*") for item in aggregates)
+    scan = None if count_only else _parallel_rows(metadata, table_name, where)
+    if count_only:
+        # count(*) по всей таблице — без чтения строк
+        groups = [{aggregate_label("count", "*"): _count_rows(metadata, table_name)}]
+    elif scan is not None:
+        rows, version = scan
+        metrics.count("rows_scanned", len(rows))
+        with metrics.phase("filter"):
+            groups = agg.finish_groups(parallel.aggregate_groups(rows, where, agg, version))
+    else:
+        source = _row_source(metadata, table_name, schema, where, agg.columns)
+        try:
+            groups = agg.run(source)
+        finally:
+            _close_source(source)
+    rows = _select_rows(iter(groups), order_by, limit, offset)
+    metrics.count("rows_returned", len(rows))
+    return [{label: row[label] for label in labels} for row in rows]
+
+
+def _parallel_rows(metadata, table_name, where):
+    """
+    (строки таблицы в памяти, версия снимка) для параллельного прохода агрегации
+    или None — агрегировать последовательно (маленькая таблица, холодная колоночная таблица).
+    """
+    if parallel.workers() <= 1:
+        return None
+    if _cold_scan(metadata, table_name, where):
+        return None
+    if where is not None and where.const is False:
+        return None
+    st = _table_state(metadata, table_name)
+    candidates = _candidates(st, where)
+    return (candidates, _version(st, candidates)) if parallel.applies(len(candidates), where) else None
+
+
+def _version(st, candidates):
+    """Версия снимка для пула parallel; None — кандидаты не вся таблица (пул не переиспользуется)."""
+    return st["version"] if candidates is st["rows"] else None
+
+
+def _iter_rows(source, order_by, limit, offset, project=None):
+    """
+    Ленивый конвейер «источник -> окно ORDER BY/LIMIT/OFFSET -> проекция».
+    Без сортировки строки отдаются по мере чтения; источник закрывается,
+    когда строки кончились или генератор закрыт.
+    """
+    returned = 0
+    try:
+        if order_by:
+            rows = _select_rows(source, order_by, limit, offset)
+        else:
+            rows = islice(source, offset, None if limit is None else offset + limit)
+        for row in rows:
+            returned += 1
+            yield row if project is None else project(row)
+    finally:
+        metrics.count("rows_returned", returned)
+        _close_source(source)
+
+
+@handle_db_errors
+def iter_select(metadata, table_name, where_clause=None, columns=None, order_by=None, limit=None, offset=0, group_by=None):
+    """
+    Итератор строк, подходящих под WHERE (аргументы — как у select). Схема и условие
+    проверяются сразу, строки читаются по мере потребления.
+    """
+    schema = table_schema(metadata, table_name)
+    order_by = order_by or []
+    where = _compile_where(schema["types"], where_clause)
+    if group_by or any(not isinstance(item, str) for item in columns or []):
+        return iter(_select_groups(
+            metadata, table_name, schema, where, list(columns or []), list(group_by or []), order_by, limit, offset
+        ))
+
+    _check_columns(schema, list(columns or []) + [name for name, _ in order_by])
+    if limit == 0:
+        return iter(())
+    names = None if columns is None else set(columns) | {name for name, _ in order_by}
+    early_stop = limit is not None and not order_by
+    source = _row_source(metadata, table_name, schema, where, names, early_stop=early_stop)
+    project = None if columns is None else (lambda row: {name: row[name] for name in columns})
+    return _iter_rows(source, order_by, limit, offset, project)
+
+
+@handle_db_errors
+@log_time
+def select(metadata, table_name, where_clause=None, columns=None, order_by=None, limit=None, offset=0, group_by=None):
+    """
+    Возвращает строки, подходящие под WHERE. columns — выводимые столбцы
+    (None — все) и агрегаты (функция, столбец), group_by — столбцы группировки,
+    order_by — [(столбец, по_убыванию)], limit/offset — окно результата.
+    """
+    rows = iter_select(metadata, table_name, where_clause, columns, order_by, limit, offset, group_by)
+    return None if rows is None else list(rows)
+
+
+def _join_resolver(sides):
+    """
+    Функция «имя столбца -> (таблица, столбец)» для соединения:
+    имя с префиксом таблицы (users.age) или без него, если столбец есть только в одной таблице.
+    """
+    def resolve(name):
+        table, dot, column = name.partition(".")
+        if dot and table in sides:
+            if column not in sides[table]:
+                raise KeyError(f'Столбец "{name}" не существует.')
+            return table, column
+        owners = [t for t, types in sides.items() if name in types]
+        if not owners:
+            raise KeyError(f'Столбец "{name}" не существует.')
+        if len(owners) > 1:
+            raise ValueError(f'Столбец "{name}" есть в обеих таблицах — укажите таблицу: {owners[0]}.{name}')
+        return owners[0], name
+    return resolve
+
+
+def _probe_index(metadata, table_name, column):
+    """
+    Поиск строк по значению (value, default) через карту ID или индекс
+    таблицы — без построения хеш-таблицы; None, если столбец не индексирован.
+    """
+    if column == ID_COL:
+        st = _table_state(metadata, table_name)
+        return lambda value, default: [st["by_id"][value]] if value in st["by_id"] else default
+    if column in _index_columns(metadata, table_name):
+        st = _table_state(metadata, table_name)
+        idx, by_id = st["indexes"][column], st["by_id"]
+        return lambda value, default: [by_id[i] for i in sorted(idx.get(value, ()))]
+    return None
+
+
+def _join_plan(metadata, left, right, on, where_clause, columns, order_by):
+    """
+    План соединения: какие условия WHERE проверяются до соединения (по таблицам),
+    какие — после, какие столбцы читаются, какая таблица — сторона построения.
+    """
+    if left == right:
+        raise ValueError("Соединение таблицы с самой собой не поддерживается.")
+    schemas = {t: table_schema(metadata, t) for t in (left, right)}
+    sides = {t: schema["types"] for t, schema in schemas.items()}
+    resolve = _join_resolver(sides)
+
+    def qualify(name):
+        return "{}.{}".format(*resolve(name))
+
+    (t1, c1), (t2, c2) = resolve(on[0]), resolve(on[1])
+    if t1 == t2:
+        raise ValueError("Условие ON должно связывать столбцы разных таблиц.")
+    keys = {t1: c1, t2: c2}
+
+    if columns is None:
+        columns = [f"{t}.{name}" for t in (left, right) for name in schemas[t]["names"]]
+    if any(not isinstance(item, str) for item in columns):
+        raise ValueError("Агрегаты по соединению таблиц не поддерживаются.")
+    order_by = [(qualify(name), desc) for name, desc in (order_by or [])]
+    outputs = [(name, qualify(name)) for name in columns]
+
+    # WHERE: условия одной таблицы — до соединения, смешанные — после
+    pushed = {left: [], right: []}
+    mixed = []
+    if where_clause:
+        for part in conjuncts(where_clause):
+            owners = {resolve(name)[0] for name in where_columns(part)}
+            if len(owners) == 1:
+                pushed[owners.pop()].append(rename_columns(part, lambda name: resolve(name)[1]))
+            else:
+                mixed.append(rename_columns(part, qualify))
+    preds = {t: _compile_where(sides[t], ("and", pushed[t]) if pushed[t] else None) for t in (left, right)}
+    qualified_types = {f"{t}.{n}": typ for t in (left, right) for n, typ in sides[t].items()}
+    post = _compile_where(qualified_types, ("and", mixed) if mixed else None)
+
+    # в строке результата — только нужные столбцы
+    needed = {q for _, q in outputs} | {q for q, _ in order_by} | set(post.columns if post else ())
+    needed |= {f"{t}.{keys[t]}" for t in keys}
+    pairs = {t: [(q, q.split(".", 1)[1]) for q in sorted(needed) if q.split(".", 1)[0] == t] for t in keys}
+    names = {t: {c for _, c in pairs[t]} | set(preds[t].columns if preds[t] else ()) for t in keys}
+
+    # меньшая таблица — сторона построения, большая читается потоком
+    build, stream = sorted((left, right), key=lambda t: _count_rows(metadata, t))
+    probe = None if preds[build] is not None else _probe_index(metadata, build, keys[build])
+    return {
+        "schemas": schemas, "keys": keys, "outputs": outputs, "order_by": order_by,
+        "preds": preds, "post": post, "pairs": pairs, "names": names,
+        "build": build, "stream": stream, "probe": probe,
+    }
+
+
+@handle_db_errors
+def iter_select_join(metadata, left, right, on, where_clause=None, columns=None, order_by=None, limit=None, offset=0):
+    """
+    Итератор строк соединения (аргументы — как у select_join). Хеш-таблица
+    строится при первом обращении, большая таблица читается по мере потребления.
+    """
+    plan = _join_plan(metadata, left, right, on, where_clause, columns, order_by)
+    schemas, keys, names, preds, post = plan["schemas"], plan["keys"], plan["names"], plan["preds"], plan["post"]
+    build, stream = plan["build"], plan["stream"]
+    if limit == 0 or any(p is not None and p.const is False for p in preds.values()):
+        return iter(())
+    build_pairs, stream_pairs, stream_key = plan["pairs"][build], plan["pairs"][stream], keys[stream]
+    outputs = plan["outputs"]
+
+    def joined():
+        probe = plan["probe"]
+        if probe is None:
+            table = {}
+            source = _row_source(metadata, build, schemas[build], preds[build], names[build])
+            try:
+                for row in source:
+                    table.setdefault(row[keys[build]], []).append(row)
+            finally:
+                _close_source(source)
+            probe = table.get
+        source = _row_source(metadata, stream, schemas[stream], preds[stream], names[stream])
+        try:
+            for row in source:
+                matches = probe(row[stream_key], ())
+                if not matches:
+                    continue
+                base = {q: row[c] for q, c in stream_pairs}
+                for match in matches:
+                    out = dict(base)
+                    for q, c in build_pairs:
+                        out[q] = match[c]
+                    if post is None or post(out):
+                        yield out
+        finally:
+            _close_source(source)
+
+    return _iter_rows(joined(), plan["order_by"], limit, offset, lambda row: {name: row[q] for name, q in outputs})
+
+
+@handle_db_errors
+@log_time
+def select_join(metadata, left, right, on, where_clause=None, columns=None, order_by=None, limit=None, offset=0):
+    """
+    Внутреннее соединение по равенству: select ... from left join right on on[0] = on[1].
+    Условия WHERE, относящиеся к одной таблице, проверяются до соединения; хеш-таблица
+    строится по меньшей таблице (или используется её индекс), большая читается потоком.
+    Столбцы результата называются так, как указаны в columns (по умолчанию — <таблица>.<столбец>).
+    """
+    rows = iter_select_join(metadata, left, right, on, where_clause, columns, order_by, limit, offset)
+    return None if rows is None else list(rows)
+
+
+_COLUMN_REF_RE = re.compile(r"""r\[('[^']*'|"[^"]*")\]""")
+_LIKE_CALL_RE = re.compile(r"\b(_c\d+)\((\w[^()]*)\) is not None")
+
+
+def _where_text(where):
+    """Условие Predicate в читаемом виде: выражение сгенерированной функции со значениями."""
+    if where is None:
+        return "нет"
+    if where.const is not None:
+        return "всегда истинно" if where.const else "всегда ложно"
+    expr = next(line.strip()[len("return "):] for line in where.source.splitlines() if "return " in line)
+    consts = where.fn.__globals__
+    expr = _COLUMN_REF_RE.sub(lambda m: m.group(1)[1:-1], expr).replace(" == ", " = ")
+    expr = _LIKE_CALL_RE.sub(lambda m: f"{m.group(2)} ~ /{consts[m.group(1)].__self__.pattern}/", expr)
+
+    def value(match):
+        v = consts[match.group(0)]
+        return repr(sorted(v) if isinstance(v, frozenset) else v)
+
+    return re.sub(r"\b_c\d+\b", value, expr)
+
+
+def _describe_window(order_by, limit, offset, natural="в порядке ID"):
+    """Как применяются ORDER BY/LIMIT/OFFSET (см. _select_rows); natural — порядок без сортировки."""
+    stop = None if limit is None else offset + limit
+    if limit == 0:
+        return "LIMIT 0 — строки не читаются"
+    if not order_by:
+        if stop is None:
+            return f"вывод всех строк {natural}" + (f", пропуск первых {offset}" if offset else "")
+        return f"досрочная остановка после {stop} строк"
+    keys = ", ".join(f"{name}{' desc' if desc else ''}" for name, desc in order_by)
+    if stop is not None:
+        return f"top-k по {keys}: куча на {stop} строк"
+    return f"полная сортировка по {keys}"
+
+
+def _access_lines(notes):
+    return [f"  доступ: {note}" for note in notes]
+
+
+def _explain_join(metadata, query):
+    join = query["join"]
+    plan = _join_plan(
+        metadata, query["table"], join["table"], join["on"], query["where"], query["columns"], query["order_by"]
+    )
+    build, stream, keys = plan["build"], plan["stream"], plan["keys"]
+    lines = [f"select: соединение {query['table']} и {join['table']} по {build}.{keys[build]} = {stream}.{keys[stream]}"]
+    for role, table in (("построение", build), ("поток", stream)):
+        pred = plan["preds"][table]
+        notes = []
+        source = _row_source(metadata, table, plan["schemas"][table], pred, plan["names"][table], notes)
+        _close_source(source)
+        lines.append(f"  {table} ({role}, строк: {_count_rows(metadata, table)}):")
+        lines.append(f"    условие до соединения: {_where_text(pred)}")
+        if table == build and plan["probe"] is not None:
+            what = "карта ID" if keys[build] == ID_COL else f"индекс по {keys[build]}"
+            lines.append(f"    {what} вместо хеш-таблицы")
+        else:
+            lines += [f"    доступ: {note}" for note in notes]
+            if table == build:
+                lines.append(f"    хеш-таблица по {keys[build]}")
+    if plan["post"] is not None:
+        lines.append(f"  условие после соединения: {_where_text(plan['post'])}")
+    lines.append(f"  порядок: {_describe_window(plan['order_by'], query['limit'], query['offset'])}")
+    return lines
+
+
+def _explain_select(metadata, query, schema, where):
+    table_name, columns = query["table"], query["columns"]
+    order_by, group_by = query["order_by"], query["group_by"]
+    lines = [f"select: {table_name}", f"  условие: {_where_text(where)}"]
+    aggregates = [item for item in columns or [] if not isinstance(item, str)]
+    if group_by or aggregates:
+        if where is None and not group_by and all(item == ("count", "*") for item in aggregates):
+            lines.append("  count(*) по сохранённому счётчику строк — строки не читаются")
+            return lines
+        agg = compile_aggregate(aggregates, group_by, schema["types"])
+        notes = []
+        _close_source(_row_source(metadata, table_name, schema, where, agg.columns, notes))
+        lines += _access_lines(notes)
+        labels = ", ".join(aggregate_label(*item) for item in aggregates) or "нет"
+        keys = ", ".join(group_by) if group_by else "без группировки"
+        if _parallel_rows(metadata, table_name, where) is not None:
+            lines.append(
+                f"  хеш-агрегация параллельно (процессов: {parallel.workers()}): частичные группы "
+                f"по диапазонам строк сливаются по порядку; группы — {keys}; агрегаты — {labels}"
+            )
+        else:
+            lines.append(f"  хеш-агрегация за один проход: группы — {keys}; агрегаты — {labels}")
+        lines.append(f"  порядок: {_describe_window(order_by, query['limit'], query['offset'], 'в порядке групп')}")
+        return lines
+
+    _check_columns(schema, list(columns or []) + [name for name, _ in order_by])
+    names = None if columns is None else set(columns) | {name for name, _ in order_by}
+    notes = []
+    early_stop = query["limit"] is not None and not order_by
+    _close_source(_row_source(metadata, table_name, schema, where, names, notes, early_stop))
+    lines += _access_lines(notes)
+    lines.append(f"  порядок: {_describe_window(order_by, query['limit'], query['offset'])}")
+    return lines
+
+
+@handle_db_errors
+def explain(metadata, query):
+    """
+    План выполнения разобранного оператора select/update/delete (parse_statement)
+    без его выполнения: список строк — путь к строкам, условие, порядок, агрегация, соединение.
+    """
+    kind = query["kind"]
+    if kind == "select" and query["join"]:
+        return _explain_join(metadata, query)
+    table_name = query["table"]
+    schema = table_schema(metadata, table_name)
+    where = _compile_where(schema["types"], query["where"])
+    if kind == "select":
+        return _explain_select(metadata, query, schema, where)
+    notes = []
+    _candidates(_table_state(metadata, table_name), where, notes)
+    lines = [f"{kind}: {table_name}", f"  условие: {_where_text(where)}"]
+    lines += _access_lines(notes)
+    lines.append("  изменённые строки записываются в журнал таблицы")
+    return lines
 
 
 def _require_where(fn):
     def wrapper(table_data, where_clause=None, *args, **kwargs):
-        if not where_clause:
+        if where_clause is None:
             raise ValueError("WHERE-клаузу необходимо указать (не может быть пустой).")
         return fn(table_data, where_clause, *args, **kwargs)
     return wrapper
 
 
 @_require_where
-def _update_impl(table_data, where_clause, set_clause):
+def _update_impl(table_data, where_clause, set_clause, indexes, version=None):
+    """Обновляет подходящие строки на месте (вместе с индексами) и возвращает их ID."""
     if not set_clause:
         raise ValueError("SET-клауза пуста — нечего обновлять.")
-    for row in table_data:
-        if _match_where(row, where_clause):
-            for k, v in set_clause.items():
-                row[k] = v
-    return table_data
+    if ID_COL in set_clause:
+        raise ValueError(f"Столбец {ID_COL} нельзя изменять.")
+    ids = []
+    # подходящие строки можно найти параллельно: изменение строки не влияет на проверку других
+    matched = parallel.matching(table_data, where_clause, version)
+    for row in filter(where_clause, table_data) if matched is None else matched:
+        remove_row(indexes, row)
+        for k, v in set_clause.items():
+            row[k] = v
+        add_row(indexes, row)
+        ids.append(row.get(ID_COL))
+    return ids
+
+
+def _coerce_set(types, set_clause):
+    """Приводит значения SET к типам столбцов схемы (types = {имя: тип})."""
+    out = {}
+    for k, v in (set_clause or {}).items():
+        if k not in types:
+            raise KeyError(f'Столбец "{k}" не существует.')
+        out[k] = _coerce(v, types[k])
+    return out
 
 
 @handle_db_errors
-@_timed("update")
-def update(table_data, set_clause, where_clause):
-    return _update_impl(table_data, where_clause, set_clause)
+@log_time
+@_writes_table
+def update(metadata, table_name, set_clause, where_clause):
+    """Обновляет записи, фиксирует изменение в журнале и возвращает число обновлённых записей."""
+    types = table_schema(metadata, table_name)["types"]
+    set_clause = _coerce_set(types, set_clause)
+    layout = _layout_of(metadata, table_name)
+    if layout is not None and not segments.by_id(layout) and layout["by"] in set_clause:
+        # строка не переезжает между секциями: секция определяется при вставке
+        raise ValueError(f'Столбец секционирования "{layout["by"]}" нельзя изменять.')
+    where = _compile_where(types, where_clause)
+    st = _table_state(metadata, table_name)
+    candidates = _candidates(st, where)
+    metrics.count("rows_scanned", len(candidates))
+    with metrics.phase("mutate"):
+        ids = _update_impl(candidates, where, set_clause, st["indexes"], _version(st, candidates))
+    if ids:
+        _journal_table(metadata, table_name, st, [{"op": "update", "ids": ids, "set": set_clause}])
+    return len(ids)
 
 
 @_require_where
-def _delete_impl(table_data, where_clause):
-    kept = [row for row in table_data if not _match_where(row, where_clause)]
-    table_data.clear()
-    table_data.extend(kept)
-    return table_data
+def _delete_impl(table_data, where_clause, version=None):
+    """Возвращает строки, подходящие под WHERE."""
+    matched = parallel.matching(table_data, where_clause, version)
+    if matched is not None:
+        return matched
+    return [row for row in table_data if where_clause(row)]
 
 
 @handle_db_errors
 @confirm_action("удаление записей")
-@_timed("delete")
-def delete(table_data, where_clause):
-    return _delete_impl(table_data, where_clause)
+@log_time
+@_writes_table
+def delete(metadata, table_name, where_clause):
+    """Удаляет записи, фиксирует изменение в журнале и возвращает число удалённых записей."""
+    where = _compile_where(table_schema(metadata, table_name)["types"], where_clause)
+    st = _table_state(metadata, table_name)
+    candidates = _candidates(st, where)
+    metrics.count("rows_scanned", len(candidates))
+    with metrics.phase("filter"):
+        doomed = _delete_impl(candidates, where, _version(st, candidates))
+    if doomed:
+        with metrics.phase("mutate"):
+            _remove_rows(st, doomed)
+        _journal_table(metadata, table_name, st, [{"op": "delete", "ids": [r.get(ID_COL) for r in doomed]}])
+    return len(doomed)
+
+
+@handle_db_errors
+@_writes_table
+def create_index(metadata, table_name, column):
+    """Создаёт хеш-индекс по столбцу, строит его и сохраняет рядом с данными."""
+    _outside_transaction("create index")
+    if column not in table_schema(metadata, table_name)["types"]:
+        raise KeyError(f'Столбец "{column}" не существует.')
+    if column == ID_COL:
+        raise ValueError(f"Столбец {ID_COL} уже индексирован.")
+    indexes = metadata["tables"][table_name].setdefault("indexes", [])
+    if column in indexes:
+        raise KeyError(f'Индекс по столбцу "{column}" уже существует.')
+    indexes.append(column)
+    try:
+        st = _table_state(metadata, table_name)
+        _save_table(metadata, table_name, st)
+    except Exception:
+        indexes.remove(column)
+        raise
+    return metadata
+
+
+@handle_db_errors
+@_writes_table
+def compact(metadata, table_name):
+    """Сворачивает журнал таблицы в основной файл данных."""
+    _outside_transaction("compact")
+    table_schema(metadata, table_name)
+    st = _table_state(metadata, table_name)
+    _save_table(metadata, table_name, st)
+    return st["rows"]
+
+
+@handle_db_errors
+@_writes_table
+def convert_storage(metadata, table_name, storage):
+    """Переводит таблицу в другой формат хранения (json / columnar)."""
+    _outside_transaction("convert")
+    from .storage import get_backend
+    table_schema(metadata, table_name)
+    get_backend(storage)
+    st = _table_state(metadata, table_name)
+    table_meta = metadata["tables"][table_name]
+    previous = table_meta.get("storage", "json")
+    table_meta["storage"] = storage
+    try:
+        _save_table(metadata, table_name, st)
+    except Exception:
+        table_meta["storage"] = previous
+        raise
+    return metadata
@@ -1,7 +1,32 @@
 import time
+from functools import wraps
+
+from .constants import LOG_TIMINGS
+
+# "ask" — спрашивать, "yes" — подтверждать без вопроса (--yes), "no" — отменять (скрипт без --yes)
+_confirm = {"policy": "ask"}
+# операции, завершившиеся ошибкой (перехваченной и напечатанной) или отменённые:
+# скриптовый режим сравнивает счётчик до и после команды
+_failures = {"count": 0}
+
+
+def note_failure():
+    _failures["count"] += 1
+
+
+def failure_count():
+    return _failures["count"]
+
+
+def set_confirm_policy(policy):
+    if policy not in ("ask", "yes", "no"):
+        raise ValueError(f"Неизвестный режим подтверждения: {policy}")
+    _confirm["policy"] = policy
+
 
 def handle_db_errors(func):
     """Декоратор для централизованной обработки ошибок в операциях БД."""
+    @wraps(func)
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
@@ -17,6 +42,7 @@ def handle_db_errors(func):
             print(f"Ошибка валидации: {e}")
         except Exception as e:
             print(f"Произошла непредвиденная ошибка: {e}")
+        note_failure()
         return None
     return wrapper
 
@@ -24,14 +50,23 @@ def handle_db_errors(func):
 def confirm_action(action_name):
     """Перед выполнением функции спрашивает подтверждение. Не 'y' — отмена."""
     def deco(func):
+        @wraps(func)
         def wrapper(*args, **kwargs):
+            if _confirm["policy"] == "yes":
+                return func(*args, **kwargs)
+            if _confirm["policy"] == "no":
+                print(f'Операция "{action_name}" отменена: нет подтверждения (используйте --yes).')
+                note_failure()
+                return None
             try:
                 answer = input(f'Вы уверены, что хотите выполнить "{action_name}"? [y/n]: ').strip().lower()
             except (EOFError, KeyboardInterrupt):
                 print("\nОперация отменена.")
+                note_failure()
                 return None
             if answer != "y":
                 print("Операция отменена пользователем.")
+                note_failure()
                 return None
             return func(*args, **kwargs)
         return wrapper
@@ -39,11 +74,17 @@ def confirm_action(action_name):
 
 
 def log_time(func):
-    """Измеряет время выполнения функции и печатает результат (time.monotonic)."""
+    """
+    Печатает время выполнения функции, если включено DB_LOG_TIMINGS=1.
+    Время по фазам и счётчики строк собирает metrics (команда stats).
+    """
+    @wraps(func)
     def wrapper(*args, **kwargs):
-        start = time.monotonic()
+        if not LOG_TIMINGS:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
         result = func(*args, **kwargs)
-        elapsed = time.monotonic() - start
+        elapsed = time.perf_counter() - start
         print(f'Функция {func.__name__} выполнилась за {elapsed:.3f} секунд.')
         return result
     return wrapper
@@ -0,0 +1,108 @@
+# Атомарная запись файлов и уровни надёжности (fsync) для журнала и таблиц
+import atexit
+import os
+import threading
+from contextlib import contextmanager
+
+from .constants import DURABILITY, GROUP_COMMIT_MS, TMP_SUFFIX
+
+# none  — без fsync: переживает падение процесса, но не отключение питания;
+# flush — fsync только при полной перезаписи файлов (таблица, метаданные, индексы);
+# fsync — дополнительно fsync после каждой записи в журнал;
+# group — как flush, а журналы синхронизируются пачкой раз в GROUP_COMMIT_MS.
+LEVELS = ("none", "flush", "fsync", "group")
+
+_pending = set()
+_lock = threading.Lock()
+_timer = None
+
+
+def check_level(level):
+    if level not in LEVELS:
+        raise ValueError(f"Неизвестный уровень надёжности: {level}. Доступны: {', '.join(LEVELS)}")
+    return level
+
+
+_level = check_level(DURABILITY)
+
+
+def get_level():
+    return _level
+
+
+def set_level(level):
+    """Меняет уровень надёжности для последующих записей; ожидающие fsync выполняются сразу."""
+    global _level
+    _level = check_level(level)
+    sync_pending()
+
+
+def _fsync_path(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(path):
+    if hasattr(os, "O_DIRECTORY"):
+        _fsync_path(os.path.dirname(os.path.abspath(path)))
+
+
+@contextmanager
+def atomic_open(path, mode="w", level=None):
+    """
+    Открывает временный файл рядом с path; после успешной записи
+    подменяет им path через os.replace. При ошибке path не меняется.
+    """
+    level = level or _level
+    tmp = f"{path}{TMP_SUFFIX}"
+    encoding = None if "b" in mode else "utf-8"
+    f = open(tmp, mode, encoding=encoding)
+    try:
+        yield f
+        f.flush()
+        if level != "none":
+            os.fsync(f.fileno())
+    except BaseException:
+        f.close()
+        os.remove(tmp)
+        raise
+    f.close()
+    os.replace(tmp, path)
+    if level != "none":
+        _fsync_dir(path)
+
+
+def sync_pending():
+    """Синхронизирует журналы, ожидающие группового fsync."""
+    global _timer
+    with _lock:
+        paths = list(_pending)
+        _pending.clear()
+        _timer = None
+    for path in paths:
+        _fsync_path(path)
+
+
+atexit.register(sync_pending)
+
+
+def after_append(f, path, level=None):
+    """Вызывается после дописывания в журнал (файл ещё открыт)."""
+    global _timer
+    level = level or _level
+    f.flush()
+    if level == "fsync":
+        os.fsync(f.fileno())
+    elif level == "group":
+        with _lock:
+            _pending.add(path)
+            if _timer is None:
+                _timer = threading.Timer(GROUP_COMMIT_MS / 1000, sync_pending)
+                _timer.daemon = True
+                _timer.start()
@@ -1,287 +1,576 @@
+import csv
+import json
 import shlex
+import sys
+from itertools import islice
+
 from prettytable import PrettyTable
 
-from .constants import META_FILE, SHOW_HELP
+from . import metrics, parallel, segments
+from .constants import OUTPUT_FORMATS, RENDER_PAGE_ROWS, SHOW_HELP
 
-from .utils import (
-    load_metadata,
-    save_metadata,
-    load_table_data,
-    save_table_data,
-)
+from .api import STATEMENT_WORDS, result_columns
+from .catalog import Catalog
+from .decorators import failure_count, note_failure, set_confirm_policy
+from .utils import meta_path, recover_data_files, save_table_data
 from .core import (
     create_table,
+    create_index,
     drop_table,
     list_tables,
+    compact as core_compact,
+    count_rows as core_count_rows,
+    convert_storage as core_convert_storage,
     insert as core_insert,
-    select as core_select,
+    insert_many as core_insert_many,
+    iter_select as core_iter_select,
+    iter_select_join as core_iter_select_join,
+    load_file as core_load_file,
     update as core_update,
     delete as core_delete,
+    explain as core_explain,
+    flush_writes,
+    set_deferred_writes,
+    begin_transaction,
+    commit_transaction,
+    rollback_transaction,
+    in_transaction,
 )
-from .parser import parse_where, parse_set, parse_values_list
+from .plans import prepare
 
 def print_help():
     print("\n🗄️  Примитивная база данных (CLI)")
     print("=" * 42)
-    print("create_table <name> <col:type> ... — создать таблицу")
-    print("insert into <table> values (...)   — добавить запись")
-    print("select from <table> [where ...]    — показать записи")
+    print("create_table <name> <col:type> ... [partition by <col|ID> [N]] — создать таблицу")
+    print("create index <table> <column>      — создать индекс по столбцу")
+    print("insert into <table> values (...)   — добавить запись(и): (...), (...)")
+    print("load <table> from <file.csv|jsonl> — загрузить записи из файла")
+    print("select [cols] from <table> [where ...] [group by ...] [order by ...] [limit n] [offset n]")
+    print("                                   — показать записи (cols: столбцы, count/sum/min/max/avg)")
     print("update <table> set ... where ...   — обновить данные")
     print("delete from <table> where ...      — удалить запись")
+    print("select ... from <a> join <b> on <a.x> = <b.y> [where ...] — соединение таблиц")
     print("info <table>                       — инфо о таблице")
+    print("compact <table>                    — свернуть журнал в файл таблицы")
+    print("convert <table> <json|columnar>    — сменить формат хранения")
     print("list_tables                        — список таблиц")
     print("drop_table <name>                  — удалить таблицу")
+    print("explain <select|update|delete ...> — план выполнения без выполнения")
+    print("profile <команда>                  — выполнить под cProfile и tracemalloc")
+    print("stats [json|prometheus|reset|on|off] — метрики по фазам и счётчики")
+    print("parallel [N|off]                   — проверка WHERE и агрегаты в N процессах")
+    print("begin                              — начать транзакцию")
+    print("commit                             — зафиксировать транзакцию / записать отложенные изменения")
+    print("rollback                           — отменить изменения транзакции")
     print("help                               — справка")
     print("exit                               — выход\n")
 
-def _get_columns_from_metadata(metadata, table_name):
-    """Возвращает список пар (name, type) как в core.create_table."""
-    tables = metadata.get("tables", {})
-    if table_name not in tables:
-        raise KeyError(f'Таблица "{table_name}" не существует.')
-    cols = tables[table_name].get("columns")
-    if not isinstance(cols, list) or not cols:
-        raise ValueError(f'У таблицы "{table_name}" отсутствует корректная схема.')
-    return cols
+# формат вывода результата select: table — страницами по RENDER_PAGE_ROWS строк, csv/jsonl — построчно
+_output = {"format": "table"}
 
 
-def _render_select(rows, columns):
-    """Печатает результат SELECT в виде таблицы."""
-    headers = [c[0] for c in columns]
-    table = PrettyTable()
-    table.field_names = headers
-    for row in rows:
-        table.add_row([row.get(col, "") for col in headers])
-    print(table)
-
-
-def _handle_insert(metadata, raw_line):
-    # Формат: insert into <table> values ("str with spaces", 123, true)
-    parts = shlex.split(raw_line, posix=True)
-    if len(parts) < 4 or parts[0].lower() != "insert" or parts[1].lower() != "into":
-        raise ValueError("Некорректная команда INSERT. Ожидается: insert into <table> values (<значения>)")
+def set_output_format(fmt):
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Неизвестный формат вывода: {fmt}. Доступны: {', '.join(OUTPUT_FORMATS)}")
+    _output["format"] = fmt
 
-    table_name = parts[2]
 
-    low = raw_line.lower()
-    vidx = low.find("values")
-    if vidx == -1:
-        raise ValueError("Отсутствует секция values(...)")
-
-    payload = raw_line[vidx + len("values"):].strip()
-    if payload.startswith("(") and payload.endswith(")"):
-        payload = payload[1:-1].strip()
+def _render_table(rows, headers):
+    """
+    Таблица страницами: в памяти не больше одной страницы, вывод начинается
+    сразу. Ширина столбцов не уменьшается от страницы к странице.
+    """
+    widths = {name: len(name) for name in headers}
+    first = True
+    while True:
+        page = [[row.get(col, "") for col in headers] for row in islice(rows, RENDER_PAGE_ROWS)]
+        if not page and not first:
+            break
+        for values in page:
+            for name, value in zip(headers, values):
+                widths[name] = max(widths[name], len(str(value)))
+        table = PrettyTable()
+        table.field_names = headers
+        table.min_width = widths
+        table.add_rows(page)
+        print(table, flush=True)
+        first = False
+        if len(page) < RENDER_PAGE_ROWS:
+            break
 
-    values = parse_values_list(payload)
 
-    updated = core_insert(metadata, table_name, values)
-    if updated is None:
-        return
-    save_table_data(table_name, updated)
-
-    last_id = max((r.get("ID", 0) for r in updated), default=0)
-    print(f'Запись с ID={last_id} успешно добавлена в таблицу "{table_name}".')
+def _render_select(rows, columns):
+    """Печатает результат SELECT по мере получения строк (rows — итератор)."""
+    with metrics.phase("render"):
+        _render_rows(rows, columns)
 
 
-def _handle_select(metadata, raw_line):
-    # Формат: select from <table> [where <expr>]
+def _render_rows(rows, columns):
+    headers = [c[0] for c in columns]
+    rows = iter(rows)
+    fmt = _output["format"]
+    if fmt == "csv":
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow([row.get(col, "") for col in headers])
+    elif fmt == "jsonl":
+        for row in rows:
+            sys.stdout.write(json.dumps({col: row.get(col) for col in headers}, ensure_ascii=False) + "\n")
+    else:
+        _render_table(rows, headers)
+
+
+def _report_inserted(table_name, added):
+    if len(added) == 1:
+        print(f'Запись с ID={added[0].get("ID", 0)} успешно добавлена в таблицу "{table_name}".')
+    else:
+        first, last = added[0].get("ID", 0), added[-1].get("ID", 0)
+        print(f'Добавлено {len(added)} записей (ID={first}..{last}) в таблицу "{table_name}".')
+
+
+def _handle_insert(catalog, query):
+    # Формат: insert into <table> values ("str with spaces", 123, true)[, (...), ...]
+    table_name, tuples = query["table"], query["values"]
+    metadata = catalog.current()
+    if len(tuples) == 1:
+        updated = core_insert(metadata, table_name, tuples[0])
+        if updated is None:
+            return
+        added = updated[-1:]
+    else:
+        added = core_insert_many(metadata, table_name, tuples)
+        if added is None:
+            return
+
+    _report_inserted(table_name, added)
+
+
+def _handle_load(catalog, raw_line):
+    # Формат: load <table> from <file.csv|file.jsonl>
     parts = shlex.split(raw_line, posix=True)
-    if len(parts) < 3 or parts[0].lower() != "select" or parts[1].lower() != "from":
-        raise ValueError("Некорректная команда SELECT. Ожидается: select from <table> [where <условие>]")
+    if len(parts) != 4 or parts[0].lower() != "load" or parts[2].lower() != "from":
+        raise ValueError("Некорректная команда LOAD. Ожидается: load <table> from <file.csv|file.jsonl>")
 
-    table_name = parts[2]
+    table_name, path = parts[1], parts[3]
+    added = core_load_file(catalog.current(), table_name, path)
+    if added is None:
+        return
+    _report_inserted(table_name, added)
 
-    where_clause = None
-    low = raw_line.lower()
-    widx = low.find(" where ")
-    if widx != -1:
-        expr = raw_line[widx + len(" where "):].strip()
-        where_clause = parse_where(expr)
 
-    try:
-        columns = _get_columns_from_metadata(metadata, table_name)
-    except KeyError as e:
-        print(f"Ошибка: {e.args[0]}")
-        return
-    except ValueError as e:
-        print(str(e))
+def _handle_select(catalog, query):
+    # Формат: select [<столбцы>|*] from <table> [where <expr>] [order by ...] [limit n] [offset n]
+    table_name = query["table"]
+    if query["join"] is not None:
+        _handle_join(catalog, query)
         return
 
-    rows = load_table_data(table_name)
-    result = core_select(rows, where_clause)
+    columns = result_columns(catalog, query)
+    result = core_iter_select(
+        catalog.current(),
+        table_name,
+        query["where"],
+        columns=query["columns"],
+        order_by=query["order_by"],
+        limit=query["limit"],
+        offset=query["offset"],
+        group_by=query["group_by"],
+    )
     if result is None:
         return
-
     _render_select(result, columns)
 
 
-def _handle_update(metadata, raw_line):
-    # Формат: update <table> set <...> where <...>
-    parts = shlex.split(raw_line, posix=True)
-    if len(parts) < 5 or parts[0].lower() != "update":
-        raise ValueError("Некорректная команда UPDATE. Ожидается: update <table> set <...> where <...>")
-
-    table_name = parts[1]
-
-    low = raw_line.lower()
-    sidx = low.find(" set ")
-    widx = low.find(" where ")
-    if sidx == -1 or widx == -1 or widx < sidx:
-        raise ValueError("Для UPDATE требуются секции SET и WHERE.")
-
-    set_expr = raw_line[sidx + len(" set "): widx].strip()
-    where_expr = raw_line[widx + len(" where "):].strip()
+def _handle_join(catalog, query):
+    # Формат: select [<столбцы>] from <a> join <b> on <a.x> = <b.y> [where ...] [order by ...] [limit n] [offset n]
+    if query["group_by"]:
+        raise ValueError("GROUP BY по соединению таблиц не поддерживается.")
+    left, right = query["table"], query["join"]["table"]
+    result = core_iter_select_join(
+        catalog.current(),
+        left,
+        right,
+        query["join"]["on"],
+        query["where"],
+        columns=query["columns"],
+        order_by=query["order_by"],
+        limit=query["limit"],
+        offset=query["offset"],
+    )
+    if result is None:
+        return
+    _render_select(result, result_columns(catalog, query))
 
-    set_clause = parse_set(set_expr)
-    where_clause = parse_where(where_expr)
 
-    rows = load_table_data(table_name)
-    updated = core_update(rows, set_clause, where_clause)
+def _handle_update(catalog, query):
+    # Формат: update <table> set <...> where <...>
+    table_name = query["table"]
+    updated = core_update(catalog.current(), table_name, query["set"], query["where"])
     if updated is None:
         return
-    save_table_data(table_name, updated)
     print(f'Запись(и) в таблице "{table_name}" успешно обновлена(ы).')
 
 
-def _handle_delete(metadata, raw_line):
+def _handle_delete(catalog, query):
     # Формат: delete from <table> where <...>
-    parts = shlex.split(raw_line, posix=True)
-    if len(parts) < 4 or parts[0].lower() != "delete" or parts[1].lower() != "from":
-        raise ValueError("Некорректная команда DELETE. Ожидается: delete from <table> where <условие>")
-
-    table_name = parts[2]
+    table_name = query["table"]
+    updated = core_delete(catalog.current(), table_name, query["where"])
+    if updated is None:
+        return
 
-    low = raw_line.lower()
-    widx = low.find(" where ")
-    if widx == -1:
-        raise ValueError("Для DELETE требуется секция WHERE.")
+    print(f'Запись(и) успешно удалена(ы) из таблицы "{table_name}".')
 
-    where_expr = raw_line[widx + len(" where "):].strip()
-    where_clause = parse_where(where_expr)
 
-    rows = load_table_data(table_name)
-    updated = core_delete(rows, where_clause)
-    if updated is None:
+def _handle_explain(catalog, query, cached):
+    # Формат: explain <select|update|delete ...>
+    lines = core_explain(catalog.current(), query["statement"])
+    if lines is None:
         return
-    save_table_data(table_name, updated)
+    for line in lines:
+        print(line)
+    print(f"  разбор оператора: {'из кэша' if cached else 'новый'}")
+
+
+_STATEMENTS = {
+    "select": _handle_select,
+    "insert": _handle_insert,
+    "update": _handle_update,
+    "delete": _handle_delete,
+}
 
-    print(f'Запись(и) успешно удалена(ы) из таблицы "{table_name}".')
 
+def execute_statement(catalog, statement, *params):
+    """Выполняет подготовленный оператор (plans.prepare), подставляя params вместо ? по порядку."""
+    query = statement.bind(*params)
+    metrics.count("statements")
+    if query["kind"] == "explain":
+        _handle_explain(catalog, query, statement.cached)
+    else:
+        _STATEMENTS[query["kind"]](catalog, query)
 
-def _handle_info(metadata, raw_line):
+
+def _reject(message):
+    """Сообщение о некорректной команде; в скриптовом режиме команда считается ошибочной."""
+    print(message)
+    note_failure()
+
+
+def _handle_info(catalog, raw_line):
     # Формат: info <table>
     parts = shlex.split(raw_line, posix=True)
     if len(parts) != 2 or parts[0].lower() != "info":
         raise ValueError("Некорректная команда INFO. Ожидается: info <table>")
 
     table_name = parts[1]
-    columns = _get_columns_from_metadata(metadata, table_name)
-    rows = load_table_data(table_name)
+    metadata = catalog.current()
+    columns = catalog.schema(table_name)["columns"]
+    count = core_count_rows(metadata, table_name)
+    if count is None:
+        return
     cols_str = ", ".join([f"{name}:{typ}" for (name, typ) in columns])
+    storage = metadata["tables"][table_name].get("storage", "json")
     print(f"Таблица: {table_name}")
     print(f"Столбцы: {cols_str}")
-    print(f"Количество записей: {len(rows)}")
+    print(f"Формат хранения: {storage}")
+    print(f"Раскладка: {segments.describe(metadata['tables'][table_name].get('segments'))}")
+    print(f"Количество записей: {count}")
+
+
+def _print_stats(mode):
+    if mode == "on":
+        metrics.set_enabled(True)
+        print("Сбор метрик включён.")
+    elif mode == "off":
+        metrics.set_enabled(False)
+        print("Сбор метрик выключен.")
+    elif mode == "reset":
+        metrics.reset()
+        print("Метрики сброшены.")
+    elif mode == "json":
+        print(metrics.to_json_line())
+    elif mode == "prometheus":
+        print(metrics.to_prometheus(), end="")
+    elif mode is None:
+        if not metrics.enabled():
+            print("Сбор метрик выключен: stats on или DB_METRICS=1.")
+        snap = metrics.snapshot()
+        table = PrettyTable()
+        table.field_names = ["фаза", "вызовов", "всего, мс", "максимум, мс"]
+        for name, entry in snap["phases"].items():
+            table.add_row([name, entry["calls"], f"{entry['seconds'] * 1000:.2f}", f"{entry['max_seconds'] * 1000:.2f}"])
+        print(table)
+        for name, value in snap["counters"].items():
+            print(f"{name}: {value}")
+    else:
+        _reject("Некорректное значение: ожидается stats [json|prometheus|reset|on|off]. Попробуйте снова.")
+
+
+def execute(catalog, raw):
+    """Выполняет одну команду. Возвращает False, если нужно завершить работу."""
+    head = raw.split(None, 1)[0].lower() if raw.strip() else ""
+    if head == "profile":
+        # Формат: profile <команда> — команда выполняется как обычно, затем печатается профиль
+        rest = raw.split(None, 1)[1] if len(raw.split(None, 1)) == 2 else ""
+        if not rest:
+            _reject("Некорректное значение: ожидается profile <команда>. Попробуйте снова.")
+            return True
+        result, report = metrics.capture(lambda: execute(catalog, rest))
+        print(report, end="")
+        return result
+    if head in STATEMENT_WORDS:
+        # операторы с данными разбирает свой токенизатор, shlex не нужен
+        execute_statement(catalog, prepare(raw))
+        return True
 
+    try:
+        args = shlex.split(raw, posix=True)
+    except ValueError:
+        _reject("Некорректное значение: парсинг команды. Попробуйте снова.")
+        return True
 
-def run():
-    print("***База данных***")
-    if SHOW_HELP:
-        print_help()
+    if not args:
+        return True
 
-    while True:
-        try:
-            raw = input(">>>Введите команду: ").strip()
-        except (EOFError, KeyboardInterrupt):
-            print()
-            break
+    args[0] = args[0].lower()
 
-        if not raw:
-            continue
+    if len(args) >= 2:
+        if args[0] == "create" and args[1].lower() == "table":
+            args = ["create_table"] + args[2:]
+        elif args[0] == "create" and args[1].lower() == "index":
+            args = ["create_index"] + args[2:]
+        elif args[0] == "drop" and args[1].lower() == "table":
+            args = ["drop_table"] + args[2:]
 
-        try:
-            args = shlex.split(raw, posix=True)
-        except ValueError:
-            print("Некорректное значение: парсинг команды. Попробуйте снова.")
-            continue
+    cmd = args[0]
 
-        if not args:
-            continue
+    if cmd == "create_table":
+        if len(args) < 2:
+            _reject("Некорректное значение: отсутствует имя таблицы. Попробуйте снова.")
+            return True
 
-        args[0] = args[0].lower()
+        table_name = args[1]
+        column_specs = args[2:]
 
-        if len(args) >= 2:
-            if args[0] == "create" and args[1].lower() == "table":
-                args = ["create_table"] + args[2:]
-            elif args[0] == "drop" and args[1].lower() == "table":
-                args = ["drop_table"] + args[2:]
+        with catalog.locked(table_name) as metadata:
+            updated_meta = create_table(metadata, table_name, column_specs)
+            if updated_meta is None:
+                return True
 
-        cmd = args[0]
+            catalog.save()
+            table_meta = updated_meta["tables"][table_name]
+            save_table_data(table_name, [], table_meta["storage"], table_meta["columns"], table_meta.get("segments"))
 
-        if cmd == "create_table":
-            if len(args) < 2:
-                print("Некорректное значение: отсутствует имя таблицы. Попробуйте снова.")
-                continue
+        cols = table_meta["columns"]
+        cols_text = ", ".join(f"{n}:{t}" for n, t in cols)
+        print(f'Таблица "{table_name}" успешно создана со столбцами: {cols_text}')
 
-            table_name = args[1]
-            column_specs = args[2:]
+    elif cmd == "create_index":
+        if len(args) != 3:
+            _reject("Некорректное значение: ожидается create index <table> <column>. Попробуйте снова.")
+            return True
 
-            metadata = load_metadata(META_FILE)
-            updated_meta = create_table(metadata, table_name, column_specs)
+        table_name, column = args[1], args[2]
+        with catalog.locked(table_name) as metadata:
+            updated_meta = create_index(metadata, table_name, column)
             if updated_meta is None:
-                continue
-
-            save_metadata(META_FILE, updated_meta)
-            save_table_data(table_name, [])
+                # операция могла частично изменить метаданные в памяти
+                catalog.invalidate()
+                return True
 
-            cols = updated_meta["tables"][table_name]["columns"]
-            cols_text = ", ".join(f"{n}:{t}" for n, t in cols)
-            print(f'Таблица "{table_name}" успешно создана со столбцами: {cols_text}')
+            catalog.save()
+        print(f'Индекс по столбцу "{column}" таблицы "{table_name}" успешно создан.')
 
-        elif cmd == "drop_table":
-            if len(args) != 2:
-                print("Некорректное значение: неверное количество аргументов. Попробуйте снова.")
-                continue
+    elif cmd == "drop_table":
+        if len(args) != 2:
+            _reject("Некорректное значение: неверное количество аргументов. Попробуйте снова.")
+            return True
 
-            table_name = args[1]
-            metadata = load_metadata(META_FILE)
+        table_name = args[1]
+        with catalog.locked(table_name) as metadata:
             updated_meta = drop_table(metadata, table_name)
             if updated_meta is None:
-                continue
+                # операция могла частично изменить метаданные в памяти
+                catalog.invalidate()
+                return True
 
-            save_metadata(META_FILE, updated_meta)
-            print(f'Таблица "{table_name}" успешно удалена.')
+            catalog.save()
+        print(f'Таблица "{table_name}" успешно удалена.')
 
-        elif cmd == "list_tables":
-            metadata = load_metadata(META_FILE)
-            names = list_tables(metadata) or []
-            for n in names:
-                print(f"- {n}")
+    elif cmd == "list_tables":
+        names = list_tables(catalog.current()) or []
+        for n in names:
+            print(f"- {n}")
 
-        elif cmd == "insert":
-            metadata = load_metadata(META_FILE)
-            _handle_insert(metadata, raw)
+    elif cmd == "load":
+        _handle_load(catalog, raw)
 
-        elif cmd == "select":
-            metadata = load_metadata(META_FILE)
-            _handle_select(metadata, raw)
+    elif cmd == "info":
+        _handle_info(catalog, raw)
 
-        elif cmd == "update":
-            metadata = load_metadata(META_FILE)
-            _handle_update(metadata, raw)
+    elif cmd == "compact":
+        if len(args) != 2:
+            _reject("Некорректное значение: неверное количество аргументов. Попробуйте снова.")
+            return True
 
-        elif cmd == "delete":
-            metadata = load_metadata(META_FILE)
-            _handle_delete(metadata, raw)
+        if core_compact(catalog.current(), args[1]) is not None:
+            print(f'Журнал таблицы "{args[1]}" свёрнут в основной файл.')
 
-        elif cmd == "info":
-            metadata = load_metadata(META_FILE)
-            _handle_info(metadata, raw)
+    elif cmd == "convert":
+        if len(args) != 3:
+            _reject("Некорректное значение: ожидается convert <table> <json|columnar>. Попробуйте снова.")
+            return True
 
-        elif cmd == "help":
-            print_help()
+        table_name, storage = args[1], args[2].lower()
+        with catalog.locked(table_name) as metadata:
+            updated_meta = core_convert_storage(metadata, table_name, storage)
+            if updated_meta is None:
+                # операция могла частично изменить метаданные в памяти
+                catalog.invalidate()
+                return True
 
-        elif cmd == "exit":
-            break
+            catalog.save()
+        print(f'Таблица "{table_name}" переведена в формат {storage}.')
+
+    elif cmd == "begin":
+        begin_transaction()
+        print("Транзакция начата.")
 
+    elif cmd == "commit":
+        if in_transaction():
+            commit_transaction()
+            print("Транзакция зафиксирована.")
         else:
-            print(f"Функции {cmd} нет. Попробуйте снова.")
+            flush_writes()
+        catalog.flush()
+
+    elif cmd == "rollback":
+        rollback_transaction()
+        print("Транзакция отменена.")
+
+    elif cmd == "parallel":
+        if len(args) == 1:
+            state = f"процессов — {parallel.workers()}" if parallel.workers() > 1 else "выключен"
+            print(f"Параллельный проход: {state}.")
+            return True
+        value = args[1].lower()
+        if len(args) != 2 or not (value == "off" or value.isdigit()):
+            _reject("Некорректное значение: ожидается parallel <число процессов|off>. Попробуйте снова.")
+            return True
+        parallel.set_workers(0 if value == "off" else int(value))
+        print("Параллельный проход выключен." if parallel.workers() <= 1 else
+              f"Параллельный проход: процессов — {parallel.workers()}, для таблиц от {parallel.min_rows()} строк.")
+
+    elif cmd == "stats":
+        if len(args) > 2:
+            _reject("Некорректное значение: ожидается stats [json|prometheus|reset|on|off]. Попробуйте снова.")
+            return True
+        _print_stats(args[1].lower() if len(args) == 2 else None)
+
+    elif cmd == "help":
+        print_help()
+
+    elif cmd == "exit":
+        return False
+
+    else:
+        _reject(f"Функции {cmd} нет. Попробуйте снова.")
+
+    return True
+
+
+def _start_session():
+    for message in recover_data_files(meta_path()):
+        print(f"Восстановление: {message}")
+    return Catalog(meta_path())
+
+
+def _abort_transaction():
+    """Незафиксированная к концу сессии транзакция отменяется."""
+    if in_transaction():
+        rollback_transaction()
+        print("Незавершённая транзакция отменена.")
+
+
+def run():
+    print("***База данных***")
+    if SHOW_HELP:
+        print_help()
+
+    catalog = _start_session()
+
+    while True:
+        try:
+            raw = input(">>>Введите команду: ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+
+        if not raw:
+            continue
+
+        try:
+            if not execute(catalog, raw):
+                break
+        except (KeyError, ValueError) as e:
+            # ошибки разбора команды (WHERE, SELECT, VALUES) не завершают сессию
+            print(f"Ошибка: {e.args[0] if e.args else e}")
+
+    _abort_transaction()
+
+
+def _script_statements(stream):
+    """Строки скрипта без пустых строк и комментариев (# или --); ';' в конце необязательна."""
+    for num, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line or line.startswith(("#", "--")):
+            continue
+        if line.endswith(";"):
+            line = line[:-1].rstrip()
+        if line:
+            yield num, line
+
+
+def run_script(stream, assume_yes=False):
+    """
+    Выполняет команды из потока без приглашений ввода. Таблицы и метаданные
+    держатся в памяти, на диск изменения попадают по команде commit и в конце.
+    Без assume_yes операции, требующие подтверждения, отменяются.
+    Возвращает количество команд, завершившихся ошибкой.
+    """
+    catalog = _start_session()
+    set_confirm_policy("yes" if assume_yes else "no")
+    set_deferred_writes(True)
+    catalog.deferred = True
+    errors = 0
+    try:
+        for num, raw in _script_statements(stream):
+            # ошибки, перехваченные декораторами core, и отменённые операции уже напечатаны
+            failed = failure_count()
+            try:
+                if not execute(catalog, raw):
+                    break
+            except (KeyError, ValueError) as e:
+                errors += 1
+                msg = e.args[0] if e.args else e
+                print(f"Ошибка (строка {num}): {msg}")
+            else:
+                if failure_count() != failed:
+                    errors += 1
+                    print(f"Строка {num}: команда не выполнена.")
+    finally:
+        _abort_transaction()
+        set_confirm_policy("ask")
+        catalog.deferred = False
+        # отложенные изменения скрипта: конфликт с другим процессом — ошибка скрипта, а не сбой
+        try:
+            set_deferred_writes(False)
+        except ValueError as e:
+            errors += 1
+            print(f"Ошибка при записи изменений скрипта: {e}")
+        try:
+            catalog.flush()
+        except OSError as e:
+            errors += 1
+            print(f"Ошибка при записи метаданных: {e}")
+    return errors
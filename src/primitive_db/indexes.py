@@ -0,0 +1,117 @@
+# Вторичные хеш-индексы: значение столбца -> множество ID строк
+from bisect import bisect_left, bisect_right
+
+from .constants import ID_COL
+
+
+class ColumnIndex(dict):
+    """
+    Индекс одного столбца {значение: {ID, ...}}. Для диапазонных условий
+    держит отсортированный список значений; он строится при первом
+    диапазонном запросе и сбрасывается, когда набор значений меняется.
+    """
+
+    __slots__ = ("_sorted",)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._sorted = None
+
+    def __setitem__(self, value, ids):
+        if value not in self:
+            self._sorted = None
+        super().__setitem__(value, ids)
+
+    def __delitem__(self, value):
+        super().__delitem__(value)
+        self._sorted = None
+
+    def sorted_values(self):
+        if self._sorted is None:
+            self._sorted = sorted(self)
+        return self._sorted
+
+
+def build_indexes(rows, columns):
+    """Строит индексы {столбец: {значение: {ID, ...}}} по списку строк."""
+    indexes = {col: ColumnIndex() for col in columns}
+    for row in rows:
+        add_row(indexes, row)
+    return indexes
+
+
+def add_row(indexes, row):
+    rid = row.get(ID_COL)
+    for col, idx in indexes.items():
+        value = row.get(col)
+        ids = idx.get(value)
+        if ids is None:
+            idx[value] = ids = set()
+        ids.add(rid)
+
+
+def remove_row(indexes, row):
+    rid = row.get(ID_COL)
+    for col, idx in indexes.items():
+        value = row.get(col)
+        ids = idx.get(value)
+        if ids is None:
+            continue
+        ids.discard(rid)
+        if not ids:
+            del idx[value]
+
+
+def range_lookup(idx, op, value):
+    """ID строк, у которых значение столбца удовлетворяет op ("<", "<=", ">", ">=") value."""
+    try:
+        values = idx.sorted_values()
+        if op == "<":
+            selected = values[:bisect_left(values, value)]
+        elif op == "<=":
+            selected = values[:bisect_right(values, value)]
+        elif op == ">":
+            selected = values[bisect_right(values, value):]
+        else:
+            selected = values[bisect_left(values, value):]
+    except TypeError:
+        # в столбце значения несравнимых типов — диапазон по индексу не построить
+        return None
+    return set().union(*(idx[v] for v in selected))
+
+
+def lookup(indexes, terms):
+    """
+    Возвращает множество ID-кандидатов для простых условий WHERE
+    [(столбец, оп, значение)] по индексированным столбцам (пересечение
+    по всем таким условиям) или None, если индекс не применим.
+    Поддерживаются равенства, IN и диапазоны.
+    """
+    result = None
+    for col, op, value in terms:
+        idx = indexes.get(col)
+        if idx is None:
+            continue
+        if op == "=":
+            ids = idx.get(value, set())
+        elif op == "in":
+            ids = set().union(*(idx[v] for v in value if v in idx))
+        elif op in ("<", "<=", ">", ">="):
+            ids = range_lookup(idx, op, value)
+            if ids is None:
+                continue
+        else:
+            continue
+        result = set(ids) if result is None else result & ids
+        if not result:
+            break
+    return result
+
+
+def dump_indexes(indexes):
+    """Приводит индексы к JSON-совместимому виду (ключи JSON — только строки)."""
+    return {col: [[value, sorted(ids)] for value, ids in idx.items()] for col, idx in indexes.items()}
+
+
+def restore_indexes(data):
+    return {col: ColumnIndex({value: set(ids) for value, ids in pairs}) for col, pairs in data.items()}
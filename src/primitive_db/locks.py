@@ -0,0 +1,71 @@
+# Межпроцессные блокировки чтения/записи на flock: по таблице и по файлу метаданных
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # нет flock (Windows): блокировки не выполняются
+    fcntl = None
+
+from .constants import LOCK_SUFFIX
+
+# у каждого потока свои дескрипторы: flock на разных открытых файлах
+# исключает друг друга и между потоками одного процесса
+_local = threading.local()
+
+
+def _held():
+    held = getattr(_local, "held", None)
+    if held is None:
+        held = _local.held = {}
+    return held
+
+
+@contextmanager
+def file_lock(path, exclusive=False):
+    """
+    Блокировка path + LOCK_SUFFIX: разделяемая (читатели) или исключительная (писатель).
+    Повторный вход в том же потоке не блокирует; разделяемую блокировку нельзя
+    повысить до исключительной — порядок захвата должен это исключать.
+    """
+    if fcntl is None:
+        yield
+        return
+    held = _held()
+    entry = held.get(path)
+    if entry is not None:
+        if exclusive and not entry["exclusive"]:
+            raise RuntimeError(f"Нельзя повысить блокировку чтения до записи: {path}")
+        entry["depth"] += 1
+        try:
+            yield
+        finally:
+            entry["depth"] -= 1
+        return
+
+    fd = os.open(path + LOCK_SUFFIX, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    except BaseException:
+        os.close(fd)
+        raise
+    held[path] = {"exclusive": exclusive, "depth": 1}
+    try:
+        yield
+    finally:
+        del held[path]
+        # закрытие дескриптора снимает flock
+        os.close(fd)
+
+
+def table_lock(table_name, exclusive=False):
+    """Блокировка таблицы (основной файл, журнал, индексы)."""
+    from .utils import table_lock_path
+    return file_lock(table_lock_path(table_name), exclusive)
+
+
+def meta_lock():
+    """Исключительная блокировка метаданных; захватывается после блокировок таблиц."""
+    from .utils import meta_path
+    return file_lock(meta_path(), exclusive=True)
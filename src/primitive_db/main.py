@@ -1,9 +1,63 @@
 #!/usr/bin/env python3
-from .engine import run
+import argparse
+import sys
 
-def main():
+from . import metrics
+from .durability import LEVELS, set_level
+from .constants import OUTPUT_FORMATS
+from .engine import run, run_script, set_output_format
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog="database", description="Примитивная база данных")
+    parser.add_argument("-f", "--file", help="выполнить команды из файла ('-' — из stdin) и выйти")
+    parser.add_argument("-y", "--yes", action="store_true", help="подтверждать удаление без вопроса")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, help="вывод select: таблица страницами, csv или jsonl")
+    parser.add_argument("--durability", choices=LEVELS, help="уровень надёжности записи (см. DB_DURABILITY)")
+    parser.add_argument(
+        "--metrics", choices=("json", "prometheus"),
+        help="собирать метрики и при выходе вывести их в stderr (JSON-строка или формат Prometheus)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """Точка входа для программы базы данных."""
-    run()
+    argv = sys.argv[1:] if argv is None else argv
+    # сетевой режим: database serve ... / database client ...
+    if argv[:1] == ["serve"]:
+        from .server import main as serve_main
+        return serve_main(argv[1:])
+    if argv[:1] == ["client"]:
+        from .client import main as client_main
+        return client_main(argv[1:])
+    args = _parse_args(argv)
+    if args.durability:
+        set_level(args.durability)
+    if args.format:
+        set_output_format(args.format)
+    if args.metrics:
+        metrics.set_enabled(True)
+    try:
+        return _run(args)
+    finally:
+        if args.metrics == "json":
+            print(metrics.to_json_line(), file=sys.stderr)
+        elif args.metrics == "prometheus":
+            sys.stderr.write(metrics.to_prometheus())
+
+
+def _run(args):
+    # скриптовый режим: явный файл или ввод не с терминала
+    if args.file and args.file != "-":
+        with open(args.file, "r", encoding="utf-8") as f:
+            errors = run_script(f, assume_yes=args.yes)
+    elif args.file == "-" or not sys.stdin.isatty():
+        errors = run_script(sys.stdin, assume_yes=args.yes)
+    else:
+        run()
+        return 0
+    return 1 if errors else 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,195 @@
+# Метрики выполнения: время по фазам, счётчики строк и байтов, профилирование одного оператора
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+from time import perf_counter
+
+from .constants import METRICS_ENABLED
+
+PHASES = ("parse", "load", "filter", "mutate", "serialize", "render")
+COUNTERS = ("statements", "rows_scanned", "rows_returned", "bytes_read", "bytes_written", "blocks_skipped")
+
+_state = {"enabled": METRICS_ENABLED}
+# фаза -> [вызовов, секунд, максимум секунд за вызов]
+_phases = {name: [0, 0.0, 0.0] for name in PHASES}
+_counters = dict.fromkeys(COUNTERS, 0)
+# открытые замеры: время вложенной фазы не входит во внешнюю; у каждого потока
+# свой стек (сервер выполняет операторы в потоках)
+_local = threading.local()
+_NULL = nullcontext()
+
+
+def enabled():
+    return _state["enabled"]
+
+
+def set_enabled(flag):
+    _state["enabled"] = bool(flag)
+
+
+def reset():
+    for entry in _phases.values():
+        entry[:] = [0, 0.0, 0.0]
+    for name in _counters:
+        _counters[name] = 0
+
+
+def _record(name, seconds):
+    entry = _phases[name]
+    entry[0] += 1
+    entry[1] += seconds
+    if seconds > entry[2]:
+        entry[2] = seconds
+
+
+class _Timer:
+    __slots__ = ("name", "start", "inner")
+
+    def __init__(self, name):
+        self.name = name
+        self.inner = 0.0
+
+    def __enter__(self):
+        self.inner = 0.0
+        _frames().append(self)
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self.start
+        stack = _frames()
+        stack.pop()
+        if stack:
+            stack[-1].inner += elapsed
+        _record(self.name, elapsed - self.inner)
+
+
+def _frames():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def phase(name):
+    """Контекст замера фазы; при выключенных метриках — общий пустой контекст."""
+    return _Timer(name) if _state["enabled"] else _NULL
+
+
+def count(name, value=1):
+    if _state["enabled"]:
+        _counters[name] += value
+
+
+def timed_iter(name, iterator):
+    """
+    Итератор, время выдачи элементов которого относится к фазе name
+    (ленивые конвейеры: строки фильтруются по мере чтения при выводе).
+    """
+    if not _state["enabled"]:
+        return iterator
+    return _timed_iter(name, iter(iterator))
+
+
+def _timed_iter(name, iterator):
+    frame = _Timer(name)
+    total = 0.0
+    try:
+        while True:
+            frame.inner = 0.0
+            stack = _frames()
+            stack.append(frame)
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed = perf_counter() - start
+                stack.pop()
+                if stack:
+                    stack[-1].inner += elapsed
+                total += elapsed - frame.inner
+            yield item
+    finally:
+        _record(name, total)
+
+
+def counted(iterator, name):
+    """Итератор, число выданных элементов которого прибавляется к счётчику name."""
+    if not _state["enabled"]:
+        return iterator
+    return _counted(iterator, name)
+
+
+def _counted(iterator, name):
+    seen = 0
+    try:
+        for item in iterator:
+            seen += 1
+            yield item
+    finally:
+        _counters[name] += seen
+
+
+def snapshot():
+    """{"phases": {фаза: {"calls", "seconds", "max_seconds"}}, "counters": {...}}."""
+    return {
+        "phases": {
+            name: {"calls": calls, "seconds": seconds, "max_seconds": peak}
+            for name, (calls, seconds, peak) in _phases.items()
+        },
+        "counters": dict(_counters),
+    }
+
+
+def to_json_line():
+    """Снимок одной JSON-строкой с отметкой времени (для дозаписи в файл)."""
+    return json.dumps({"time": time.time(), **snapshot()}, ensure_ascii=False)
+
+
+def to_prometheus():
+    """Снимок в текстовом формате Prometheus."""
+    lines = []
+    for metric, index, help_text in (
+        ("phase_seconds_total", 1, "Время выполнения по фазам"),
+        ("phase_calls_total", 0, "Число замеров фазы"),
+    ):
+        lines.append(f"# HELP primitive_db_{metric} {help_text}")
+        lines.append(f"# TYPE primitive_db_{metric} counter")
+        for name, entry in _phases.items():
+            lines.append(f'primitive_db_{metric}{{phase="{name}"}} {entry[index]}')
+    for name, value in _counters.items():
+        lines.append(f"# TYPE primitive_db_{name}_total counter")
+        lines.append(f"primitive_db_{name}_total {value}")
+    return "\n".join(lines) + "\n"
+
+
+def capture(fn, top=15):
+    """
+    Выполняет fn() под cProfile и tracemalloc. Возвращает (результат, отчёт):
+    функции с наибольшим накопленным временем, пик памяти и места выделения.
+    """
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        profiler.enable()
+        try:
+            result = fn()
+        finally:
+            profiler.disable()
+        current, peak = tracemalloc.get_traced_memory()
+        allocations = tracemalloc.take_snapshot().statistics("lineno")[:5]
+    finally:
+        tracemalloc.stop()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+    out.write(f"Память: пик {peak / 1024:.1f} КБ, осталось выделено {current / 1024:.1f} КБ\n")
+    for stat in allocations:
+        out.write(f"  {stat}\n")
+    return result, out.getvalue()
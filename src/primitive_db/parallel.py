@@ -0,0 +1,171 @@
+# Параллельный проход по строкам в памяти: WHERE и частичные агрегаты в пуле процессов
+import atexit
+import multiprocessing
+import os
+import threading
+from contextlib import contextmanager
+from itertools import compress
+
+from .aggregates import define_step
+from .constants import PARALLEL_MIN_ROWS, PARALLEL_WORKERS
+from .predicates import define_where
+
+_config = {"workers": PARALLEL_WORKERS, "min_rows": PARALLEL_MIN_ROWS}
+# пул процессов живёт между операторами: создаётся при первом проходе и пересоздаётся,
+# только когда меняется снимок строк (version) или число процессов
+_pool = {"pool": None, "version": None, "workers": 0, "pid": None, "busy": 0}
+# строки снимка в процессах пула: передаются через initializer при fork, без pickle
+_snapshot = {}
+# диапазонов на процесс: части разной стоимости выравниваются между процессами
+_CHUNKS_PER_WORKER = 4
+
+
+def set_workers(workers, min_rows=None):
+    """workers — число процессов (0 — выключено), min_rows — порог размера таблицы."""
+    if workers < 0:
+        raise ValueError("Число процессов не может быть отрицательным.")
+    if workers != _config["workers"] and not _pool["busy"]:
+        shutdown()
+    _config["workers"] = workers
+    if min_rows is not None:
+        _config["min_rows"] = min_rows
+
+
+def workers():
+    return _config["workers"]
+
+
+def min_rows():
+    return _config["min_rows"]
+
+
+def _supported():
+    # пул на fork: процессы видят строки таблицы без копирования и сериализации;
+    # fork из рабочего потока сервера скопировал бы замки, захваченные другими потоками
+    return "fork" in multiprocessing.get_all_start_methods() and threading.current_thread() is threading.main_thread()
+
+
+def applies(row_count, predicate=None):
+    """Идёт ли проход по row_count строкам параллельно (маленькие таблицы — последовательно)."""
+    return (
+        _config["workers"] > 1
+        and row_count >= _config["min_rows"]
+        and (predicate is None or predicate.const is None)
+        and _supported()
+    )
+
+
+def _ranges(count):
+    parts = min(count, _config["workers"] * _CHUNKS_PER_WORKER)
+    step = -(-count // parts)
+    return [(start, min(count, start + step)) for start in range(0, count, step)]
+
+
+def _init_worker(rows):
+    _snapshot["rows"] = rows
+
+
+@contextmanager
+def _pool_for(rows, version):
+    """
+    Пул, процессы которого видят rows. version — версия снимка таблицы (меняется
+    при каждом изменении её строк): пул той же версии переиспользуется; None —
+    проход не по всей таблице, пул создаётся заново. Пул, которым ещё пользуется
+    недочитанный проход, не останавливается: новому снимку достаётся отдельный
+    пул на время прохода.
+    """
+    reuse = (
+        version is not None
+        and _pool["pool"] is not None
+        and _pool["version"] == version
+        and _pool["workers"] == _config["workers"]
+        and _pool["pid"] == os.getpid()
+    )
+    if not reuse and _pool["busy"]:
+        pool = _start(rows)
+        try:
+            yield pool
+        finally:
+            pool.terminate()
+            pool.join()
+        return
+    if not reuse:
+        shutdown()
+        _pool.update(pool=_start(rows), version=version, workers=_config["workers"], pid=os.getpid())
+    _pool["busy"] += 1
+    try:
+        yield _pool["pool"]
+    finally:
+        _pool["busy"] -= 1
+
+
+def _start(rows):
+    # заменённые пулом процессы получают те же строки через initargs
+    return multiprocessing.get_context("fork").Pool(_config["workers"], _init_worker, (rows,))
+
+
+def shutdown():
+    """Останавливает процессы пула (при смене снимка, числа процессов и при выходе)."""
+    pool = _pool["pool"]
+    if pool is not None and _pool["pid"] == os.getpid():
+        pool.terminate()
+        pool.join()
+    _pool.update(pool=None, version=None, workers=0, pid=None)
+
+
+atexit.register(shutdown)
+
+
+def _task(where, aggregation=None):
+    """Задание для процессов: тексты сгенерированных функций (сами функции не сериализуются)."""
+    return (
+        None if where is None else (where.source, where.consts),
+        None if aggregation is None else aggregation.source,
+    )
+
+
+def _match_range(job):
+    (start, end), (where, _) = job
+    return [start + i for i in compress(range(end - start), map(define_where(*where), _snapshot["rows"][start:end]))]
+
+
+def _aggregate_range(job):
+    (start, end), (where, source) = job
+    rows = _snapshot["rows"][start:end]
+    groups = {}
+    define_step(source)(rows if where is None else filter(define_where(*where), rows), groups)
+    return groups
+
+
+def iter_matching(rows, predicate, version=None):
+    """
+    Строки списка rows, подходящие под predicate, в исходном порядке. Процессы
+    возвращают только позиции; диапазоны отдаются по порядку по мере готовности.
+    Если выдачу остановить досрочно, начатые диапазоны дорабатываются в пуле.
+    """
+    task = _task(predicate)
+    with _pool_for(rows, version) as pool:
+        for positions in pool.imap(_match_range, [(bounds, task) for bounds in _ranges(len(rows))]):
+            for pos in positions:
+                yield rows[pos]
+
+
+def matching(rows, predicate, version=None):
+    """Список подходящих строк (параллельно) или None, если проход должен идти последовательно."""
+    if not applies(len(rows), predicate):
+        return None
+    return list(iter_matching(rows, predicate, version))
+
+
+def aggregate_groups(rows, predicate, aggregation, version=None):
+    """
+    Группы агрегации по строкам rows (с фильтром predicate или без): каждый процесс
+    считает частичные аккумуляторы своего диапазона, затем они сливаются по порядку
+    диапазонов — порядок групп тот же, что при последовательном проходе.
+    """
+    task = _task(predicate, aggregation)
+    groups = {}
+    with _pool_for(rows, version) as pool:
+        for partial in pool.imap(_aggregate_range, [(bounds, task) for bounds in _ranges(len(rows))]):
+            aggregation.merge(groups, partial)
+    return groups
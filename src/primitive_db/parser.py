@@ -1,115 +1,493 @@
-# Разбор where/set/values без дополнительных библиотек кроме shlex
+# Разбор where/set/values без дополнительных библиотек кроме shlex и re
+import re
 import shlex
 
-from .constants import TRUE_TOKENS, FALSE_TOKENS
-
 OP_EQ = "="
 SEP_COMMA = ","
 SEP_AND = "and"
+SEP_OR = "or"
+KW_NOT = "not"
+KW_IN = "in"
+KW_LIKE = "like"
 
 ERR_EMPTY = "Пустое выражение."
 ERR_EXPECT_KV = 'Ожидался шаблон вида: <колонка> = <значение>. Получено: "{}"'
-ERR_UNKNOWN_SEPARATOR = 'Некорректный разделитель между парами. Используйте "," для SET или "and" для WHERE. Ошибка около: "{}"'
-ERR_EXPECT_VALUE = 'Ожидалось значение после "=" около: "{}"'
 ERR_DUPLICATE_KEYS = 'Дублируется колонка "{}"'
 ERR_EMPTY_KEY = "Пустое имя колонки."
+ERR_EXPECT_TUPLE = 'Ожидался кортеж значений вида (...) около: "{}"'
+ERR_UNCLOSED_TUPLE = "Не закрыта скобка в списке значений."
+ERR_WHERE_SYNTAX = 'Ошибка в условии WHERE около: "{}"'
+ERR_WHERE_END = "Неожиданный конец условия WHERE."
+ERR_UNCLOSED_PAREN = "Не закрыта скобка в условии WHERE."
+ERR_SELECT = "Некорректная команда SELECT. Ожидается: select [<столбцы>|<агрегаты>|*] from <table> [where <условие>] [group by <столбцы>] [order by <столбец> [asc|desc], ...] [limit <n>] [offset <n>]"
+ERR_JOIN = "Некорректное соединение. Ожидается: select ... from <a> join <b> on <a.столбец> = <b.столбец> [where ...]"
+ERR_UPDATE = "Некорректная команда UPDATE. Ожидается: update <table> set <...> where <...>"
+ERR_UPDATE_SECTIONS = "Для UPDATE требуются секции SET и WHERE."
+ERR_DELETE = "Некорректная команда DELETE. Ожидается: delete from <table> where <условие>"
+ERR_DELETE_WHERE = "Для DELETE требуется секция WHERE."
+ERR_INSERT = "Некорректная команда INSERT. Ожидается: insert into <table> values (<значения>)"
+ERR_INSERT_VALUES = "Отсутствует секция values(...)"
+ERR_EXPLAIN = "Ожидается: explain <select|update|delete ...>"
+ERR_STATEMENT = "Ожидается оператор select, insert, update или delete."
+ERR_EXPECT_NUMBER = '{} ожидает неотрицательное целое число, получено: "{}"'
+
+# строка в двойных/одинарных кавычках | скобка или запятая | голое значение
+_VALUES_TOKEN_RE = re.compile(r"""\s*(?:"((?:[^"\\]|\\.)*)"|'([^']*)'|([(),])|([^\s(),"']+))""")
+_ESCAPE_RE = re.compile(r"\\(.)")
+# insert into <таблица> — имя в кавычках или слово до пробела/скобки; затем ключевое слово values
+_INSERT_HEAD_RE = re.compile(r"""\s*(\S+)\s+(\S+)\s+("[^"]*"|'[^']*'|[^\s("']+)\s*""")
+_VALUES_KW_RE = re.compile(r"values\b", re.IGNORECASE)
+# строка в кавычках | оператор сравнения | скобка или запятая | слово (имя столбца, значение, ключевое слово)
+_WHERE_TOKEN_RE = re.compile(
+    r"""\s*(?:"((?:[^"\\]|\\.)*)"|'([^']*)'|(<=|>=|!=|<>|=|<|>)|([(),])|([^\s(),"'=<>!]+))"""
+)
+
+
+def _literal_node(kind, tok):
+    """Литерал оператора: ("lit", текст, в_кавычках) или ("param", номер)."""
+    if kind == "param":
+        return ("param", tok)
+    return ("lit", tok, kind == "str")
+
+
+def literal_value(node):
+    """Значение литерала для SET/VALUES: текст как есть (тип задаёт схема) или готовое значение."""
+    if node[0] in ("lit", "val"):
+        return node[1]
+    raise ValueError("Не задано значение параметра оператора.")
+
 
+def _scan_tokens(text):
+    """Токены выражения: (вид, значение, начало), вид — str/op/p/word."""
+    tokens = []
+    pos = 0
+    n = len(text)
+    while pos < n:
+        m = _WHERE_TOKEN_RE.match(text, pos)
+        if m is None or m.end() == pos:
+            rest = text[pos:].strip()
+            if not rest:
+                break
+            raise ValueError(ERR_WHERE_SYNTAX.format(rest[:20]))
+        pos = m.end()
+        dq, sq, op, punct, word = m.groups()
+        start = m.start(m.lastindex)
+        if dq is not None:
+            tokens.append(("str", _ESCAPE_RE.sub(r"\1", dq), start - 1))
+        elif sq is not None:
+            tokens.append(("str", sq, start - 1))
+        elif op is not None:
+            tokens.append(("op", op, start))
+        elif punct is not None:
+            tokens.append(("p", punct, start))
+        elif word is not None:
+            tokens.append(("word", word, start))
+    return tokens
 
-def _infer_scalar(token):
-    """ true/false/yes/no/1/0 -> bool; целые -> int; остальное -> str. """
-    low = token.lower()
-    if low in TRUE_TOKENS:
-        return True
-    if low in FALSE_TOKENS:
+
+class _WhereParser:
+    """
+    Рекурсивный спуск по грамматике:
+        expr    := and_expr ("or" and_expr)*
+        and_expr:= not_expr ("and" not_expr)*
+        not_expr:= "not" not_expr | "(" expr ")" | cond
+        cond    := col (op lit | ["not"] "in" "(" lit ("," lit)* ")" | ["not"] "like" lit)
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _keyword(self, word):
+        kind, tok = self._peek()
+        if kind == "word" and tok.lower() == word:
+            self.pos += 1
+            return True
         return False
-    # целое число с необязательным знаком
-    if (low.startswith(("+", "-")) and low[1:].isdigit()) or low.isdigit():
-        try:
-            return int(low)
-        except Exception:
-            pass
-    return token  # строка (shlex уже снял кавычки)
-
-
-def _split_assignments(tokens, allowed_sep):
-    """Разбирает поток токенов в пары (key, value)."""
-    pairs = []
-    i = 0
-    n = len(tokens)
-    while i < n:
-        key = tokens[i] if i < n else ""
-        if not key:
-            raise ValueError(ERR_EMPTY_KEY)
-        if i + 1 >= n or tokens[i + 1] != OP_EQ:
-            frag = " ".join(tokens[i:i+3])
-            raise ValueError(ERR_EXPECT_KV.format(frag))
-        if i + 2 >= n:
-            frag = " ".join(tokens[max(0, i-1):i+3])
-            raise ValueError(ERR_EXPECT_VALUE.format(frag))
 
-        val = tokens[i + 2]
-        pairs.append((key, val))
-        i += 3
+    def _expect(self, kind, tok=None):
+        got_kind, got = self._peek()
+        if got_kind != kind or (tok is not None and got != tok):
+            self._fail()
+        self.pos += 1
+        return got
 
-        if i < n:
-            sep = tokens[i].lower()
-            if sep != allowed_sep:
-                frag = " ".join(tokens[max(0, i-2):i+3])
-                raise ValueError(ERR_UNKNOWN_SEPARATOR.format(frag))
-            i += 1
-    return pairs
+    def _fail(self):
+        if self.pos >= len(self.tokens):
+            raise ValueError(ERR_WHERE_END)
+        frag = " ".join("?" if kind == "param" else tok for kind, tok in self.tokens[self.pos:self.pos + 3])
+        raise ValueError(ERR_WHERE_SYNTAX.format(frag))
 
+    def parse(self):
+        node = self._or()
+        if self.pos < len(self.tokens):
+            self._fail()
+        return node
 
-def parse_set(text):
-    if not text or not text.strip():
-        raise ValueError(ERR_EMPTY)
+    def _or(self):
+        items = [self._and()]
+        while self._keyword(SEP_OR):
+            items.append(self._and())
+        return items[0] if len(items) == 1 else ("or", items)
+
+    def _and(self):
+        items = [self._not()]
+        while self._keyword(SEP_AND):
+            items.append(self._not())
+        return items[0] if len(items) == 1 else ("and", items)
 
-    normalized = text.replace(",", f" {SEP_COMMA} ")
-    tokens = shlex.split(normalized, posix=True)
-    # унифицируем разделитель
-    tokens = [SEP_AND if t == SEP_COMMA else t for t in tokens]
-    pairs = _split_assignments(tokens, allowed_sep=SEP_AND)
+    def _not(self):
+        if self._keyword(KW_NOT):
+            return ("not", self._not())
+        if self._peek() == ("p", "("):
+            self.pos += 1
+            node = self._or()
+            if self._peek() != ("p", ")"):
+                if self.pos >= len(self.tokens):
+                    raise ValueError(ERR_UNCLOSED_PAREN)
+                self._fail()
+            self.pos += 1
+            return node
+        return self._cond()
 
-    out = {}
-    for k, raw in pairs:
-        if not k:
+    def _literal(self):
+        kind, tok = self._peek()
+        if kind not in ("str", "word", "param"):
+            self._fail()
+        self.pos += 1
+        return _literal_node(kind, tok)
+
+    def _cond(self):
+        column = self._expect("word")
+        if not column:
             raise ValueError(ERR_EMPTY_KEY)
-        if k in out:
-            raise ValueError(ERR_DUPLICATE_KEYS.format(k))
-        out[k] = _infer_scalar(raw)
-    return out
+        kind, tok = self._peek()
+        if kind == "op":
+            self.pos += 1
+            return ("cmp", column, tok, self._literal())
+        negate = self._keyword(KW_NOT)
+        if self._keyword(KW_IN):
+            self._expect("p", "(")
+            items = [self._literal()]
+            while self._peek() == ("p", SEP_COMMA):
+                self.pos += 1
+                items.append(self._literal())
+            self._expect("p", ")")
+            node = ("in", column, items)
+        elif self._keyword(KW_LIKE):
+            node = ("like", column, self._literal())
+        else:
+            self._fail()
+        return ("not", node) if negate else node
 
 
 def parse_where(text):
+    """
+    Разбирает условие WHERE в дерево:
+    ("cmp", col, op, lit) | ("in", col, [lit]) | ("like", col, lit) |
+    ("and", [..]) | ("or", [..]) | ("not", node); lit = ("lit", текст, в_кавычках)
+    или ("param", номер) для параметра оператора (см. plans.py).
+    Типы значений определяются позже, по схеме таблицы (см. predicates.py).
+    """
     if not text or not text.strip():
         raise ValueError(ERR_EMPTY)
+    return _parse_where_tokens(_scan_tokens(text))
 
-    tokens = shlex.split(text, posix=True)
-    pairs = _split_assignments(tokens, allowed_sep=SEP_AND)
 
-    out = {}
-    for k, raw in pairs:
-        if not k:
-            raise ValueError(ERR_EMPTY_KEY)
-        if k in out:
-            raise ValueError(ERR_DUPLICATE_KEYS.format(k))
-        out[k] = _infer_scalar(raw)
-    return out
+def _parse_where_tokens(tokens):
+    if not tokens:
+        raise ValueError(ERR_EMPTY)
+    return _WhereParser([(kind, tok) for kind, tok, _ in tokens]).parse()
 
 
-def parse_values_list(text):
-    if not text or not text.strip():
+def _values_tokens(text):
+    """
+    Токены списка кортежей: ("p", символ) для скобок/запятых, ("v", литерал) для значений —
+    ("lit", текст, в_кавычках) или ("param", номер) для ?.
+    """
+    pos = 0
+    n = len(text)
+    params = 0
+    while pos < n:
+        m = _VALUES_TOKEN_RE.match(text, pos)
+        if m is None or m.end() == pos:
+            rest = text[pos:].strip()
+            if not rest:
+                return
+            raise ValueError(ERR_EXPECT_TUPLE.format(rest[:20]))
+        pos = m.end()
+        dq, sq, punct, bare = m.groups()
+        if punct is not None:
+            yield "p", punct
+            continue
+        quoted = bare is None
+        raw = _ESCAPE_RE.sub(r"\1", dq) if dq is not None else sq if sq is not None else bare
+        if raw == "?" and not quoted:
+            yield "v", ("param", params)
+            params += 1
+        else:
+            yield "v", ("lit", raw, quoted)
+
+
+def _assemble_tuples(tokens):
+    tuples = []
+    current = None
+    expect_value = False
+    for kind, tok in tokens:
+        shown = tok[1] if isinstance(tok, tuple) else tok
+        if current is None:
+            if kind == "p" and tok == "(":
+                current = []
+                expect_value = True
+                continue
+            if kind == "p" and tok == SEP_COMMA and tuples:
+                continue
+            raise ValueError(ERR_EXPECT_TUPLE.format(shown))
+        if kind == "v":
+            if not expect_value:
+                raise ValueError(ERR_EXPECT_TUPLE.format(shown))
+            current.append(tok)
+            expect_value = False
+        elif tok == SEP_COMMA:
+            expect_value = True
+        elif tok == ")":
+            tuples.append(current)
+            current = None
+        else:
+            raise ValueError(ERR_EXPECT_TUPLE.format(shown))
+    if current is not None:
+        raise ValueError(ERR_UNCLOSED_TUPLE)
+    if not tuples:
         raise ValueError(ERR_EMPTY)
+    return tuples
+
+
+# секции SELECT после имени таблицы, в порядке следования
+_SELECT_CLAUSES = ("where", "group", "order", "limit", "offset")
+# секции из двух слов
+_SELECT_BY = ("group", "order")
+
+
+def _split_items(tokens):
+    """Разбивает токены по запятым верхнего уровня (вне скобок)."""
+    items = [[]]
+    depth = 0
+    for token in tokens:
+        kind, tok, _ = token
+        if kind == "p" and tok == SEP_COMMA and depth == 0:
+            items.append([])
+            continue
+        if kind == "p":
+            depth += 1 if tok == "(" else -1 if tok == ")" else 0
+        items[-1].append(token)
+    if any(not item for item in items):
+        raise ValueError(ERR_SELECT)
+    return items
+
+
+def _select_item(tokens):
+    """<столбец> или <функция>(<столбец>|*) -> имя столбца или (функция, столбец)."""
+    shape = [(kind, tok if kind == "p" else None) for kind, tok, _ in tokens]
+    if shape == [("word", None)]:
+        return tokens[0][1]
+    if shape == [("word", None), ("p", "("), ("word", None), ("p", ")")]:
+        return (tokens[0][1].lower(), tokens[2][1])
+    raise ValueError(ERR_SELECT)
+
+
+def _item_name(item):
+    return item if isinstance(item, str) else f"{item[0]}({item[1]})"
+
+
+def _parse_count(name, tokens):
+    if len(tokens) == 1 and tokens[0][0] == "param":
+        return ("param", tokens[0][1])
+    if len(tokens) != 1 or tokens[0][0] != "word" or not tokens[0][1].isdigit():
+        got = " ".join(str(tok) for _, tok, _ in tokens)
+        raise ValueError(ERR_EXPECT_NUMBER.format(name.upper(), got))
+    return int(tokens[0][1])
+
+
+def count_value(name, value):
+    """LIMIT/OFFSET после подстановки параметров: неотрицательное целое."""
+    if isinstance(value, tuple):
+        value = value[1]
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(ERR_EXPECT_NUMBER.format(name.upper(), value))
+    return value
+
+
+def parse_select(text):
+    """
+    Разбирает select [<столбцы>|*] from <table> [join <table> on <a.x> = <b.y>] [where ...] [group by ...] [order by ...]
+    [limit n] [offset n]. Столбец вывода — имя или агрегат (функция, столбец).
+    Возвращает {"kind": "select", "table", "columns" (None — все), "where" (дерево или None), "group_by",
+    "order_by" [(столбец или метка агрегата, по_убыванию)], "limit" (None — без ограничения), "offset",
+    "join" ({"table", "on": (столбец, столбец)} или None)}.
+    """
+    return _parse_select_tokens(_scan_tokens(text))
+
+
+def _words(tokens):
+    return [tok.lower() if kind == "word" else None for kind, tok, _ in tokens]
+
+
+def _parse_select_tokens(tokens):
+    words = _words(tokens)
+    if not words or words[0] != "select" or "from" not in words:
+        raise ValueError(ERR_SELECT)
+    from_pos = words.index("from")
+    if from_pos + 1 >= len(tokens) or tokens[from_pos + 1][0] != "word":
+        raise ValueError(ERR_SELECT)
+
+    projection = tokens[1:from_pos]
+    columns = None
+    if projection and not (len(projection) == 1 and projection[0][1] == "*"):
+        columns = [_select_item(item) for item in _split_items(projection)]
+
+    # начала секций: ключевые слова вне кавычек после имени таблицы
+    starts = {}
+    for i in range(from_pos + 2, len(tokens)):
+        word = words[i]
+        if word in _SELECT_CLAUSES and word not in starts:
+            if word in _SELECT_BY and (i + 1 >= len(words) or words[i + 1] != "by"):
+                continue
+            starts[word] = i
+    # необязательное соединение: join <table> on <столбец> = <столбец>
+    join = None
+    clauses_at = from_pos + 2
+    if clauses_at < len(words) and words[clauses_at] == "join":
+        shape = [kind for kind, _, _ in tokens[clauses_at + 1:clauses_at + 6]]
+        if shape != ["word", "word", "word", "op", "word"] or words[clauses_at + 2] != "on" \
+                or tokens[clauses_at + 4][1] != OP_EQ:
+            raise ValueError(ERR_JOIN)
+        join = {
+            "table": tokens[clauses_at + 1][1],
+            "on": (tokens[clauses_at + 3][1], tokens[clauses_at + 5][1]),
+        }
+        clauses_at += 6
+        starts = {word: i for word, i in starts.items() if i >= clauses_at}
+
+    order = sorted(starts.items(), key=lambda item: item[1])
+    if len(tokens) > clauses_at and (not order or order[0][1] != clauses_at):
+        raise ValueError(ERR_SELECT)
+
+    result = {
+        "kind": "select",
+        "table": tokens[from_pos + 1][1],
+        "join": join,
+        "columns": columns,
+        "where": None,
+        "group_by": [],
+        "order_by": [],
+        "limit": None,
+        "offset": 0,
+    }
+    for num, (name, start) in enumerate(order):
+        end = order[num + 1][1] if num + 1 < len(order) else len(tokens)
+        if name == "where":
+            result["where"] = _parse_where_tokens(tokens[start + 1:end])
+        elif name == "group":
+            for item in _split_items(tokens[start + 2:end]):
+                column = _select_item(item)
+                if not isinstance(column, str):
+                    raise ValueError(ERR_SELECT)
+                result["group_by"].append(column)
+        elif name == "order":
+            for item in _split_items(tokens[start + 2:end]):
+                desc = False
+                if len(item) > 1 and item[-1][0] == "word" and item[-1][1].lower() in ("asc", "desc"):
+                    desc = item[-1][1].lower() == "desc"
+                    item = item[:-1]
+                result["order_by"].append((_item_name(_select_item(item)), desc))
+        else:
+            result[name] = _parse_count(name, tokens[start + 1:end])
+    return result
+
+
+def _parse_update_tokens(tokens):
+    # update <table> set <столбец> = <значение>[, ...] where <условие>
+    words = _words(tokens)
+    if len(tokens) < 4 or words[0] != "update" or tokens[1][0] != "word" or words[2] != "set":
+        raise ValueError(ERR_UPDATE)
+    if "where" not in words[3:]:
+        raise ValueError(ERR_UPDATE_SECTIONS)
+    where_pos = words.index("where", 3)
+    assignments = {}
+    for item in _split_items(tokens[3:where_pos]):
+        shape = [kind for kind, _, _ in item]
+        if len(item) != 3 or shape[0] != "word" or item[1][1] != OP_EQ or shape[2] not in ("str", "word", "param"):
+            frag = " ".join(str(tok) for _, tok, _ in item)
+            raise ValueError(ERR_EXPECT_KV.format(frag))
+        column = item[0][1]
+        if column in assignments:
+            raise ValueError(ERR_DUPLICATE_KEYS.format(column))
+        assignments[column] = _literal_node(shape[2], item[2][1])
+    return {
+        "kind": "update",
+        "table": tokens[1][1],
+        "set": assignments,
+        "where": _parse_where_tokens(tokens[where_pos + 1:]),
+    }
+
+
+def _parse_delete_tokens(tokens):
+    # delete from <table> where <условие>
+    words = _words(tokens)
+    if len(tokens) < 3 or words[0] != "delete" or words[1] != "from" or tokens[2][0] != "word":
+        raise ValueError(ERR_DELETE)
+    if len(tokens) < 4 or words[3] != "where":
+        raise ValueError(ERR_DELETE_WHERE)
+    return {"kind": "delete", "table": tokens[2][1], "where": _parse_where_tokens(tokens[4:])}
+
 
-    text = text.strip()
-    # обрезаем внешние скобки, если есть
-    if text.startswith("(") and text.endswith(")"):
-        text = text[1:-1].strip()
+def parse_insert(text):
+    """
+    insert into <table> values (...)[, (...)] -> {"kind": "insert", "table", "values": [[литерал, ...]]}.
+    Значения остаются литералами: тип задаёт схема таблицы; ? — параметр оператора.
+    """
+    # заголовок разбираем отдельно: список значений может быть очень длинным
+    head = _INSERT_HEAD_RE.match(text)
+    if head is None or head.group(1).lower() != "insert" or head.group(2).lower() != "into":
+        raise ValueError(ERR_INSERT)
+    # ключевое слово values ищется после имени таблицы, а не внутри него (values_log)
+    keyword = _VALUES_KW_RE.match(text, head.end())
+    if keyword is None:
+        raise ValueError(ERR_INSERT_VALUES)
+    payload = text[keyword.end():].strip()
+    if not payload.startswith("("):
+        payload = f"({payload})"
+    table = shlex.split(head.group(3), posix=True)[0]
+    return {"kind": "insert", "table": table, "values": _assemble_tuples(_values_tokens(payload))}
 
-    # Критично: отделяем запятые пробелами, чтобы shlex видел их как отдельные токены
-    normalized = text.replace(",", " , ")
-    tokens = shlex.split(normalized, posix=True)
 
-    # выбрасываем запятые и приводим типы (int/bool/str)
-    clean_tokens = [t for t in tokens if t != ","]
-    return [_infer_scalar(t) for t in clean_tokens]
+def parse_statement(text, tokens=None):
+    """
+    Разбирает select/update/delete/insert/explain в словарь с ключом "kind".
+    tokens — уже полученные токены (например, с параметрами вместо литералов).
+    """
+    if tokens is None:
+        head = text.split(None, 1)[0].lower() if text.strip() else ""
+        if head == "insert":
+            return parse_insert(text)
+        tokens = _scan_tokens(text)
+    words = _words(tokens)
+    head = words[0] if words else None
+    if head == "explain":
+        if len(tokens) < 2 or words[1] not in ("select", "update", "delete"):
+            raise ValueError(ERR_EXPLAIN)
+        return {"kind": "explain", "statement": parse_statement(None, tokens[1:])}
+    if head == "select":
+        return _parse_select_tokens(tokens)
+    if head == "update":
+        return _parse_update_tokens(tokens)
+    if head == "delete":
+        return _parse_delete_tokens(tokens)
+    if head == "insert":
+        return parse_insert(text)
+    raise ValueError(ERR_STATEMENT)
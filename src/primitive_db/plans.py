@@ -0,0 +1,226 @@
+# Кэш разобранных операторов: литералы заменяются параметрами, разбор выполняется один раз
+import re
+from collections import OrderedDict
+
+from . import metrics
+from .constants import PLAN_CACHE_SIZE
+from .parser import _scan_tokens, count_value, literal_value, parse_statement
+from .predicates import define_function
+
+# операторы, которые разбираются по токенам и попадают в кэш с нормализацией
+_NORMALIZED = ("select", "update", "delete", "explain")
+_NUMBER_RE = re.compile(r"[+-]?\d+$")
+# литералы в тексте оператора: строка в кавычках | число или ? отдельным словом
+# (границы слова — как у токенизатора parser._scan_tokens)
+_LITERAL_RE = re.compile(
+    r"""\"((?:[^"\\]|\\.)*)"|'([^']*)'|(?<![^\s(),"'=<>!])([+-]?\d+|\?)(?![^\s(),"'=<>!])"""
+)
+_ESCAPE_RE = re.compile(r"\\(.)")
+
+
+def normalize(text):
+    """
+    Ключ кэша и значения параметров за один проход регулярного выражения:
+    строки в кавычках и числа заменяются на ?. Значение None — явный параметр ?,
+    его передаёт вызывающий.
+    """
+    args = []
+
+    def literal(match):
+        dq, sq, word = match.groups()
+        if dq is not None:
+            args.append(("lit", _ESCAPE_RE.sub(r"\1", dq), True))
+        elif sq is not None:
+            args.append(("lit", sq, True))
+        else:
+            args.append(None if word == "?" else ("lit", word, False))
+        return "?"
+
+    return _LITERAL_RE.sub(literal, text), args
+
+
+def _param_tokens(text):
+    """Токены оператора, где строки и числа заменены на ("param", номер, начало)."""
+    tokens = []
+    count = 0
+    for kind, tok, start in _scan_tokens(text):
+        if kind == "str" or (kind == "word" and (tok == "?" or _NUMBER_RE.match(tok))):
+            kind, tok = "param", count
+            count += 1
+        tokens.append((kind, tok, start))
+    return tokens, count
+
+
+def _emit(node):
+    """Текст выражения Python, строящего копию разбора; параметр i -> a[i]."""
+    if isinstance(node, tuple):
+        if len(node) == 2 and node[0] == "param" and type(node[1]) is int:
+            return f"a[{node[1]}]"
+        return "(" + "".join(f"{_emit(item)}, " for item in node) + ")"
+    if isinstance(node, list):
+        return "[" + ", ".join(_emit(item) for item in node) + "]"
+    if isinstance(node, dict):
+        return "{" + ", ".join(f"{key!r}: {_emit(value)}" for key, value in node.items()) + "}"
+    return repr(node)
+
+
+def _builder(template):
+    """Функция build(args) -> новый разбор с подставленными параметрами (без обхода шаблона)."""
+    source = f"def _build(a):\n    return {_emit(template)}\n"
+    return define_function(source, "_build", {}, "<statement>")
+
+
+def _substitute(node, args):
+    """Копия разобранного оператора с подставленными параметрами."""
+    if isinstance(node, tuple):
+        if len(node) == 2 and node[0] == "param" and type(node[1]) is int:
+            return args[node[1]]
+        return tuple(_substitute(item, args) for item in node)
+    if isinstance(node, list):
+        return [_substitute(item, args) for item in node]
+    if isinstance(node, dict):
+        return {key: _substitute(value, args) for key, value in node.items()}
+    return node
+
+
+def _resolve(query):
+    """Литералы SET/VALUES/LIMIT/OFFSET -> значения (литералы WHERE типизирует схема)."""
+    kind = query["kind"]
+    if kind == "select":
+        if query["limit"] is not None:
+            query["limit"] = count_value("limit", query["limit"])
+        query["offset"] = count_value("offset", query["offset"])
+    elif kind == "update":
+        query["set"] = {col: literal_value(value) for col, value in query["set"].items()}
+    elif kind == "insert":
+        query["values"] = [[literal_value(value) for value in row] for row in query["values"]]
+    elif kind == "explain":
+        _resolve(query["statement"])
+    return query
+
+
+class Statement:
+    """
+    Подготовленный оператор: шаблон разбора и значения его параметров.
+    bind(*params) подставляет значения явных параметров ? по порядку
+    и возвращает готовый к выполнению разбор (словарь с ключом "kind").
+    build — сгенерированная функция копирования шаблона (None — обход шаблона).
+    """
+
+    __slots__ = ("text", "template", "args", "cached", "build")
+
+    def __init__(self, text, template, args, cached=False, build=None):
+        self.text = text
+        self.template = template
+        self.args = args
+        self.cached = cached
+        self.build = build
+
+    @property
+    def kind(self):
+        return self.template["kind"]
+
+    @property
+    def param_count(self):
+        return sum(arg is None for arg in self.args)
+
+    def bind(self, *params):
+        if len(params) != self.param_count:
+            raise ValueError(f"Оператор ожидает параметров: {self.param_count}, передано: {len(params)}.")
+        args = self.args
+        if params:
+            values = iter(params)
+            args = [("val", next(values)) if arg is None else arg for arg in args]
+        query = self.build(args) if self.build is not None else _substitute(self.template, args)
+        return _resolve(query)
+
+
+class StatementCache:
+    """LRU-кэш «нормализованный текст -> шаблон разбора» со счётчиками попаданий."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        template = self._entries.get(key)
+        if template is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return template
+
+    def put(self, key, template):
+        self._entries[key] = template
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {"statements": len(self._entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
+
+
+_cache = StatementCache(PLAN_CACHE_SIZE)
+
+
+def _insert_args(template):
+    count = sum(1 for row in template["values"] for value in row if value[0] == "param")
+    return [None] * count
+
+
+def prepare(text):
+    """
+    Готовит оператор к выполнению. Для select/update/delete/explain строки и числа
+    выносятся в параметры, поэтому операторы, отличающиеся только значениями,
+    разбираются один раз. insert разбирается как есть (? — параметры), в кэш
+    попадает только текст с параметрами.
+    """
+    with metrics.phase("parse"):
+        return _prepare(text)
+
+
+def _prepare(text):
+    text = text.strip()
+    head = text.split(None, 1)[0].lower() if text else ""
+    if head not in _NORMALIZED:
+        if head != "insert" or "?" not in text:
+            template = parse_statement(text)
+            return Statement(text, template, _insert_args(template) if head == "insert" else [])
+        entry = _cache.get(text)
+        cached = entry is not None
+        if entry is None:
+            template = parse_statement(text)
+            entry = (template, _builder(template))
+            _cache.put(text, entry)
+        return Statement(text, entry[0], _insert_args(entry[0]), cached, entry[1])
+
+    key, args = normalize(text)
+    entry = _cache.get(key)
+    if entry is not None:
+        return Statement(text, entry[0], args, True, entry[1])
+    tokens, count = _param_tokens(text)
+    try:
+        if count != len(args):
+            raise ValueError(key)
+        template = parse_statement(text, tokens)
+    except ValueError:
+        # число или строка там, где грамматика ждёт имя (например, таблица "2024"):
+        # разбираем без параметров и не кэшируем
+        return Statement(text, parse_statement(text), [])
+    entry = (template, _builder(template))
+    _cache.put(key, entry)
+    return Statement(text, template, args, False, entry[1])
+
+
+def cache_stats():
+    return _cache.stats()
+
+
+def clear_cache():
+    _cache.clear()
@@ -0,0 +1,288 @@
+# Компиляция условий WHERE в функции-предикаты (один раз на оператор)
+import operator
+import re
+import threading
+
+from .constants import FALSE_TOKENS, PLAN_CACHE_SIZE, TRUE_TOKENS
+
+_PY_OPS = {"=": "==", "!=": "!=", "<>": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+# отрицание сравнения (значения в строках всегда заданы, поэтому NOT a < b == a >= b)
+_NEGATED = {"=": "!=", "!=": "=", "<": ">=", "<=": ">", ">": "<=", ">=": "<"}
+RANGE_OPS = ("<", "<=", ">", ">=")
+
+# операции простых условий (столбец, оп, значение) для проверок вне предиката
+TERM_OPS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda value, values: value in values,
+}
+
+_NO_VALUE = object()
+
+# скомпилированный код по тексту функции: условия, отличающиеся только значениями,
+# дают одинаковый текст (значения передаются через имена _c0, _c1, ...)
+_code_cache = {}
+_code_lock = threading.Lock()
+
+
+def define_function(source, name, namespace, filename="<generated>"):
+    """Определяет функцию name из текста source в namespace; compile() — один раз на текст."""
+    with _code_lock:
+        code = _code_cache.get(source)
+        if code is None:
+            code = compile(source, filename, "exec")
+            if len(_code_cache) >= PLAN_CACHE_SIZE:
+                _code_cache.pop(next(iter(_code_cache)))
+            _code_cache[source] = code
+    exec(code, namespace)
+    return namespace[name]
+
+
+class Predicate:
+    """
+    Скомпилированное условие WHERE.
+
+    fn(row) -> bool — сгенерированная функция; terms — простые условия
+    верхнего уровня, соединённые AND: [(столбец, "=" | "!=" | "<" | ... | "in", значение)],
+    по ним можно выбрать кандидатов через индексы; const — True/False,
+    если условие свелось к константе, иначе None; source — текст функции,
+    consts — значения, которые она читает по именам _c0, _c1, ...;
+    columns — столбцы, которые читает условие.
+    """
+
+    __slots__ = ("fn", "terms", "const", "source", "columns", "consts")
+
+    def __init__(self, fn, terms, const, source, columns=frozenset(), consts=None):
+        self.fn = fn
+        self.terms = terms
+        self.const = const
+        self.source = source
+        self.columns = columns
+        self.consts = consts or {}
+
+    def __call__(self, row):
+        return self.fn(row)
+
+
+def _cast(text, type_name):
+    """Значение литерала в типе столбца или _NO_VALUE, если привести нельзя."""
+    if type_name == "str":
+        return text
+    if type_name == "int":
+        try:
+            return int(text.strip())
+        except ValueError:
+            return _NO_VALUE
+    if type_name == "bool":
+        low = text.strip().lower()
+        if low in TRUE_TOKENS:
+            return True
+        if low in FALSE_TOKENS:
+            return False
+    return _NO_VALUE
+
+
+def _value(lit, type_name):
+    kind, raw = lit[0], lit[1]
+    if kind == "lit":
+        return _cast(raw, type_name)
+    # уже готовое значение (условие задано словарём)
+    if type_name == "int" and isinstance(raw, int):
+        return int(raw)
+    if type_name == "bool" and isinstance(raw, bool):
+        return raw
+    if type_name == "str" and isinstance(raw, str):
+        return raw
+    return _cast(str(raw), type_name)
+
+
+def _like_regex(pattern):
+    """LIKE: % — любая подстрока, _ — один символ."""
+    parts = []
+    for ch in pattern:
+        if ch == "%":
+            parts.append(".*")
+        elif ch == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(ch))
+    return re.compile("".join(parts), re.DOTALL)
+
+
+def where_from_dict(where):
+    """Условие-словарь {столбец: значение} (равенства через AND) в виде дерева."""
+    return ("and", [("cmp", col, "=", ("val", value)) for col, value in where.items()])
+
+
+def _bind(node, types):
+    """Проставляет типы значений по схеме и сворачивает константы."""
+    kind = node[0]
+    if kind in ("cmp", "in", "like"):
+        column = node[1]
+        if column not in types:
+            raise KeyError(f'Столбец "{column}" не существует.')
+        type_name = types[column]
+    if kind == "cmp":
+        op = "!=" if node[2] == "<>" else node[2]
+        value = _value(node[3], type_name)
+        if value is _NO_VALUE:
+            if op in RANGE_OPS:
+                raise ValueError(f'Не удалось привести "{node[3][1]}" к {type_name}')
+            # значение другого типа не равно ни одному значению столбца
+            return ("const", op == "!=")
+        return ("cmp", column, op, value)
+    if kind == "in":
+        values = frozenset(v for v in (_value(lit, type_name) for lit in node[2]) if v is not _NO_VALUE)
+        if not values:
+            return ("const", False)
+        if len(values) == 1:
+            return ("cmp", column, "=", next(iter(values)))
+        return ("in", column, values)
+    if kind == "like":
+        if type_name != "str":
+            raise ValueError(f'LIKE применим только к строковым столбцам, а "{column}" — {type_name}.')
+        pattern = node[2][1]
+        if "%" not in pattern and "_" not in pattern:
+            return ("cmp", column, "=", pattern)
+        return ("like", column, pattern)
+    if kind == "not":
+        child = _bind(node[1], types)
+        if child[0] == "const":
+            return ("const", not child[1])
+        if child[0] == "cmp":
+            return ("cmp", child[1], _NEGATED[child[2]], child[3])
+        if child[0] == "not":
+            return child[1]
+        return ("not", child)
+    if kind in ("and", "or"):
+        # AND: False поглощает, True пропускается; OR — наоборот
+        absorbing = kind == "or"
+        items = []
+        for child in node[1]:
+            child = _bind(child, types)
+            if child[0] == "const":
+                if child[1] == absorbing:
+                    return child
+                continue
+            items.extend(child[1] if child[0] == kind else [child])
+        if not items:
+            return ("const", not absorbing)
+        if kind == "or":
+            items = _merge_equalities(items)
+        return items[0] if len(items) == 1 else (kind, items)
+    if kind == "const":
+        return node
+    raise ValueError(f"Неизвестный узел условия: {kind}")
+
+
+def _merge_equalities(items):
+    """a = 1 OR a = 2 OR a IN (3) -> a IN (1, 2, 3): такое условие можно взять из индекса."""
+    columns = {item[1] for item in items if item[0] in ("cmp", "in")}
+    if len(columns) != 1 or not all(i[0] == "in" or (i[0] == "cmp" and i[2] == "=") for i in items):
+        return items
+    values = frozenset()
+    for item in items:
+        values |= item[2] if item[0] == "in" else {item[3]}
+    return [("in", columns.pop(), values)]
+
+
+def _cost(node):
+    return {"cmp": 0, "in": 0, "like": 1}.get(node[0], 2)
+
+
+def _emit(node, consts):
+    """Текст выражения Python для узла; значения передаются через имена _c0, _c1, ..."""
+    kind = node[0]
+    if kind == "const":
+        return repr(node[1])
+    if kind in ("cmp", "in", "like"):
+        name = f"_c{len(consts)}"
+        column = repr(node[1])
+        if kind == "cmp":
+            consts[name] = node[3]
+            return f"r[{column}] {_PY_OPS[node[2]]} {name}"
+        if kind == "in":
+            consts[name] = node[2]
+            return f"r[{column}] in {name}"
+        consts[name] = _like_regex(node[2]).fullmatch
+        return f"{name}(r[{column}]) is not None"
+    if kind == "not":
+        return f"not ({_emit(node[1], consts)})"
+    joiner = f" {kind} "
+    return "(" + joiner.join(_emit(child, consts) for child in sorted(node[1], key=_cost)) + ")"
+
+
+def _terms(node):
+    items = node[1] if node[0] == "and" else [node]
+    terms = []
+    for item in items:
+        if item[0] == "cmp":
+            terms.append((item[1], item[2], item[3]))
+        elif item[0] == "in":
+            terms.append((item[1], "in", item[2]))
+    return terms
+
+
+def _columns(node):
+    if node[0] in ("cmp", "in", "like"):
+        return {node[1]}
+    if node[0] == "not":
+        return _columns(node[1])
+    if node[0] in ("and", "or"):
+        return set().union(*(_columns(child) for child in node[1]))
+    return set()
+
+
+def where_columns(where):
+    """Столбцы, упомянутые в условии (дерево parse_where)."""
+    return _columns(where)
+
+
+def conjuncts(where):
+    """Условия верхнего уровня, соединённые AND."""
+    return list(where[1]) if where[0] == "and" else [where]
+
+
+def rename_columns(where, rename):
+    """Копия дерева условия с заменой имён столбцов: rename(имя) -> новое имя."""
+    kind = where[0]
+    if kind in ("cmp", "in", "like"):
+        return (kind, rename(where[1])) + tuple(where[2:])
+    if kind == "not":
+        return ("not", rename_columns(where[1], rename))
+    if kind in ("and", "or"):
+        return (kind, [rename_columns(child, rename) for child in where[1]])
+    return where
+
+
+def compile_where(where, types):
+    """
+    Компилирует условие (дерево из parse_where или словарь равенств)
+    в Predicate для таблицы со столбцами types = {имя: тип}.
+    """
+    if isinstance(where, dict):
+        where = where_from_dict(where)
+    node = _bind(where, types)
+    if node[0] == "const":
+        const = node[1]
+        return Predicate(lambda row: const, [], const, f"lambda r: {const!r}")
+    consts = {}
+    expr = _emit(node, consts)
+    # строка без столбца (или None вместо значения) просто не подходит
+    source = (
+        "def _where(r):\n"
+        "    try:\n"
+        f"        return {expr}\n"
+        "    except (KeyError, TypeError):\n"
+        "        return False\n"
+    )
+    return Predicate(define_where(source, consts), _terms(node), None, source, frozenset(_columns(node)), consts)
+
+
+def define_where(source, consts):
+    """Функция условия по тексту и значениям (процессы parallel получают их вместо функции)."""
+    return define_function(source, "_where", dict(consts), "<where>")
@@ -0,0 +1,118 @@
+# Секции таблицы: файлы data/<table>.seg/<ключ><расширение> вместо одного основного файла
+#
+# Раскладка хранится в метаданных таблицы (поле "segments"):
+#   {"by": "ID", "rows": N, "files": {ключ: {"rows": n}}} — диапазоны ID по N строк;
+#   {"by": <столбец>, "buckets": N, "files": {...}} — корзины по значению столбца секционирования.
+# "files" — манифест: секции, записанные при последнем сохранении таблицы, число строк
+# и статистика столбцов в них (zonemaps; фильтры Блума строковых столбцов — в файле
+# <номер>.bloom рядом с секцией); "stamp" — отпечаток каталога секций после записи.
+import zlib
+
+from . import zonemaps
+from .constants import ID_COL, SEGMENT_ROWS
+
+
+def make_layout(column=None, buckets=None, rows=SEGMENT_ROWS):
+    """Раскладка новой таблицы; None — таблица хранится одним файлом (rows = 0)."""
+    if column is not None:
+        if buckets is not None and buckets < 1:
+            raise ValueError("Число секций должно быть положительным. Попробуйте снова.")
+        return {"by": column, "buckets": buckets or 16, "files": {}}
+    if not rows:
+        return None
+    return {"by": ID_COL, "rows": rows, "files": {}}
+
+
+def by_id(layout):
+    return layout["by"] == ID_COL
+
+
+def value_key(layout, value):
+    """Номер секции для значения столбца секционирования (для раскладки по ID — для ID)."""
+    if by_id(layout):
+        return (value - 1) // layout["rows"] if value > 0 else 0
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        # crc32, а не hash(): номер секции не должен зависеть от запуска (PYTHONHASHSEED)
+        return zlib.crc32(value.encode("utf-8")) % layout["buckets"]
+    return int(value) % layout["buckets"]
+
+
+def row_key(layout, row):
+    return value_key(layout, row.get(layout["by"]))
+
+
+def file_name(key, suffix):
+    return f"{key}{suffix}"
+
+
+def parse_name(name, suffix):
+    """Номер секции по имени файла или None (чужой или временный файл)."""
+    stem = name[: -len(suffix)] if name.endswith(suffix) else None
+    return int(stem) if stem is not None and stem.isdigit() else None
+
+
+def select(layout, terms, keys):
+    """
+    Секции из keys, в которых могут быть строки под простые условия WHERE
+    [(столбец, оп, значение)] (отсечение секций). Раскладка по ID отсекает
+    по =, in и диапазонам ID, раскладка по столбцу — по = и in на нём.
+    """
+    column = layout["by"]
+    wanted = None
+    low, high = None, None
+    for name, op, value in terms:
+        if name != column:
+            continue
+        if op == "=":
+            found = {value_key(layout, value)}
+        elif op == "in":
+            found = {value_key(layout, v) for v in value}
+        elif by_id(layout) and op in (">", ">="):
+            bound = value_key(layout, value + 1 if op == ">" else value)
+            low = bound if low is None else max(low, bound)
+            continue
+        elif by_id(layout) and op in ("<", "<="):
+            bound = value_key(layout, value - 1 if op == "<" else value)
+            high = bound if high is None else min(high, bound)
+            continue
+        else:
+            continue
+        wanted = found if wanted is None else wanted & found
+    return [
+        key for key in keys
+        if (wanted is None or key in wanted)
+        and (low is None or key >= low)
+        and (high is None or key <= high)
+    ]
+
+
+def excluded(layout, terms, keys, types, blooms=None):
+    """
+    Секции из keys, все строки которых по статистике манифеста (zonemaps) не подходят под terms.
+    blooms(номер) — фильтры Блума секции {столбец: base64}; читаются, только если
+    min/max секцию не исключили, а в terms есть = или in по строковому столбцу.
+    """
+    files = layout.get("files", {})
+    check_blooms = blooms is not None and zonemaps.bloom_terms(types, terms)
+    found = set()
+    for key in keys:
+        stats = files.get(str(key), {}).get("stats") or {}
+        if zonemaps.excludes(stats, types, terms):
+            found.add(key)
+        elif check_blooms:
+            stats = {**stats, **{name: {"bloom": data} for name, data in blooms(key).items()}}
+            if zonemaps.excludes(stats, types, terms):
+                found.add(key)
+    return found
+
+
+def describe(layout):
+    """Раскладка в читаемом виде (info, explain)."""
+    if layout is None:
+        return "один файл"
+    count = len(layout.get("files", {}))
+    if by_id(layout):
+        return f"секции по диапазонам {ID_COL} ({layout['rows']} строк), секций: {count}"
+    return f"секции по столбцу {layout['by']} ({layout['buckets']} корзин), секций: {count}"
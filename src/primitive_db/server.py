@@ -0,0 +1,236 @@
+# Сетевой режим: asyncio-сервер с протоколом JSON-строк поверх TCP или Unix-сокета
+import argparse
+import asyncio
+import json
+import os
+import signal
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from .api import STATEMENT_WORDS, _command_args, connect
+from .constants import RENDER_PAGE_ROWS, SERVER_PORT, SERVER_THREADS
+from .plans import prepare
+
+# команды, недоступные в сервере: транзакция core одна на процесс, а клиентов много
+_SESSION_COMMANDS = ("begin", "rollback")
+
+
+class RWLock:
+    """
+    Блокировка чтения/записи для сопрограмм: читатели таблицы выполняются
+    одновременно, писатель — один. Ждущий писатель не пропускает новых
+    читателей, поэтому поток чтений его не «голодает».
+    """
+
+    def __init__(self):
+        self._cond = asyncio.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    async def acquire(self, exclusive):
+        async with self._cond:
+            if exclusive:
+                self._waiting_writers += 1
+                try:
+                    await self._cond.wait_for(lambda: not self._writer and not self._readers)
+                finally:
+                    self._waiting_writers -= 1
+                self._writer = True
+            else:
+                await self._cond.wait_for(lambda: not self._writer and not self._waiting_writers)
+                self._readers += 1
+
+    async def release(self, exclusive):
+        async with self._cond:
+            if exclusive:
+                self._writer = False
+            else:
+                self._readers -= 1
+            self._cond.notify_all()
+
+
+class _Held:
+    """Блокировки таблиц оператора: в порядке имён, чтобы не было взаимных ожиданий."""
+
+    def __init__(self, locks, tables, exclusive):
+        self.locks = locks
+        self.tables = sorted(set(tables))
+        self.exclusive = exclusive
+
+    async def __aenter__(self):
+        taken = []
+        try:
+            for name in self.tables:
+                await self.locks[name].acquire(self.exclusive)
+                taken.append(name)
+        except BaseException:
+            for name in reversed(taken):
+                await self.locks[name].release(self.exclusive)
+            raise
+
+    async def __aexit__(self, *exc):
+        for name in reversed(self.tables):
+            await self.locks[name].release(self.exclusive)
+
+
+def _plain(value):
+    return value if value is None or isinstance(value, (bool, int, float, str)) else str(value)
+
+
+class Server:
+    """
+    Одно соединение с базой на весь процесс: таблицы остаются в кэше между
+    запросами. Операторы и чтение порций результата выполняются в пуле из
+    SERVER_THREADS потоков, поэтому долгая выборка не задерживает остальных
+    клиентов. Чтения идут одновременно; изменения и DDL — по одному (writing),
+    и запись в таблицу ждёт, пока её дочитают. Результат SELECT отправляется
+    порциями по RENDER_PAGE_ROWS строк.
+    """
+
+    def __init__(self, root):
+        self.connection = connect(root)
+        self.locks = defaultdict(RWLock)
+        self.executor = ThreadPoolExecutor(SERVER_THREADS, thread_name_prefix="db-server")
+        self.writing = threading.Lock()
+        self.clients = 0
+        self.requests = 0
+
+    def _request(self, line):
+        """Строка запроса (JSON-объект или просто текст оператора) -> (id, текст, параметры)."""
+        text = line.strip()
+        if not text.startswith("{"):
+            return None, text, []
+        request = json.loads(text)
+        if not isinstance(request, dict) or not isinstance(request.get("sql"), str):
+            raise ValueError('Ожидался объект {"sql": "...", "params": [...]}.')
+        params = request.get("params") or []
+        if not isinstance(params, list):
+            raise ValueError("params — список значений.")
+        return request.get("id"), request["sql"], params
+
+    def _plan(self, sql):
+        """(подготовленный оператор или текст команды, таблицы, нужна ли исключительная блокировка)."""
+        head = sql.split(None, 1)[0].lower() if sql.strip() else ""
+        if head in STATEMENT_WORDS:
+            statement = prepare(sql)
+            template = statement.template
+            if statement.kind == "explain":
+                template = template["statement"]
+            tables = [template["table"]]
+            if template.get("join") is not None:
+                tables.append(template["join"]["table"])
+            return statement, tables, statement.kind in ("insert", "update", "delete")
+        args = _command_args(sql)
+        if args[0] in _SESSION_COMMANDS:
+            raise ValueError(f"Команда {args[0]} недоступна в режиме сервера.")
+        return sql, args[1:2], True
+
+    def _run(self, statement, params, exclusive):
+        """Выполняет оператор в рабочем потоке; изменения — под self.writing."""
+        if not exclusive:
+            return self.connection.execute(statement, params)
+        with self.writing:
+            return self.connection.execute(statement, params)
+
+    @staticmethod
+    def _page(cursor):
+        # строки выбираются лениво: фильтр и чтение секций идут здесь, в рабочем потоке
+        return [[_plain(value) for value in row] for row in cursor.fetchmany(RENDER_PAGE_ROWS)]
+
+    async def _execute(self, writer, request_id, sql, params):
+        statement, tables, exclusive = self._plan(sql)
+        loop = asyncio.get_running_loop()
+        async with _Held(self.locks, tables, exclusive):
+            cursor = await loop.run_in_executor(self.executor, self._run, statement, params, exclusive)
+            if cursor.description is None:
+                return {"id": request_id, "ok": True, "rowcount": cursor.rowcount, "lastrowid": cursor.lastrowid}
+            columns = [list(column) for column in cursor.description]
+            while True:
+                rows = await loop.run_in_executor(self.executor, self._page, cursor)
+                more = len(rows) == RENDER_PAGE_ROWS
+                if not more:
+                    return {"id": request_id, "ok": True, "columns": columns, "rows": rows, "more": False}
+                # порция результата; drain ждёт, пока клиент её прочитает
+                _send(writer, {"id": request_id, "ok": True, "columns": columns, "rows": rows, "more": True})
+                await writer.drain()
+
+    async def handle(self, reader, writer):
+        self.clients += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                self.requests += 1
+                request_id = None
+                try:
+                    request_id, sql, params = self._request(line.decode("utf-8"))
+                    response = await self._execute(writer, request_id, sql, params)
+                except (KeyError, ValueError, OSError) as e:
+                    response = {"id": request_id, "ok": False, "error": str(e.args[0] if e.args else e)}
+                except Exception as e:
+                    # непредвиденная ошибка одного запроса не обрывает соединение клиента
+                    response = {"id": request_id, "ok": False, "error": f"Внутренняя ошибка: {type(e).__name__}: {e}"}
+                _send(writer, response)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.connection.close()
+
+
+def _send(writer, message):
+    writer.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+async def serve(root=".", host="127.0.0.1", port=SERVER_PORT, path=None, ready=None):
+    """
+    Запускает сервер до SIGINT/SIGTERM. path — Unix-сокет вместо TCP.
+    ready(address) вызывается, когда сервер начал принимать соединения.
+    """
+    server = Server(root)
+    if path is not None:
+        listener = await asyncio.start_unix_server(server.handle, path=path)
+        address = path
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+        address = "{}:{}".format(*listener.sockets[0].getsockname()[:2])
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    if ready is not None:
+        ready(address)
+    try:
+        async with listener:
+            await stop.wait()
+    finally:
+        server.close()
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="database serve", description="Сервер базы данных (JSON-строки)")
+    parser.add_argument("--root", default=".", help="каталог базы (db_meta.json и data/)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--socket", help="Unix-сокет вместо TCP")
+    args = parser.parse_args(argv)
+    asyncio.run(serve(
+        args.root, args.host, args.port, args.socket,
+        ready=lambda address: print(f"Сервер принимает соединения: {address}", flush=True),
+    ))
+    return 0
@@ -0,0 +1,525 @@
+# Форматы хранения таблиц: JSON (построчно) и колоночный бинарный
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from itertools import chain
+from operator import itemgetter
+
+from . import metrics, zonemaps
+from .constants import BLOCK_ROWS
+from .durability import atomic_open
+from .predicates import TERM_OPS
+
+COLUMNAR_MAGIC = b"PDBCOL1\n"
+_HEADER_LEN = struct.Struct("<I")
+_ALIGN = 8
+
+
+# --- JSON: список словарей, как раньше ---
+
+def _load_json(path, columns=None):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_json(path, rows, columns=None):
+    with atomic_open(path, "w") as f:
+        json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+# --- колоночный формат ---
+#
+# [magic][длина заголовка: uint32][заголовок JSON][секции столбцов]
+# int  — массив int64;
+# bool — битовая карта (бит i — строка i);
+# str  — словарь уникальных строк (JSON) + массив кодов uint32.
+# Смещения секций в заголовке отсчитываются от конца заголовка,
+# поэтому отдельный столбец читается без разбора остальных.
+# Секции выровнены по 8 байт: их можно читать через mmap как массивы.
+# После секций столбцов — статистика блоков по block_rows строк (JSON на столбец,
+# поле "stats" заголовка столбца): по ней чтение пропускает блоки целиком.
+
+def _pack_bits(values):
+    out = bytearray((len(values) + 7) // 8)
+    for i, v in enumerate(values):
+        if v:
+            out[i >> 3] |= 1 << (i & 7)
+    return bytes(out)
+
+
+def _unpack_bits(data, count):
+    return [bool(data[i >> 3] >> (i & 7) & 1) for i in range(count)]
+
+
+def _encode_column(values, type_name):
+    """Возвращает (секция, доп. поля заголовка) для одного столбца."""
+    if type_name == "int":
+        try:
+            return array("q", values).tobytes(), {}
+        except (OverflowError, TypeError) as e:
+            raise ValueError(f"Значение не помещается в int64: {e}") from e
+    if type_name == "bool":
+        return _pack_bits(values), {}
+    if type_name == "str":
+        codes_by_value = {}
+        codes = array("I", [codes_by_value.setdefault(v, len(codes_by_value)) for v in values])
+        dictionary = json.dumps(list(codes_by_value), ensure_ascii=False).encode("utf-8")
+        return dictionary + codes.tobytes(), {"dict_length": len(dictionary)}
+    raise ValueError(f"Неподдерживаемый тип столбца: {type_name}")
+
+
+def _decode_column(section, meta, count, swap):
+    type_name = meta["type"]
+    if type_name == "int":
+        values = array("q")
+        values.frombytes(section)
+        if swap:
+            values.byteswap()
+        return values.tolist()
+    if type_name == "bool":
+        return _unpack_bits(section, count)
+    if type_name == "str":
+        dict_length = meta["dict_length"]
+        dictionary = json.loads(bytes(section[:dict_length]).rstrip(b"\0").decode("utf-8"))
+        codes = array("I")
+        codes.frombytes(section[dict_length:])
+        if swap:
+            codes.byteswap()
+        return [dictionary[c] for c in codes]
+    raise ValueError(f"Неподдерживаемый тип столбца: {type_name}")
+
+
+def _padding(size):
+    return b"\0" * (-size % _ALIGN)
+
+
+def _block_stats(values, type_name, block_rows):
+    """
+    Статистика блоков столбца (zonemaps): int и bool — [min, max]; str — диапазон
+    кодов словаря "codes" (коды выдаются по первому появлению значения, поэтому
+    у значений, идущих подряд, он узкий) и фильтр Блума, если диапазон неточен —
+    в нём есть коды, которых в блоке нет.
+    """
+    starts = range(0, len(values), block_rows)
+    if type_name != "str":
+        return [zonemaps.column_stat(values[start:start + block_rows], type_name) for start in starts]
+    codes_by_value = {}
+    codes = [codes_by_value.setdefault(v, len(codes_by_value)) for v in values]
+    blocks = []
+    for start in starts:
+        part = codes[start:start + block_rows]
+        low, high = min(part), max(part)
+        stat = {}
+        if high - low + 1 > len(set(part)):
+            stat = zonemaps.column_stat(values[start:start + block_rows], type_name) or {}
+        stat["codes"] = [low, high]
+        blocks.append(stat)
+    return blocks
+
+
+def write_columnar(path, rows, columns, block_rows=BLOCK_ROWS):
+    """Записывает строки по столбцам согласно схеме [(name, type), ...] со статистикой блоков."""
+    sections = []
+    col_meta = []
+    stats = []
+    offset = 0
+    for name, type_name in columns:
+        values = [row.get(name) for row in rows]
+        section, extra = _encode_column(values, type_name)
+        # словарь строк идёт перед кодами: выравниваем начало кодов
+        if "dict_length" in extra:
+            pad = _padding(extra["dict_length"])
+            extra["dict_length"] += len(pad)
+            section = section[:extra["dict_length"] - len(pad)] + pad + section[extra["dict_length"] - len(pad):]
+        col_meta.append({"name": name, "type": type_name, "offset": offset, "length": len(section), **extra})
+        section += _padding(len(section))
+        sections.append(section)
+        offset += len(section)
+        stats.append(json.dumps(_block_stats(values, type_name, block_rows), ensure_ascii=False).encode("utf-8"))
+    for meta, section in zip(col_meta, stats):
+        meta["stats"] = [offset, len(section)]
+        section += _padding(len(section))
+        sections.append(section)
+        offset += len(section)
+    header = json.dumps(
+        {"rows": len(rows), "byteorder": sys.byteorder, "block_rows": block_rows, "columns": col_meta},
+        ensure_ascii=False,
+    ).encode("utf-8")
+    header += b" " * (-(len(COLUMNAR_MAGIC) + _HEADER_LEN.size + len(header)) % _ALIGN)
+    with atomic_open(path, "wb") as f:
+        f.write(COLUMNAR_MAGIC)
+        f.write(_HEADER_LEN.pack(len(header)))
+        f.write(header)
+        for section in sections:
+            f.write(section)
+
+
+def read_columnar_header(f):
+    """Читает заголовок; возвращает (заголовок, смещение начала секций)."""
+    f.seek(0)
+    if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("Повреждённый файл данных: неизвестный формат.")
+    (length,) = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+    header = json.loads(f.read(length).decode("utf-8"))
+    return header, len(COLUMNAR_MAGIC) + _HEADER_LEN.size + length
+
+
+def read_columnar_columns(path, names=None):
+    """Лениво декодирует только запрошенные столбцы: {имя: [значения]}."""
+    with open(path, "rb") as f:
+        header, base = read_columnar_header(f)
+        swap = header.get("byteorder", sys.byteorder) != sys.byteorder
+        count = header["rows"]
+        out = {}
+        for meta in header["columns"]:
+            if names is not None and meta["name"] not in names:
+                continue
+            f.seek(base + meta["offset"])
+            out[meta["name"]] = _decode_column(f.read(meta["length"]), meta, count, swap)
+        return out
+
+
+def _load_columnar(path, columns=None):
+    data = read_columnar_columns(path)
+    names = list(data)
+    return [dict(zip(names, values)) for values in zip(*data.values())]
+
+
+def _save_columnar(path, rows, columns):
+    if not columns:
+        raise ValueError("Для колоночного формата нужна схема таблицы.")
+    write_columnar(path, rows, columns)
+
+
+class ColumnarReader:
+    """
+    Чтение колоночного файла через mmap: значения декодируются по одному
+    по мере обращения, в памяти держатся только словари строковых столбцов.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self.header, self._base = read_columnar_header(self._file)
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self.count = self.header["rows"]
+        self._meta = {m["name"]: m for m in self.header["columns"]}
+        self._views = []
+        self._columns = {}
+        self._dicts = {}
+        self._accessors = {}
+        self._stats = {}
+        self._codes = {}
+        # при чужом порядке байт типизированный доступ через cast невозможен
+        self.native = self.header.get("byteorder", sys.byteorder) == sys.byteorder
+
+    def close(self):
+        self._columns.clear()
+        self._accessors.clear()
+        for view in reversed(self._views):
+            view.release()
+        self._views.clear()
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _view(self, start, length, fmt=None):
+        view = memoryview(self._mm)
+        self._views.append(view)
+        view = view[start:start + length]
+        self._views.append(view)
+        if fmt is not None:
+            view = view.cast(fmt)
+            self._views.append(view)
+        return view
+
+    def dictionary(self, name):
+        """Словарь значений строкового столбца (список, индекс — код)."""
+        if name not in self._dicts:
+            meta = self._meta[name]
+            start = self._base + meta["offset"]
+            raw = self._mm[start:start + meta["dict_length"]].rstrip(b"\0")
+            self._dicts[name] = json.loads(raw.decode("utf-8"))
+        return self._dicts[name]
+
+    def raw(self, name):
+        """
+        «Сырые» значения столбца без копирования: int — int64,
+        str — коды словаря, bool — байты битовой карты.
+        """
+        if name not in self._columns:
+            meta = self._meta[name]
+            start = self._base + meta["offset"]
+            if meta["type"] == "int":
+                col = self._view(start, meta["length"], "q")
+            elif meta["type"] == "str":
+                skip = meta["dict_length"]
+                col = self._view(start + skip, meta["length"] - skip, "I")
+            else:
+                col = self._view(start, meta["length"])
+            self._columns[name] = col
+        return self._columns[name]
+
+    def accessor(self, name):
+        """Функция i -> значение столбца name в строке i."""
+        get = self._accessors.get(name)
+        if get is None:
+            meta = self._meta[name]
+            col = self.raw(name)
+            if meta["type"] == "bool":
+                def get(i):
+                    return bool(col[i >> 3] >> (i & 7) & 1)
+            elif meta["type"] == "str":
+                dictionary = self.dictionary(name)
+
+                def get(i):
+                    return dictionary[col[i]]
+            else:
+                get = col.__getitem__
+            self._accessors[name] = get
+        return get
+
+    def value(self, name, i):
+        return self.accessor(name)(i)
+
+    def decoder(self, names=None):
+        """Функция i -> строка i; names — декодировать только эти столбцы."""
+        getters = [(name, self.accessor(name)) for name in (names or self._meta)]
+        return lambda i: {name: get(i) for name, get in getters}
+
+    def row(self, i, names=None):
+        return self.decoder(names)(i)
+
+    def block_stats(self, name):
+        """Статистика блоков столбца (zonemaps, после load) или None — файл записан без неё."""
+        if name not in self._stats:
+            meta = self._meta[name]
+            span = meta.get("stats")
+            stats = None
+            if span is not None:
+                start = self._base + span[0]
+                raw = json.loads(self._mm[start:start + span[1]].decode("utf-8"))
+                stats = [zonemaps.load(stat, meta["type"]) for stat in raw]
+            self._stats[name] = stats
+        return self._stats[name]
+
+    def find(self, id_col, rid):
+        """Позиция строки по ID (ID записаны по возрастанию) или None."""
+        ids = self.raw(id_col)
+        pos = bisect_left(ids, rid)
+        if pos < self.count and ids[pos] == rid:
+            return pos
+        return None
+
+    def _check(self, name, op, value):
+        """
+        Проверка простого условия по сырым данным строки i: функция,
+        None (проверить нельзя или подходят все строки) или False (не подходит ни одна).
+        """
+        meta = self._meta.get(name)
+        if meta is None:
+            return None
+        col = self.raw(name)
+        test = TERM_OPS[op]
+        if meta["type"] == "str":
+            codes = self._matching_codes(name, op, value)
+            if not codes:
+                return False
+            if len(codes) == len(self.dictionary(name)):
+                return None
+            if len(codes) == 1:
+                code = next(iter(codes))
+                return lambda i: col[i] == code
+            return lambda i: col[i] in codes
+        if meta["type"] == "bool":
+            return lambda i: test(bool(col[i >> 3] >> (i & 7) & 1), value)
+        if op == "=":
+            return lambda i: col[i] == value
+        return lambda i: test(col[i], value)
+
+    def _matching_codes(self, name, op, value):
+        # условие проверяется один раз на каждое значение словаря, строки сравниваются по кодам
+        key = (name, op, value)
+        if key not in self._codes:
+            test = TERM_OPS[op]
+            self._codes[key] = {code for code, s in enumerate(self.dictionary(name)) if test(s, value)}
+        return self._codes[key]
+
+    def _block_test(self, name, op, value):
+        """Функция «номер блока -> могут ли в нём быть строки под условие» или None (статистики нет)."""
+        stats = self.block_stats(name)
+        if not stats:
+            return None
+        type_name = self._meta[name]["type"]
+        if type_name != "str":
+            return lambda block: zonemaps.may_match(stats[block], type_name, op, value)
+        codes = sorted(self._matching_codes(name, op, value))
+
+        def test(block):
+            stat = stats[block]
+            low, high = stat["codes"]
+            pos = bisect_left(codes, low)
+            return pos < len(codes) and codes[pos] <= high and zonemaps.may_match(stat, type_name, op, value)
+        return test
+
+    def _skip_blocks(self, candidates, terms, id_col):
+        """Позиции диапазона candidates без блоков, в которых по статистике нет подходящих строк."""
+        size = self.header.get("block_rows")
+        if not size or not candidates:
+            return candidates
+        tests = [self._block_test(name, op, value) for name, op, value in terms if name != id_col and name in self._meta]
+        tests = [test for test in tests if test is not None]
+        if not tests:
+            return candidates
+        first, last = candidates.start // size, (candidates.stop - 1) // size
+        spans = []
+        skipped = 0
+        for block in range(first, last + 1):
+            if not all(test(block) for test in tests):
+                skipped += 1
+                continue
+            start, end = max(candidates.start, block * size), min(candidates.stop, (block + 1) * size)
+            if spans and spans[-1][1] == start:
+                spans[-1][1] = end
+            else:
+                spans.append([start, end])
+        metrics.count("blocks_skipped", skipped)
+        if spans == [[candidates.start, candidates.stop]]:
+            return candidates
+        return chain.from_iterable(range(start, end) for start, end in spans)
+
+    def _id_positions(self, id_col, terms):
+        """Позиции-кандидаты по условиям на ID (ID записаны по возрастанию)."""
+        ids = self.raw(id_col)
+        start, end = 0, self.count
+        for name, op, value in terms:
+            if name != id_col:
+                continue
+            if op == "=":
+                pos = self.find(id_col, value)
+                return [] if pos is None else [pos]
+            if op == "in":
+                return sorted(p for p in (self.find(id_col, v) for v in value) if p is not None)
+            if op == ">":
+                start = max(start, bisect_right(ids, value))
+            elif op == ">=":
+                start = max(start, bisect_left(ids, value))
+            elif op == "<":
+                end = min(end, bisect_left(ids, value))
+            elif op == "<=":
+                end = min(end, bisect_right(ids, value))
+        return range(start, end)
+
+    def positions(self, terms=(), id_col=None):
+        """
+        Номера строк, подходящих под простые условия WHERE [(столбец, оп, значение)]
+        (генератор). Это предварительный отбор: остальную часть условия
+        проверяет предикат на декодированной строке.
+        """
+        candidates = self._id_positions(id_col, terms) if id_col in self._meta else range(self.count)
+        if isinstance(candidates, range):
+            candidates = self._skip_blocks(candidates, terms, id_col)
+        for name, op, value in terms:
+            if name == id_col:
+                continue
+            check = self._check(name, op, value)
+            if check is False:
+                return
+            if check is not None:
+                candidates = filter(check, candidates)
+        yield from candidates
+
+
+def scan_columnar(path, where=None, overlay=None, id_col=None, names=None):
+    """
+    Построчно отдаёт строки колоночного файла, подходящие под WHERE (Predicate или None).
+    path — путь или уже открытый ColumnarReader (он закрывается по окончании).
+    overlay — изменения из журнала: {"changes": {ID: {...}}, "deleted": {ID}, "inserted": [...]}.
+    names — столбцы, которые нужны вызывающему: остальные не декодируются
+    (строки из журнала отдаются целиком).
+    """
+    reader = path if isinstance(path, ColumnarReader) else None
+    if where is not None and where.const is False:
+        if reader is not None:
+            reader.close()
+        return
+    matches = (lambda row: True) if where is None else where
+    terms = () if where is None else where.terms
+    overlay = overlay or {"changes": {}, "deleted": set(), "inserted": []}
+    changes, deleted = overlay["changes"], overlay["deleted"]
+    inserted = overlay["inserted"]
+    with reader or ColumnarReader(path) as reader:
+        path = reader.path
+        if names is not None:
+            wanted = set(names) | set(where.columns if where is not None else ()) | {id_col}
+            names = [name for name in reader._meta if name in wanted]
+        decode = reader.decoder(names) if reader.native else None
+        if reader.native and inserted:
+            # вставки, уже попавшие в основной файл (журнал пережил сохранение)
+            inserted = []
+            for row in overlay["inserted"]:
+                if reader.find(id_col, row.get(id_col)) is None:
+                    inserted.append(row)
+                else:
+                    changes[row.get(id_col)] = row
+        if not reader.native:
+            base_rows = (row for row in _load_columnar(path) if row.get(id_col) not in deleted)
+            for row in base_rows:
+                row.update(changes.get(row.get(id_col), {}))
+                if matches(row):
+                    yield row
+        else:
+            # строки, изменённые журналом, проверяются целиком
+            changed_rows = []
+            for rid, changed in sorted(changes.items()):
+                pos = reader.find(id_col, rid) if rid not in deleted else None
+                if pos is None:
+                    continue
+                row = decode(pos)
+                row.update(changed)
+                if matches(row):
+                    changed_rows.append(row)
+            positions = metrics.counted(reader.positions(terms, id_col), "rows_scanned")
+            untouched = (
+                row for row in map(decode, positions)
+                if row.get(id_col) not in changes and row.get(id_col) not in deleted and matches(row)
+            )
+            yield from merge(untouched, changed_rows, key=itemgetter(id_col))
+    for row in inserted:
+        if matches(row):
+            yield row
+
+
+# имя формата -> расширение файла, загрузка, сохранение
+BACKENDS = {
+    "json": {"suffix": ".json", "load": _load_json, "save": _save_json},
+    "columnar": {"suffix": ".col", "load": _load_columnar, "save": _save_columnar},
+}
+
+
+def get_backend(storage):
+    backend = BACKENDS.get(storage)
+    if backend is None:
+        raise ValueError(f"Неизвестный формат хранения: {storage}. Доступны: {', '.join(sorted(BACKENDS))}")
+    return backend
+
+
+def remove_other_files(base_path, keep_suffix):
+    """Удаляет файлы таблицы в других форматах (после конвертации)."""
+    for backend in BACKENDS.values():
+        if backend["suffix"] != keep_suffix and os.path.exists(base_path + backend["suffix"]):
+            os.remove(base_path + backend["suffix"])
@@ -1,7 +1,49 @@
+import csv
 import json
 import os
+import shutil
+from contextlib import ExitStack
+from functools import partial
+from heapq import merge
+from itertools import chain, pairwise
+from operator import itemgetter
+
+from .constants import (
+    BLOOM_SUFFIX,
+    DATA_DIR,
+    DEFAULT_STORAGE,
+    ID_COL,
+    INDEX_SUFFIX,
+    META_FILE,
+    SEGMENT_SUFFIX,
+    TMP_SUFFIX,
+    TXN_SUFFIX,
+    WAL_SUFFIX,
+)
+from . import metrics, segments, zonemaps
+from .durability import after_append, atomic_open
+from .locks import meta_lock, table_lock
+from .storage import BACKENDS, ColumnarReader, get_backend, remove_other_files, scan_columnar
+
+# корень базы: каталог с файлом метаданных и data/ (по умолчанию — текущий)
+_root = {"path": "."}
+
+
+def set_root(path):
+    _root["path"] = path
+
+
+def get_root():
+    return _root["path"]
+
+
+def meta_path():
+    return os.path.join(_root["path"], META_FILE)
+
+
+def _data_dir():
+    return os.path.join(_root["path"], DATA_DIR)
 
-from .constants import DATA_DIR
 
 def load_metadata(filepath):
     """Читает JSON с метаданными. Если файла нет — возвращает {"tables": {}}."""
@@ -10,6 +52,7 @@ def load_metadata(filepath):
     try:
         with open(filepath, "r", encoding="utf-8") as f:
             data = json.load(f)
+            metrics.count("bytes_read", f.tell())
         if not isinstance(data, dict) or "tables" not in data or not isinstance(data["tables"], dict):
             return {"tables": {}}
         return data
@@ -18,33 +61,750 @@ def load_metadata(filepath):
 
 
 def save_metadata(filepath, data):
-    """Сохраняет словарь метаданных в JSON с отступами."""
-    with open(filepath, "w", encoding="utf-8") as f:
+    """Сохраняет словарь метаданных в JSON с отступами (через временный файл и rename)."""
+    with atomic_open(filepath, "w") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+        metrics.count("bytes_written", f.tell())
 
 
-def _ensure_data_dir():
-    os.makedirs(DATA_DIR, exist_ok=True)
+def update_table_meta(filepath, metadata, table_name, fields):
+    """
+    Записывает поля таблицы (счётчики) в метаданные: под блокировкой метаданных
+    файл перечитывается, чтобы не затереть изменения других процессов.
+    Таблицу, которой в файле ещё нет (отложенный DDL), записывает вместе со всеми метаданными.
+    """
+    metadata["tables"][table_name].update(fields)
+    with meta_lock():
+        current = load_metadata(filepath)
+        table_meta = current["tables"].get(table_name)
+        if table_meta is None:
+            save_metadata(filepath, metadata)
+            return
+        table_meta.update(fields)
+        save_metadata(filepath, current)
 
 
-def _table_path(table_name):
-    filename = f"{table_name}.json"
-    return os.path.join(DATA_DIR, filename)
+def _ensure_data_dir():
+    os.makedirs(_data_dir(), exist_ok=True)
 
 
-def load_table_data(table_name):
-    """Загружает список записей таблицы из data/<table>.json. Если файла нет — []."""
+def table_lock_path(table_name):
+    """Путь, по которому берётся блокировка таблицы (файл <путь>.lock)."""
     _ensure_data_dir()
-    path = _table_path(table_name)
+    return os.path.join(_data_dir(), table_name)
+
+
+def _table_path(table_name, storage=DEFAULT_STORAGE):
+    filename = f"{table_name}{get_backend(storage)['suffix']}"
+    return os.path.join(_data_dir(), filename)
+
+
+def _existing_table_path(table_name, storage=DEFAULT_STORAGE):
+    """
+    Путь к основному файлу таблицы в заданном формате; если его нет (например,
+    конвертация прервана) — к файлу в любом другом формате. Возвращает (путь, формат).
+    """
+    path = _table_path(table_name, storage)
+    if os.path.exists(path):
+        return path, storage
+    for other in BACKENDS:
+        other_path = _table_path(table_name, other)
+        if os.path.exists(other_path):
+            return other_path, other
+    return path, storage
+
+
+def _wal_path(table_name):
+    filename = f"{table_name}{WAL_SUFFIX}"
+    return os.path.join(_data_dir(), filename)
+
+
+def _index_path(table_name):
+    filename = f"{table_name}{INDEX_SUFFIX}"
+    return os.path.join(_data_dir(), filename)
+
+
+def _segment_dir(table_name):
+    return os.path.join(_data_dir(), f"{table_name}{SEGMENT_SUFFIX}")
+
+
+def _segment_files(table_name, storage=DEFAULT_STORAGE):
+    """
+    Файлы секций таблицы по возрастанию номера: {номер: (путь, формат)}.
+    Секция берётся в заданном формате, а если его нет (конвертация прервана) —
+    в любом другом: старый и новый файлы секции содержат одни и те же строки.
+    """
+    directory = _segment_dir(table_name)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return {}
+    found = {}
+    for name in names:
+        for fmt, backend in BACKENDS.items():
+            key = segments.parse_name(name, backend["suffix"])
+            if key is not None and (key not in found or fmt == storage):
+                found[key] = (os.path.join(directory, name), fmt)
+    return dict(sorted(found.items()))
+
+
+def _base_stamp(table_name):
+    """
+    Отпечаток основного файла таблицы (размер и mtime) или None. У секционированной
+    таблицы — отпечаток каталога секций: его mtime меняет каждая подмена файла секции.
+    """
+    for path in (_segment_dir(table_name), _existing_table_path(table_name)[0]):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        return [st.st_size, st.st_mtime_ns]
+    return None
+
+
+def table_stamp(table_name):
+    """Отпечаток файлов таблицы (основной файл и журнал) для проверки кэша."""
+    try:
+        st = os.stat(_wal_path(table_name))
+        wal = [st.st_size, st.st_mtime_ns]
+    except FileNotFoundError:
+        wal = None
+    return [_base_stamp(table_name), wal]
+
+
+def stored_row_count(table_name, table_meta):
+    """
+    Число строк без чтения основного файла: счётчик из метаданных,
+    записанный при последнем сохранении таблицы (если файл с тех пор не менялся),
+    плюс вставки и минус удаления из журнала. None — счётчик неактуален.
+    """
+    stamp = table_meta.get("row_count_stamp")
+    if stamp is None or _base_stamp(table_name) != stamp:
+        return None
+    count = table_meta.get("row_count", 0)
+    for record in _wal_records(_wal_path(table_name)):
+        if record.get("op") == "insert":
+            count += 1
+        elif record.get("op") == "delete":
+            count -= len(record.get("ids", []))
+    return count
+
+
+def _wal_records(path):
+    """Записи журнала по порядку; обрывается на недописанной строке."""
     if not os.path.exists(path):
-        return []
+        return
     with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # недописанная последняя строка после аварийного завершения
+                return
+
+
+def read_wal_tail(table_name, offset, end):
+    """
+    Записи журнала в байтах [offset, end) — дописанные после offset другим процессом.
+    None, если там недописанная строка (журнал нужно перечитать целиком).
+    """
+    with open(_wal_path(table_name), "rb") as f:
+        f.seek(offset)
+        data = f.read(end - offset)
+    metrics.count("bytes_read", len(data))
+    if not data.endswith(b"\n"):
+        return None
+    try:
+        return [json.loads(line) for line in data.decode("utf-8").splitlines() if line.strip()]
+    except ValueError:
+        return None
 
 
-def save_table_data(table_name, data):
-    """Сохраняет список записей таблицы в data/<table>.json."""
+def _replay_wal(rows, path):
+    """
+    Применяет записи журнала (insert/update/delete) к списку строк.
+    Возвращает (строки, наибольший ID, встреченный в журнале).
+    """
+    last_id = 0
+    if not os.path.exists(path):
+        return rows, last_id
+    by_id = {r.get(ID_COL): r for r in rows}
+    deleted = set()
+    for rec in _wal_records(path):
+        op = rec.get("op")
+        if op == "insert":
+            row = rec["row"]
+            # повторное применение (журнал пережил сохранение базы) не дублирует строку
+            existing = by_id.get(row.get(ID_COL))
+            if existing is not None:
+                existing.update(row)
+                continue
+            rows.append(row)
+            by_id[row.get(ID_COL)] = row
+            last_id = max(last_id, row.get(ID_COL, 0))
+        elif op == "update":
+            for rid in rec["ids"]:
+                row = by_id.get(rid)
+                if row is not None:
+                    row.update(rec["set"])
+        elif op == "delete":
+            for rid in rec["ids"]:
+                row = by_id.pop(rid, None)
+                if row is not None:
+                    deleted.add(id(row))
+                last_id = max(last_id, rid)
+    if deleted:
+        rows = [r for r in rows if id(r) not in deleted]
+    return rows, last_id
+
+
+def _wal_overlay(path):
+    """
+    Изменения из журнала без базовых строк: {"changes": {ID: {...}},
+    "deleted": {ID, ...}, "inserted": [строки]} — для чтения без полной загрузки.
+    """
+    changes = {}
+    deleted = set()
+    inserted = {}
+    for rec in _wal_records(path):
+        op = rec.get("op")
+        if op == "insert":
+            row = rec["row"]
+            inserted.setdefault(row.get(ID_COL), {}).update(row)
+        elif op == "update":
+            for rid in rec["ids"]:
+                target = inserted[rid] if rid in inserted else changes.setdefault(rid, {})
+                target.update(rec["set"])
+        elif op == "delete":
+            for rid in rec["ids"]:
+                if inserted.pop(rid, None) is None:
+                    deleted.add(rid)
+                    changes.pop(rid, None)
+    return {"changes": changes, "deleted": deleted, "inserted": list(inserted.values())}
+
+
+def load_table_state(table_name, storage=DEFAULT_STORAGE, columns=None):
+    """
+    Загружает записи таблицы из основного файла (data/<table>.json или .col)
+    или из её секций, применяет журнал data/<table>.wal и возвращает
+    (строки, наибольший ID из журнала) — он нужен счётчику ID.
+    """
     _ensure_data_dir()
-    path = _table_path(table_name)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    segment_files = _segment_files(table_name, storage)
+    if segment_files:
+        paths = [path for path, _ in segment_files.values()]
+    else:
+        path, storage = _existing_table_path(table_name, storage)
+        paths = [path] if os.path.exists(path) else []
+        segment_files = {0: (path, storage)} if paths else {}
+    if metrics.enabled():
+        metrics.count("bytes_read", sum(map(_file_size, paths)) + _file_size(_wal_path(table_name)))
+    rows = []
+    for path, fmt in segment_files.values():
+        rows += get_backend(fmt)["load"](path, columns)
+    if len(segment_files) > 1 and any(a[ID_COL] > b[ID_COL] for a, b in pairwise(rows)):
+        # секции по столбцу: строки таблицы в памяти идут в порядке ID
+        rows.sort(key=itemgetter(ID_COL))
+    return _replay_wal(rows, _wal_path(table_name))
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def load_table_data(table_name, storage=DEFAULT_STORAGE, columns=None):
+    """Загружает записи таблицы и применяет журнал data/<table>.wal."""
+    rows, _ = load_table_state(table_name, storage, columns)
+    return rows
+
+
+def save_table_data(table_name, data, storage=DEFAULT_STORAGE, columns=None, layout=None, records=()):
+    """
+    Сохраняет записи таблицы в заданном формате (columns — схема, нужна колоночному
+    формату), удаляет файлы в других форматах и очищает журнал. layout — раскладка
+    секций (segments.py): тогда переписываются только изменённые секции, а функция
+    возвращает новый манифест секций; records — изменения, ещё не попавшие в журнал.
+    None — таблица хранится одним файлом и записывается целиком.
+    """
+    _ensure_data_dir()
+    files = None
+    if layout is not None:
+        files = _save_segments(table_name, data, storage, columns, layout, records)
+    else:
+        path = _table_path(table_name, storage)
+        with metrics.phase("serialize"):
+            get_backend(storage)["save"](path, data, columns)
+        if metrics.enabled():
+            metrics.count("bytes_written", _file_size(path))
+        remove_other_files(os.path.join(_data_dir(), table_name), get_backend(storage)["suffix"])
+        if os.path.isdir(_segment_dir(table_name)):
+            shutil.rmtree(_segment_dir(table_name))
+    wal = _wal_path(table_name)
+    if os.path.exists(wal):
+        os.remove(wal)
+    return files
+
+
+def _stored_segments(table_name, layout):
+    """Манифест секций из файла метаданных: таблицу мог сохранить другой процесс."""
+    table_meta = load_metadata(meta_path())["tables"].get(table_name) or {}
+    return (table_meta.get("segments") or layout).get("files", {})
+
+
+def _dirty_segments(table_name, layout, groups, storage, records, stored):
+    """
+    Секции, которые нужно переписать: затронутые журналом (и records), с другим
+    числом строк, чем в манифесте stored (удаления в секциях по столбцу), без файла
+    или с файлом в другом формате.
+    """
+    dirty, updated = set(), set()
+    for rec in chain(_wal_records(_wal_path(table_name)), records):
+        if rec.get("op") == "insert":
+            dirty.add(segments.row_key(layout, rec["row"]))
+        elif segments.by_id(layout):
+            dirty.update(segments.value_key(layout, rid) for rid in rec["ids"])
+        elif rec.get("op") == "update":
+            updated.update(rec["ids"])
+    if updated:
+        dirty.update(key for key, rows in groups.items() if any(row[ID_COL] in updated for row in rows))
+    existing = _segment_files(table_name, storage)
+    for key, rows in groups.items():
+        entry = stored.get(str(key))
+        if entry is None or entry.get("rows") != len(rows) or existing.get(key, (None, None))[1] != storage:
+            dirty.add(key)
+    return dirty
+
+
+def _save_segments(table_name, data, storage, columns, layout, records):
+    """
+    Записывает изменённые секции (каждую атомарно) с их фильтрами Блума (<номер>.bloom)
+    и удаляет секции без строк и файлы секций в других форматах. Возвращает манифест
+    {номер: {"rows": n, "stats": статистика столбцов секции без фильтров Блума (zonemaps)}}.
+    """
+    directory = _segment_dir(table_name)
+    os.makedirs(directory, exist_ok=True)
+    backend = get_backend(storage)
+    groups = {}
+    for row in data:
+        groups.setdefault(segments.row_key(layout, row), []).append(row)
+    stored = _stored_segments(table_name, layout)
+    dirty = _dirty_segments(table_name, layout, groups, storage, records, stored)
+    with metrics.phase("serialize"):
+        for key in sorted(dirty & groups.keys()):
+            path = os.path.join(directory, segments.file_name(key, backend["suffix"]))
+            backend["save"](path, groups[key], columns)
+            if metrics.enabled():
+                metrics.count("bytes_written", _file_size(path))
+    for name in os.listdir(directory):
+        for fmt, other in BACKENDS.items():
+            key = segments.parse_name(name, other["suffix"])
+            if key is not None and (key not in groups or fmt != storage):
+                os.remove(os.path.join(directory, name))
+        key = segments.parse_name(name, BLOOM_SUFFIX)
+        if key is not None and key not in groups:
+            os.remove(os.path.join(directory, name))
+    # основной файл, оставшийся от таблицы до секционирования
+    remove_other_files(os.path.join(_data_dir(), table_name), None)
+    manifest = {}
+    for key, rows in sorted(groups.items()):
+        # статистика (и файл фильтров) нетронутой секции берётся из прежнего манифеста
+        stats = None if key in dirty else stored.get(str(key), {}).get("stats")
+        if stats is None:
+            stats, blooms = zonemaps.split_blooms(zonemaps.row_stats(rows, columns))
+            _save_segment_blooms(table_name, key, blooms)
+        manifest[str(key)] = {"rows": len(rows), "stats": stats}
+    return manifest
+
+
+def _bloom_path(table_name, key):
+    return os.path.join(_segment_dir(table_name), segments.file_name(key, BLOOM_SUFFIX))
+
+
+def _save_segment_blooms(table_name, key, blooms):
+    """Фильтры Блума секции {столбец: base64} — в файл рядом с секцией (размер растёт с числом значений)."""
+    path = _bloom_path(table_name, key)
+    if not blooms:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with atomic_open(path, "w") as f:
+        json.dump(blooms, f)
+    if metrics.enabled():
+        metrics.count("bytes_written", _file_size(path))
+
+
+def segment_blooms(table_name, key):
+    """Фильтры Блума секции или {}, если файла нет."""
+    path = _bloom_path(table_name, key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            blooms = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if metrics.enabled():
+        metrics.count("bytes_read", _file_size(path))
+    return blooms
+
+
+def append_wal(table_name, records, durability=None):
+    """Дописывает операции в журнал таблицы (по одной JSON-строке) и возвращает размер журнала."""
+    _ensure_data_dir()
+    path = _wal_path(table_name)
+    with metrics.phase("serialize"):
+        payload = _wal_payload(records)
+        with open(path, "a", encoding="utf-8") as f:
+            start = f.tell()
+            f.write(payload)
+            after_append(f, path, durability)
+            size = f.tell()
+    metrics.count("bytes_written", size - start)
+    return size
+
+
+def _wal_payload(records):
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+
+
+def _intent_path():
+    return f"{meta_path()}{TXN_SUFFIX}"
+
+
+def write_intent(records_by_table):
+    """
+    Файл намерения фиксации — до дозаписи журналов, под блокировками таблиц:
+    {таблица: {"base": отпечаток основного файла, "offset": размер журнала, "records": [...]}}.
+    """
+    intent = {}
+    for name, records in records_by_table.items():
+        wal = table_stamp(name)[1]
+        intent[name] = {"base": _base_stamp(name), "offset": wal[0] if wal else 0, "records": records}
+    with atomic_open(_intent_path(), "w") as f:
+        json.dump(intent, f, ensure_ascii=False)
+
+
+def remove_intent():
+    os.remove(_intent_path())
+
+
+def _missing_intent_tail(table_name, entry):
+    """
+    Недописанная часть записей намерения для журнала таблицы или None, если дописывать
+    нечего: записи уже в журнале или таблица с тех пор изменилась (свёрнута,
+    журнал дописан или переписан другими) — тогда намерение для неё устарело.
+    """
+    if _base_stamp(table_name) != entry["base"]:
+        return None
+    payload = _wal_payload(entry["records"]).encode("utf-8")
+    try:
+        with open(_wal_path(table_name), "rb") as f:
+            f.seek(entry["offset"])
+            written = f.read(len(payload) + 1)
+            size = os.fstat(f.fileno()).st_size
+    except FileNotFoundError:
+        written, size = b"", 0
+    if size < entry["offset"] or len(written) > len(payload) or not payload.startswith(written):
+        return None
+    # после обрезки оборванного хвоста в журнале остаются только целые строки
+    done = written.count(b"\n")
+    return entry["records"][done:] or None
+
+
+def _replay_intent():
+    """
+    Доприменяет незавершённую фиксацию нескольких таблиц: дописывает в журнал
+    только те записи, которых там ещё нет после сохранённого в намерении смещения.
+    """
+    path = _intent_path()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            intent = json.load(f)
+    except FileNotFoundError:
+        return None
+    replayed = []
+    with ExitStack() as stack:
+        # фиксирующий процесс держит блокировки таблиц, пока не удалит файл
+        for name in sorted(intent):
+            stack.enter_context(table_lock(name, exclusive=True))
+        if not os.path.exists(path):
+            return None
+        for name, entry in sorted(intent.items()):
+            records = _missing_intent_tail(name, entry)
+            if records:
+                append_wal(name, records)
+                replayed.append(name)
+        os.remove(path)
+    return replayed
+
+
+def save_index_data(table_name, data):
+    """Сохраняет индексы таблицы в data/<table>.idx с отпечатком основного файла."""
+    _ensure_data_dir()
+    payload = {"stamp": _base_stamp(table_name), "indexes": data}
+    with atomic_open(_index_path(table_name), "w") as f:
+        json.dump(payload, f, ensure_ascii=False)
+
+
+def load_index_data(table_name):
+    """
+    Загружает индексы таблицы, если они построены по текущему основному файлу
+    и журнал пуст. Иначе возвращает None — индексы нужно перестроить.
+    """
+    path = _index_path(table_name)
+    if not os.path.exists(path) or os.path.exists(_wal_path(table_name)):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+    except ValueError:
+        return None
+    if payload.get("stamp") != _base_stamp(table_name):
+        return None
+    return payload.get("indexes")
+
+
+def read_rows_file(path, column_names):
+    """
+    Читает строки для загрузки из CSV (с заголовком) или JSONL (объекты или массивы).
+    Возвращает списки значений в порядке column_names; столбец ID игнорируется.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            missing = [c for c in column_names if c not in (reader.fieldnames or [])]
+            if missing:
+                raise ValueError(f"В заголовке CSV нет столбцов: {', '.join(missing)}")
+            return [[rec[c] for c in column_names] for rec in reader]
+    if ext in (".jsonl", ".ndjson"):
+        out = []
+        with open(path, "r", encoding="utf-8") as f:
+            for num, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                rec = json.loads(line)
+                if isinstance(rec, dict):
+                    try:
+                        out.append([rec[c] for c in column_names])
+                    except KeyError as e:
+                        raise ValueError(f"строка {num}: нет столбца {e.args[0]}") from e
+                elif isinstance(rec, list):
+                    out.append(rec)
+                else:
+                    raise ValueError(f"строка {num}: ожидался объект или массив")
+        return out
+    raise ValueError(f"Неподдерживаемый формат файла: {path}. Используйте .csv или .jsonl")
+
+
+def segment_keys(table_name, layout, where=None, columns=None):
+    """
+    (секции после отсечения по WHERE, пропускаемые из них по статистике, всего секций) —
+    для explain.
+    """
+    keys = list(_segment_files(table_name))
+    chosen = segments.select(layout, where.terms if where is not None else (), keys)
+    overlay = _wal_overlay(_wal_path(table_name))
+    return chosen, _zone_skipped(table_name, layout, chosen, where, overlay, columns), len(keys)
+
+
+def scan_table(table_name, where=None, storage=DEFAULT_STORAGE, columns=None, names=None, layout=None):
+    """
+    Построчно отдаёт строки таблицы, подходящие под WHERE (Predicate или None).
+    Колоночные файлы читаются через mmap без загрузки таблицы целиком
+    (names — столбцы, которые нужно декодировать), остальные форматы —
+    обычной загрузкой с фильтрацией. У секционированной таблицы (layout)
+    читаются только секции, в которых могут быть подходящие строки.
+    """
+    # снимок под блокировкой чтения: основной файл заменяется атомарно, поэтому
+    # открытый файл и прочитанный журнал согласованы и после снятия блокировки
+    with table_lock(table_name):
+        segment_files = _segment_files(table_name, storage) if layout is not None else {}
+        if segment_files:
+            return _scan_segments(table_name, segment_files, where, layout, columns, names)
+        path, storage = _existing_table_path(table_name, storage)
+        if storage != "columnar" or not os.path.exists(path):
+            rows = load_table_data(table_name, storage, columns)
+            return RowStream(row for row in rows if where is None or where(row))
+        overlay = _wal_overlay(_wal_path(table_name))
+        reader = ColumnarReader(path)
+    return RowStream(scan_columnar(reader, where, overlay, ID_COL, names), [reader])
+
+
+def _zone_skipped(table_name, layout, keys, where, overlay, columns):
+    """
+    Секции из keys, в которых по статистике манифеста (min/max, фильтры Блума) нет
+    строк под WHERE. Статистика верна, пока секции не переписаны после записи манифеста
+    (отпечаток "stamp"); секции со строками, у которых журнал изменил столбцы условия,
+    читаются всё равно. Вставки из журнала отдаются и для пропущенных секций.
+    """
+    if where is None or not where.terms or not columns or layout.get("stamp") != _base_stamp(table_name):
+        return set()
+    changed = [rid for rid, fields in overlay["changes"].items() if not where.columns.isdisjoint(fields)]
+    if changed and not segments.by_id(layout):
+        return set()
+    kept = {segments.value_key(layout, rid) for rid in changed}
+    blooms = partial(segment_blooms, table_name)
+    return segments.excluded(layout, where.terms, set(keys) - kept, dict(columns), blooms)
+
+
+def _scan_segments(table_name, segment_files, where, layout, columns, names):
+    """
+    Потоки строк выбранных секций (вызывается под блокировкой чтения таблицы: колоночные
+    секции открываются, остальные читаются сразу). Вставки из журнала относятся
+    к своим секциям, поэтому каждая строка отдаётся один раз.
+    """
+    overlay = _wal_overlay(_wal_path(table_name))
+    inserted = {}
+    for row in overlay["inserted"]:
+        inserted.setdefault(segments.row_key(layout, row), []).append(row)
+    terms = where.terms if where is not None else ()
+    keys = segments.select(layout, terms, sorted(set(segment_files) | set(inserted)))
+    skipped = _zone_skipped(table_name, layout, keys, where, overlay, columns)
+    metrics.count("blocks_skipped", len(skipped))
+    streams, readers = [], []
+    try:
+        for key in keys:
+            part = {"changes": overlay["changes"], "deleted": overlay["deleted"], "inserted": inserted.get(key, [])}
+            path, fmt = segment_files.get(key, (None, None)) if key not in skipped else (None, None)
+            if fmt == "columnar":
+                readers.append(ColumnarReader(path))
+                streams.append(scan_columnar(readers[-1], where, part, ID_COL, names))
+            else:
+                rows = get_backend(fmt)["load"](path) if path is not None else []
+                streams.append(_overlay_rows(rows, where, part))
+    except BaseException:
+        for reader in readers:
+            reader.close()
+        raise
+    # секции по ID идут подряд в порядке ID, секции по столбцу сливаются по ID
+    rows = chain.from_iterable(streams) if segments.by_id(layout) else merge(*streams, key=itemgetter(ID_COL))
+    return RowStream(rows, readers)
+
+
+def _overlay_rows(rows, where, overlay):
+    """Строки секции, прочитанной целиком, с изменениями из журнала, подходящие под WHERE."""
+    changes, deleted = overlay["changes"], overlay["deleted"]
+    # вставки, уже попавшие в файл секции (журнал пережил сохранение), заменяют строку
+    extra = {row[ID_COL]: row for row in overlay["inserted"]}
+    metrics.count("rows_scanned", len(rows))
+    for row in rows:
+        rid = row.get(ID_COL)
+        if rid in deleted:
+            continue
+        if rid in extra:
+            row = extra.pop(rid)
+        elif rid in changes:
+            row.update(changes[rid])
+        if where is None or where(row):
+            yield row
+    for row in extra.values():
+        if where is None or where(row):
+            yield row
+
+
+class RowStream:
+    """
+    Поток строк scan_table с открытыми на момент снимка файлами (ColumnarReader).
+    Файлы закрываются, когда строки кончились, или close() — в том числе если
+    чтение не начиналось (explain, курсор без выборки, досрочная остановка по LIMIT).
+    """
+
+    def __init__(self, rows, readers=()):
+        self._rows = rows
+        self._readers = list(readers)
+
+    def wrap(self, fn):
+        """Оборачивает поток строк (например, замером времени); файлы остаются за RowStream."""
+        self._rows = fn(self._rows)
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._rows)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        close = getattr(self._rows, "close", None)
+        if close is not None:
+            close()
+        readers, self._readers = self._readers, []
+        for reader in readers:
+            reader.close()
+
+    def __del__(self):
+        self.close()
+
+
+def _repair_wal_tail(path):
+    """Обрезает недописанную последнюю строку журнала, чтобы новые записи не склеились с ней."""
+    with open(path, "rb+") as f:
+        data = f.read()
+        if not data or data.endswith(b"\n"):
+            return False
+        f.truncate(data.rfind(b"\n") + 1)
+    return True
+
+
+def _owner_table(name):
+    """Таблица, которой принадлежит файл или каталог секций data/<name>, или None."""
+    if name.endswith(TMP_SUFFIX):
+        name = name[: -len(TMP_SUFFIX)]
+    for suffix in (WAL_SUFFIX, INDEX_SUFFIX, SEGMENT_SUFFIX, *(b["suffix"] for b in BACKENDS.values())):
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[: -len(suffix)]
+    return None
+
+
+def _recover_table_files(table_name):
+    """Восстановление файлов одной таблицы; вызывается под её исключительной блокировкой."""
+    messages = []
+    wal = _wal_path(table_name)
+    if os.path.exists(wal) and _repair_wal_tail(wal):
+        messages.append(f"Журнал {os.path.basename(wal)}: отброшена недописанная запись.")
+    candidates = [wal, _index_path(table_name)] + [_table_path(table_name, fmt) for fmt in BACKENDS]
+    candidates = [f"{path}{TMP_SUFFIX}" for path in candidates]
+    directory = _segment_dir(table_name)
+    if os.path.isdir(directory):
+        candidates += [os.path.join(directory, n) for n in sorted(os.listdir(directory)) if n.endswith(TMP_SUFFIX)]
+    for path in candidates:
+        if os.path.exists(path):
+            os.remove(path)
+            messages.append(f"Удалён недописанный файл {os.path.basename(path)}.")
+    return messages
+
+
+def recover_data_files(meta_file):
+    """
+    Восстановление после аварийного завершения: удаляет недописанные временные
+    файлы (основные файлы при атомарной записи не повреждаются) и обрезает
+    оборванные хвосты журналов. Файлы таблицы трогаются только под её исключительной
+    блокировкой, а временный файл метаданных — под блокировкой метаданных: у живого
+    процесса, который сейчас пишет, недописанные файлы не отбираются (он держит
+    блокировку до их подмены). Возвращает список сообщений о выполненных действиях.
+    """
+    messages = []
+    with meta_lock():
+        path = f"{meta_file}{TMP_SUFFIX}"
+        if os.path.exists(path):
+            os.remove(path)
+            messages.append(f"Удалён недописанный файл {os.path.basename(path)}.")
+    data_dir = _data_dir()
+    if os.path.isdir(data_dir):
+        for table_name in sorted({_owner_table(name) for name in os.listdir(data_dir)} - {None}):
+            with table_lock(table_name, exclusive=True):
+                messages += _recover_table_files(table_name)
+    tables = _replay_intent()
+    if tables:
+        messages.append(f"Доприменена прерванная фиксация транзакции: {', '.join(tables)}.")
+    return messages
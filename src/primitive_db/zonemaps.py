@@ -0,0 +1,118 @@
+# Статистика блоков строк для пропуска при чтении: min/max (int, bool) и фильтры Блума (str)
+#
+# Статистика столбца в блоке:
+#   int, bool — [min, max] (None-значения не учитываются);
+#   str       — {"bloom": фильтр Блума по значениям в base64}; размер фильтра растёт
+#               с числом различных значений (_BITS_PER_VALUE бит на значение).
+# Блок пропускается, если хотя бы одно простое условие WHERE по статистике в нём не выполнится.
+import base64
+import zlib
+
+_BITS_PER_VALUE = 10  # ~1% ложных срабатываний при четырёх хешах
+_HASHES = 4
+_MIX = 0x9E3779B97F4A7C15
+
+
+def _positions(value, bits):
+    # двойное хеширование от crc32: номер бита не зависит от запуска (в отличие от hash())
+    h1 = zlib.crc32(value.encode("utf-8"))
+    h2 = ((h1 * _MIX) >> 32) | 1
+    return [(h1 + i * h2) % bits for i in range(_HASHES)]
+
+
+def bloom(values):
+    """Фильтр Блума по значениям (base64): _BITS_PER_VALUE бит на каждое различное значение."""
+    distinct = {v for v in values if v is not None}
+    data = bytearray(max(8, -(-len(distinct) * _BITS_PER_VALUE // 8)))
+    bits = len(data) * 8
+    crc32 = zlib.crc32
+    # то же, что _positions (_HASHES = 4), без вызова функции на значение:
+    # фильтр строится при каждой записи секции
+    for value in distinct:
+        h1 = crc32(value.encode("utf-8"))
+        h2 = ((h1 * _MIX) >> 32) | 1
+        for pos in (h1 % bits, (h1 + h2) % bits, (h1 + 2 * h2) % bits, (h1 + 3 * h2) % bits):
+            data[pos >> 3] |= 1 << (pos & 7)
+    return base64.b64encode(bytes(data)).decode("ascii")
+
+
+def bloom_contains(data, value):
+    """Может ли value быть среди значений фильтра data (bytes): False — точно нет."""
+    bits = len(data) * 8
+    return all(data[pos >> 3] >> (pos & 7) & 1 for pos in _positions(value, bits))
+
+
+def column_stat(values, type_name):
+    """Статистика значений столбца одного блока (формат — см. начало модуля) или None."""
+    present = [v for v in values if v is not None]
+    if not present:
+        return None
+    if type_name == "str":
+        return {"bloom": bloom(present)}
+    return [min(present), max(present)]
+
+
+def row_stats(rows, columns):
+    """Статистика строк блока по всем столбцам схемы: {столбец: статистика}."""
+    return {name: column_stat([row.get(name) for row in rows], type_name) for name, type_name in columns}
+
+
+def split_blooms(stats):
+    """
+    Статистика без фильтров Блума (у строковых столбцов остаётся {}) и сами фильтры
+    {столбец: base64}: у больших секций они хранятся в отдельном файле, а не в манифесте.
+    """
+    blooms = {name: stat["bloom"] for name, stat in stats.items() if isinstance(stat, dict) and "bloom" in stat}
+    return {name: {} if name in blooms else stat for name, stat in stats.items()}, blooms
+
+
+def bloom_terms(types, terms):
+    """Есть ли в terms условия, которые проверяются фильтром Блума (= и in по строковым столбцам)."""
+    return any(types.get(name) == "str" and op in ("=", "in") for name, op, _ in terms)
+
+
+def load(stat, type_name):
+    """Статистика из JSON в вид для проверки: фильтр Блума декодируется один раз."""
+    if type_name == "str" and stat and "bloom" in stat:
+        return {**stat, "bloom": base64.b64decode(stat["bloom"])}
+    return stat
+
+
+def may_match(stat, type_name, op, value):
+    """
+    Может ли в блоке со статистикой stat (после load) найтись строка под условие
+    (столбец, op, value). False — блок можно пропустить.
+    """
+    if stat is None:
+        return True
+    if type_name == "str":
+        data = stat.get("bloom")
+        if data is None:
+            return True
+        if op == "=":
+            return bloom_contains(data, value)
+        if op == "in":
+            return any(bloom_contains(data, v) for v in value)
+        return True
+    low, high = stat
+    if op == "=":
+        return low <= value <= high
+    if op == "in":
+        return any(low <= v <= high for v in value)
+    if op == "<":
+        return low < value
+    if op == "<=":
+        return low <= value
+    if op == ">":
+        return high > value
+    if op == ">=":
+        return high >= value
+    return True
+
+
+def excludes(stats, types, terms):
+    """Исключает ли статистика блока {столбец: статистика} все его строки под условия terms."""
+    for name, op, value in terms:
+        if name in stats and name in types and not may_match(load(stats[name], types[name]), types[name], op, value):
+            return True
+    return False